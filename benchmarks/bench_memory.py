@@ -0,0 +1,56 @@
+"""
+Память под историю в кэше: старое представление (object-колонки, словари to_dict('records'),
+суммы float в индексе) против компактного (pandas category, Record со __slots__, копейки в array).
+
+    python -m benchmarks.bench_memory --sizes 100000 1000000
+"""
+import sys
+import argparse
+import tracemalloc
+
+from benchmarks.synthetic import generate_frame
+from src.records import compact_frame, records_from_frame
+from src.search_index import SearchIndex
+
+MB = 1024 * 1024
+
+
+def traced(fn):
+    """Память (МБ), которую занимает результат fn после построения (временные объекты не в счет)"""
+    tracemalloc.start()
+    result = fn()
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, current / MB
+
+
+def legacy_frame(df):
+    return df.astype({"category": object, "note": object, "amount": "float64"})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--records", type=int, default=100_000, help="сколько записей превращать в объекты")
+    args = parser.parse_args()
+
+    print(f"{'записей':>12}{'df old':>10}{'df new':>10}{'records old':>13}{'records new':>13}{'amounts old':>13}{'amounts new':>13}")
+    for rows in args.sizes:
+        df = generate_frame(rows).fillna("")
+        old_df, new_df = legacy_frame(df), compact_frame(df)
+        part = min(rows, args.records)
+
+        results = [
+            old_df.memory_usage(deep=True).sum() / MB,
+            new_df.memory_usage(deep=True).sum() / MB,
+            traced(lambda: old_df.tail(part).to_dict('records'))[1],
+            traced(lambda: records_from_frame(new_df.tail(part)))[1],
+            # Только колонка сумм индекса: список float против array("q") копеек
+            traced(lambda: [float(a) for a in old_df['amount']])[1],
+            sys.getsizeof(SearchIndex.from_frame(new_df).amounts) / MB,
+        ]
+        print(f"{rows:>12,}" + "".join(f"{mb:>{w}.1f}" for mb, w in zip(results, (10, 10, 13, 13, 13, 13))) + "  (МБ)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Сравнение /search: старый проход str.contains по всей истории против индексов.
+
+    python -m benchmarks.bench_search --rows 100000 --queries 200
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+import statistics
+
+from benchmarks.synthetic import write_csv, CATEGORIES
+from src.cache import StorageCache
+from src.storage import FinanceStorage
+from src.sqlite_storage import SQLiteFinanceStorage, migrate
+
+QUERIES = ["такси", "еда", "кофе аэро", "прод", "бизнес", "маме", "нет такого"]
+
+
+def legacy_search(df, query):
+    """Поиск в том виде, в каком он был до индекса"""
+    query = query.lower()
+    mask = (df['category'].str.lower().str.contains(query)) | (df['note'].str.lower().str.contains(query))
+    return df[mask].tail(10).iloc[::-1].to_dict('records')
+
+
+def measure(fn, queries):
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "p50": statistics.median(timings),
+        "p99": timings[min(len(timings) - 1, int(len(timings) * 0.99))],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    queries = [rng.choice(QUERIES + [c.lower() for c in CATEGORIES]) for _ in range(args.queries)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "1_finance.csv")
+        df = write_csv(filename, args.rows)
+
+        storage = FinanceStorage(filename, cache=StorageCache())
+        start = time.perf_counter()
+        storage.search("прогрев")  # загрузка CSV + построение индекса
+        build_ms = (time.perf_counter() - start) * 1000
+
+        migrate(tmp, os.path.join(tmp, "finance.db"))
+        sqlite_storage = SQLiteFinanceStorage(os.path.join(tmp, "finance.db"), 1)
+
+        results = {
+            "legacy str.contains": measure(lambda q: legacy_search(df, q), queries),
+            "inverted index (csv)": measure(storage.search, queries),
+            "fts5 (sqlite)": measure(sqlite_storage.search, queries),
+        }
+
+    print(f"\nЗаписей: {args.rows}, запросов: {args.queries}")
+    print(f"Загрузка + построение индекса: {build_ms:.1f} ms (один раз на пользователя)")
+    print(f"{'метод':<24}{'p50, ms':>10}{'p99, ms':>10}")
+    for name, stats in results.items():
+        print(f"{name:<24}{stats['p50']:>10.2f}{stats['p99']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Бенчмарки горячих путей: методы хранилища, парсер, круговая диаграмма и полный цикл
+process_expense на синтетической истории одного пользователя (по умолчанию 1k / 100k / 1M записей).
+
+    python -m benchmarks.bench_suite                          # сравнить с benchmarks/baseline.json
+    python -m benchmarks.bench_suite --sizes 1000 100000      # только часть размеров
+    python -m benchmarks.bench_suite --save-baseline          # записать новый baseline
+
+Для каждой операции: p50/p90/p99 в ms и пиковая память одного вызова (tracemalloc).
+Регрессия - p50 медленнее базового больше чем в --tolerance раз (и больше чем на 1 ms);
+тогда код выхода 1, чтобы прогон можно было ставить перед деплоем.
+Baseline зависит от машины: сравнивать имеет смысл прогоны на одном и том же железе.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import tracemalloc
+from types import SimpleNamespace
+
+os.environ.setdefault("BOT_TOKEN", "123456:BENCH")
+
+from benchmarks.synthetic import write_csv, CATEGORIES, NOTES
+from src.cache import StorageCache
+from src.parser import parse_input
+from src.storage import FinanceStorage
+from src.visualizer import create_pie_chart
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+SIZES = [1_000, 100_000, 1_000_000]
+# Порог шума: разница меньше миллисекунды регрессией не считается
+NOISE_MS = 1.0
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+def measure(fn, repeats):
+    """Время repeats вызовов fn(i) и пиковая память отдельного (еще одного) вызова"""
+    timings = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        fn(i)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+
+    tracemalloc.start()
+    try:
+        fn(repeats)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "p50": percentile(timings, 0.5),
+        "p90": percentile(timings, 0.9),
+        "p99": percentile(timings, 0.99),
+        "peak_mb": peak / 1024 / 1024,
+    }
+
+
+def open_storage(backend, tmp, filename):
+    """Хранилище выбранного бэкенда с уже записанной историей из filename"""
+    if backend == "sqlite":
+        from src.sqlite_storage import SQLiteFinanceStorage, migrate
+        migrate(tmp, os.path.join(tmp, "finance.db"))
+        return SQLiteFinanceStorage(os.path.join(tmp, "finance.db"), 1)
+    if backend == "partitioned":
+        from src.partitioned_storage import PartitionedFinanceStorage, convert
+        convert(tmp)
+        return PartitionedFinanceStorage(filename, cache=StorageCache())
+    return FinanceStorage(filename, cache=StorageCache())
+
+
+def bot_round_trip(storage):
+    """process_expense из src/bot.py без сети: хранилище подменено, ответ никуда не уходит"""
+    import src.bot as bot_module
+
+    bot_module.get_user_storage = lambda user_id: storage
+    bot_module.bot.reply_to = lambda message, text, **kwargs: None
+
+    def run(i):
+        message = SimpleNamespace(text=f"{CATEGORIES[i % len(CATEGORIES)]} {100 + i} {NOTES[i % len(NOTES)]}".strip(),
+                                  chat=SimpleNamespace(id=1), from_user=SimpleNamespace(id=1))
+        bot_module.process_expense(message)
+    return run
+
+
+def run_size(rows, backend, repeats, cold_repeats):
+    rng = random.Random(rows)
+    queries = ["такси", "еда", "кофе аэро", "прод", "бизнес", "нет такого"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "1_finance.csv")
+        write_csv(filename, rows)
+        storage = open_storage(backend, tmp, filename)
+        now = time.localtime()
+        # Первое обращение грузит историю в кэш; его стоимость - отдельная строка "cold"
+        cold = {}
+        if backend != "sqlite":
+            cold["get_last_records (cold)"] = measure(
+                lambda i: FinanceStorage(filename).get_last_records(), cold_repeats)
+        storage.get_last_records()
+        storage.search("прогрев")
+        stats = storage.get_stats_by_month(now.tm_year, now.tm_mon)
+
+        results = {
+            "parse_input": measure(lambda i: parse_input(f"Такси {i + 1} в аэропорт"), repeats),
+            "add_expense": measure(lambda i: storage.add_expense(rng.choice(CATEGORIES), i + 1, "бенч"), repeats),
+            "get_budget_status": measure(lambda i: storage.get_budget_status(), repeats),
+            "get_stats_by_month": measure(lambda i: storage.get_stats_by_month(now.tm_year, now.tm_mon), repeats),
+            "get_last_records": measure(lambda i: storage.get_last_records(), repeats),
+            "search_records": measure(lambda i: storage.search_records(queries[i % len(queries)]), repeats),
+            "delete_last_expense": measure(lambda i: storage.delete_last_expense(), repeats),
+            "create_pie_chart": measure(lambda i: create_pie_chart(stats, "₽").close(), min(repeats, 20)),
+            "process_expense": measure(bot_round_trip(storage), repeats),
+        }
+        results.update(cold)
+        return results
+
+
+def compare(results, baseline, tolerance):
+    """Список регрессий (размер, операция, было, стало) по p50"""
+    regressions = []
+    for size, ops in results.items():
+        for name, stats in ops.items():
+            base = baseline.get(size, {}).get(name)
+            if base is None:
+                continue
+            if stats["p50"] > base["p50"] * tolerance and stats["p50"] - base["p50"] > NOISE_MS:
+                regressions.append((size, name, base["p50"], stats["p50"]))
+    return regressions
+
+
+def print_table(size, ops, baseline):
+    print(f"\n=== {int(size):,} записей ===")
+    print(f"{'операция':<26}{'p50, ms':>10}{'p90, ms':>10}{'p99, ms':>10}{'пик, MB':>10}{'база p50':>10}")
+    for name, s in ops.items():
+        base = baseline.get(size, {}).get(name)
+        base_text = f"{base['p50']:.2f}" if base else "-"
+        print(f"{name:<26}{s['p50']:>10.2f}{s['p90']:>10.2f}{s['p99']:>10.2f}{s['peak_mb']:>10.1f}{base_text:>10}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--backend", choices=["csv", "sqlite", "partitioned"], default="csv")
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--cold-repeats", type=int, default=3)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=1.5)
+    args = parser.parse_args(argv)
+
+    stored = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            stored = json.load(f)
+    baseline = stored.get("backends", {}).get(args.backend, {})
+
+    results = {}
+    for rows in args.sizes:
+        results[str(rows)] = run_size(rows, args.backend, args.repeats, args.cold_repeats)
+        print_table(str(rows), results[str(rows)], baseline)
+
+    if args.save_baseline:
+        stored.setdefault("backends", {}).setdefault(args.backend, {}).update(results)
+        stored["machine"] = {"python": platform.python_version(), "platform": platform.platform(),
+                             "processor": platform.processor() or platform.machine()}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(stored, f, ensure_ascii=False, indent=1, sort_keys=True)
+        print(f"\nBaseline сохранен: {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    for size, name, before, after in regressions:
+        print(f"РЕГРЕССИЯ {name} @ {int(size):,}: p50 {before:.2f} -> {after:.2f} ms")
+    if not baseline:
+        print("\nBaseline не найден - сравнивать не с чем (--save-baseline чтобы записать)")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
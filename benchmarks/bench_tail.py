@@ -0,0 +1,67 @@
+"""
+/records и /undo при разной длине истории: чтение хвоста файла и обратный проход по индексу SQLite
+против старого пути (разбор всего CSV через pandas). Время должно почти не зависеть от числа записей.
+
+    python -m benchmarks.bench_tail --sizes 10 100000 1000000 10000000
+"""
+import os
+import time
+import argparse
+import tempfile
+import statistics
+
+from benchmarks.synthetic import write_csv
+from src.storage import FinanceStorage
+from src.sqlite_storage import SQLiteFinanceStorage, migrate
+
+
+def legacy_last_records(filename, n=10):
+    """get_last_records в том виде, в каком он был до чтения с конца"""
+    return FinanceStorage(filename)._read_data().tail(n).iloc[::-1].to_dict('records')
+
+
+def measure(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def undo_and_restore(storage):
+    def run():
+        storage.delete_last_expense()
+        storage.add_expense("Кофе", 100)
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100_000, 1_000_000])
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--legacy-repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'записей':>12}{'records csv':>14}{'records sqlite':>16}{'undo csv':>11}{'undo sqlite':>13}{'старый records':>16}")
+    for rows in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "1_finance.csv")
+            write_csv(filename, rows)
+            migrate(tmp, os.path.join(tmp, "finance.db"))
+            sqlite_storage = SQLiteFinanceStorage(os.path.join(tmp, "finance.db"), 1)
+            # Без общего кэша: как первый запрос пользователя после перезапуска
+            csv_storage = FinanceStorage(filename)
+
+            results = [
+                measure(lambda: csv_storage.get_last_records(10), args.repeats),
+                measure(lambda: sqlite_storage.get_last_records(10), args.repeats),
+                measure(undo_and_restore(csv_storage), args.repeats),
+                measure(undo_and_restore(sqlite_storage), args.repeats),
+                measure(lambda: legacy_last_records(filename), args.legacy_repeats),
+            ]
+        print(f"{rows:>12,}" + "".join(f"{ms:>{w}.2f}" for ms, w in zip(results, (14, 16, 11, 13, 16))) + "  (ms, p50)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Нагрузочный прогон бота целиком: src.bot (диспетчер, хранилище, графики, очередь отправки)
+против локального Bot API из tests/fake_bot_api.py. N пользователей по кругу шлют траты,
+/stats, /search, /records и /undo и ждут ответа; в конце - пропускная способность,
+p50/p99 времени ответа и доля ошибок по командам.
+
+    python -m benchmarks.load_test --users 50 --duration 30
+    python -m benchmarks.load_test --users 200 --mode webhook --backend sqlite --history 10000
+
+Время ответа - от отправки апдейта до прихода ответа в Bot API, то есть вместе с очередью
+апдейтов, лимитами отправки (SEND_CHAT_RATE) и задержкой самого API (--api-delay).
+Ошибка - ответ не пришел за --timeout или бот ответил сообщением об ошибке.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import itertools
+import threading
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.synthetic import write_csv, CATEGORIES, NOTES
+from tests.fake_bot_api import FakeBotAPI
+
+# Примерная доля команд у живых пользователей: в основном записывают траты
+MIX = {"expense": 70, "/stats": 10, "/search": 8, "/records": 8, "/undo": 4}
+# Ответы бота, которые считаются ошибкой
+ERROR_MARKERS = ("Ошибка", "Error")
+SEARCH_WORDS = ["такси", "кофе", "еда", "домой", "аэро", "ланч"]
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+def make_update(chat_id, text, message_id):
+    return {"message": {
+        "message_id": message_id,
+        "from": {"id": chat_id, "is_bot": False, "first_name": f"user{chat_id}"},
+        "chat": {"id": chat_id, "type": "private"},
+        "date": int(time.time()),
+        "text": text,
+    }}
+
+
+def command_text(command, rng):
+    if command == "expense":
+        note = rng.choice(NOTES)
+        return f"{rng.choice(CATEGORIES)} {rng.randint(50, 5000)} {note}".strip()
+    if command == "/search":
+        return f"/search {rng.choice(SEARCH_WORDS)}"
+    return command
+
+
+class Results:
+    def __init__(self):
+        self.latencies = defaultdict(list)  # команда -> [ms]
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def add(self, command, ms, ok):
+        with self._lock:
+            self.latencies[command].append(ms)
+            if not ok:
+                self.errors[command] += 1
+
+    def report(self, elapsed):
+        rows = []
+        commands = sorted(self.latencies, key=lambda c: -len(self.latencies[c]))
+        for command in commands + ["всего"]:
+            values = sorted(sum(self.latencies.values(), []) if command == "всего" else self.latencies[command])
+            errors = sum(self.errors.values()) if command == "всего" else self.errors[command]
+            if not values:
+                continue
+            rows.append((command, len(values), len(values) / elapsed,
+                         percentile(values, 0.5), percentile(values, 0.99), errors / len(values) * 100))
+        print(f"{'команда':<10}{'запросов':>10}{'в сек':>9}{'p50 ms':>10}{'p99 ms':>10}{'ошибки %':>10}")
+        for command, count, rate, p50, p99, error_rate in rows:
+            print(f"{command:<10}{count:>10}{rate:>9.1f}{p50:>10.1f}{p99:>10.1f}{error_rate:>10.2f}")
+
+
+def prepare_data(users, history):
+    """Синтетическая история каждого пользователя в data/ (раскладка CSV-хранилища)"""
+    os.makedirs("data", exist_ok=True)
+    if history:
+        for chat_id in users:
+            write_csv(os.path.join("data", f"{chat_id}_finance.csv"), history, seed=chat_id)
+
+
+def start_bot(args, api):
+    """Импортирует src.bot с настройками прогона и запускает его в фоновом потоке"""
+    from telebot import apihelper
+
+    os.environ.setdefault("BOT_TOKEN", "123456:LOAD")
+    os.environ["STORAGE_BACKEND"] = args.backend
+    os.environ["BOT_WORKERS"] = str(args.workers)
+    if args.mode == "webhook":
+        os.environ["WEBHOOK_URL"] = "http://127.0.0.1"
+    apihelper.API_URL = api.api_url
+
+    import src.bot as bot_module
+
+    if args.backend == "sqlite" and args.history:
+        from src.sqlite_storage import migrate
+        migrate("data", bot_module.SQLITE_PATH)
+    if args.backend == "partitioned" and args.history:
+        from src.partitioned_storage import convert
+        convert("data")
+    if args.backend == "sharded" and args.history:
+        from src.container_storage import migrate
+        migrate("data")
+    if bot_module.journal is not None:
+        bot_module.journal.start()  # как main.py
+
+    if args.mode == "webhook":
+        import keep_alive
+        from flask import Flask
+
+        app = Flask("load_test")
+        keep_alive.enable_webhook(bot_module.bot, bot_module.WEBHOOK_PATH, queue_size=bot_module.WEBHOOK_QUEUE_SIZE,
+                                  workers=args.webhook_workers, flask_app=app)
+        bot_module.run_bot()
+        update_ids = itertools.count(1)
+
+        def push(update):
+            # Как Telegram: POST с апдейтом на маршрут webhook
+            with app.test_client() as client:
+                client.post(bot_module.WEBHOOK_PATH, data=json.dumps(dict(update, update_id=next(update_ids))))
+    else:
+        threading.Thread(target=bot_module.run_bot, name="bot", daemon=True).start()
+        push = api.push_update
+    return bot_module, push
+
+
+def simulate_user(chat_id, push, api, results, measure_from, deadline, args):
+    rng = random.Random(chat_id)
+    commands, weights = zip(*MIX.items())
+    message_id = 0
+    while time.monotonic() < deadline:
+        command = rng.choices(commands, weights)[0]
+        message_id += 1
+        expected = api.reply_count(chat_id) + 1
+        start = time.monotonic()
+        push(make_update(chat_id, command_text(command, rng), message_id))
+        ok = api.wait_replies(chat_id, expected, args.timeout)
+        ms = (time.monotonic() - start) * 1000
+        if ok:
+            last = api.last_reply(chat_id)
+            text = last.params.get("text") or last.params.get("caption") or ""
+            ok = not any(marker in text for marker in ERROR_MARKERS)
+        if start >= measure_from:
+            results.add(command, ms, ok)
+        time.sleep(rng.uniform(0, 2 * args.think))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=30, help="секунд нагрузки (замеряемых)")
+    parser.add_argument("--warmup", type=float, default=5, help="первые секунды не учитываются: пул графиков, кэши")
+    parser.add_argument("--think", type=float, default=1.0, help="средняя пауза пользователя между сообщениями, с")
+    parser.add_argument("--history", type=int, default=1000, help="записей в истории каждого пользователя")
+    parser.add_argument("--backend", default="csv", choices=["csv", "sqlite", "partitioned", "sharded"])
+    parser.add_argument("--mode", default="polling", choices=["polling", "webhook"])
+    parser.add_argument("--workers", type=int, default=4, help="BOT_WORKERS")
+    parser.add_argument("--webhook-workers", type=int, default=2)
+    parser.add_argument("--api-delay", type=float, default=0.0, help="задержка ответа Bot API, с")
+    parser.add_argument("--timeout", type=float, default=30, help="сколько ждать ответа, с")
+    args = parser.parse_args()
+
+    users = [100_000 + i for i in range(args.users)]
+    with tempfile.TemporaryDirectory() as tmp, FakeBotAPI(delay=args.api_delay) as api:
+        os.chdir(tmp)
+        prepare_data(users, args.history)
+        bot_module, push = start_bot(args, api)
+
+        results = Results()
+        measure_from = time.monotonic() + args.warmup
+        deadline = measure_from + args.duration
+        threads = [threading.Thread(target=simulate_user, args=(chat_id, push, api, results, measure_from, deadline, args),
+                                    daemon=True)
+                   for chat_id in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - measure_from
+
+        print(f"{args.users} пользователей, {elapsed:.0f} с, backend={args.backend}, mode={args.mode}, "
+              f"BOT_WORKERS={args.workers}, история {args.history:,}")
+        results.report(elapsed)
+        if args.mode == "polling":
+            bot_module.bot.stop_polling()
+        bot_module.outbox.close(timeout=5)
+        bot_module.renderer.shutdown()
+        # Пока рабочая папка временная: иначе atexit сохранит data/active_users.json в репозиторий
+        bot_module.scheduler.close()
+        os.chdir(ROOT)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+import random
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from src.storage import COLUMNS, DATE_FORMAT
+
+CATEGORIES = ["Еда", "Такси", "Кофе", "Продукты", "Аренда", "Кино", "Аптека", "Одежда", "Связь", "Спорт"]
+NOTES = ["", "", "", "бизнес ланч", "в аэропорт", "домой", "с друзьями", "подарок маме", "скидка", "по акции"]
+
+
+def generate_frame(rows, seed=0, end=None):
+    """История трат на rows записей, равномерно растянутая на ~3 года до end"""
+    rng = random.Random(seed)
+    end = end or datetime.now()
+    start = end - timedelta(days=3 * 365)
+    step = (end - start) / max(rows, 1)
+    return pd.DataFrame({
+        "date": [start + step * i for i in range(rows)],
+        "category": [rng.choice(CATEGORIES) for _ in range(rows)],
+        "amount": [round(rng.uniform(1, 5000), 2) for _ in range(rows)],
+        "note": [rng.choice(NOTES) for _ in range(rows)],
+    }, columns=COLUMNS)
+
+
+def write_csv(filename, rows, seed=0):
+    """Пишет синтетическую историю в формате FinanceStorage"""
+    df = generate_frame(rows, seed)
+    df.to_csv(filename, index=False, date_format=DATE_FORMAT)
+    return df
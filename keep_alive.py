@@ -1,16 +1,78 @@
-from flask import Flask
+import queue
+from flask import Flask, Response, request, abort
 from threading import Thread
 
+from src.metrics import registry
+
 app = Flask('')
 
 @app.route('/')
 def home():
     return "I'm alive. Bot is running!"
 
+@app.route('/metrics')
+def metrics():
+    # Текстовый формат Prometheus
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
 def run():
     # Запускаем веб-сервер на порту 8080 (стандарт для Render)
     app.run(host='0.0.0.0', port=8080)
 
 def keep_alive():
     t = Thread(target=run)
-    t.start()
\ No newline at end of file
+    t.start()
+
+def enable_webhook(bot, path="/webhook", secret=None, queue_size=1000, workers=2, flask_app=None):
+    """
+    Режим webhook: Telegram сам присылает апдейты POST-запросом на path.
+    Запрос только кладет апдейт в ограниченную очередь, обработку ведут фоновые потоки.
+    Если очередь полна - отвечаем 503, и Telegram повторит доставку позже.
+
+    Проверить локально: curl -X POST -H 'Content-Type: application/json' \\
+        -d @tests/data/update_text.json http://localhost:8080/webhook
+    """
+    import telebot
+
+    flask_app = flask_app or app
+    updates = queue.Queue(maxsize=queue_size)
+
+    def receive_update():
+        if secret and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret:
+            abort(403)
+        try:
+            update = telebot.types.Update.de_json(request.get_data(as_text=True))
+        except (ValueError, KeyError, TypeError) as e:
+            # Битое тело не станет лучше от повтора: 400, а не 500, на который Telegram повторяет доставку
+            print(f"Error webhook: не разобран апдейт: {e}")
+            abort(400)
+        if update is None:
+            abort(400)
+        try:
+            updates.put_nowait(update)
+        except queue.Full:
+            return "busy", 503
+        return "OK"
+
+    flask_app.add_url_rule(path, "telegram_webhook", receive_update, methods=["POST"])
+    registry.gauge("webhook_queue_size", "Апдейты, ждущие обработки", updates.qsize)
+
+    def worker():
+        while True:
+            update = updates.get()
+            try:
+                bot.process_new_updates([update])
+            except Exception as e:
+                print(f"Error webhook: {e}")
+            finally:
+                updates.task_done()
+
+    for _ in range(workers):
+        Thread(target=worker, daemon=True).start()
+    return updates
+
+def enable_profiler(profiler, path="/debug/slow", flask_app=None):
+    """Отчет SamplingProfiler (src/metrics.py) о самых медленных обработчиках"""
+    flask_app = flask_app or app
+    flask_app.add_url_rule(path, "slow_handlers",
+                           lambda: Response(profiler.dump(), mimetype="text/plain; charset=utf-8"))
@@ -1,6 +1,17 @@
-from src.bot import run_bot
-from keep_alive import keep_alive  # <--- 1. Импортируем нашу обманку
+from src.startup import timed_import  # <--- 0. Засекаем время импортов для отчета о запуске
 
 if __name__ == "__main__":
-    keep_alive()  # <--- 2. Запускаем веб-сервер перед ботом
-    run_bot()     # <--- 3. Запускаем самого бота
\ No newline at end of file
+    keep_alive = timed_import("keep_alive")  # <--- 1. Импортируем нашу обманку
+    bot = timed_import("src.bot")
+    if bot.journal:
+        # До веб-сервера: webhook может начать присылать апдейты сразу. Доносит траты,
+        # оставшиеся в журнале после прошлого запуска
+        bot.journal.start()
+    # Файлы выгрузок прошлого запуска уже никто не отправит
+    timed_import("src.export").clear_export_dir()
+    if bot.WEBHOOK_URL:
+        keep_alive.enable_webhook(bot.bot, bot.WEBHOOK_PATH, bot.WEBHOOK_SECRET, bot.WEBHOOK_QUEUE_SIZE)
+    if bot.profiler:
+        keep_alive.enable_profiler(bot.profiler)
+    keep_alive.keep_alive()  # <--- 2. Запускаем веб-сервер перед ботом
+    bot.run_bot()            # <--- 3. Запускаем самого бота (polling или регистрация webhook)
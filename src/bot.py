@@ -1,12 +1,28 @@
 import telebot
 import os
+import time
 import datetime
+import tempfile
 from dotenv import load_dotenv
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton, BotCommand
 
-from src.parser import parse_input
+from src.parser import parse_input, parse_batch
 from src.storage import FinanceStorage
-from src.visualizer import create_pie_chart
+from src.cache import StorageCache
+from src.sqlite_storage import SQLiteFinanceStorage
+from src.partitioned_storage import PartitionedFinanceStorage
+from src.container_storage import open_storage as open_sharded_storage
+from src.render import ChartRenderer
+from src.startup import track_first_updates, warm_up
+from src.dispatcher import ChatDispatcher
+from src.importer import import_statement, SUPPORTED_EXTENSIONS, xlsx_supported
+from src.export import ExportCache, PERIODS, FORMATS, available_formats
+from src.metrics import registry, instrument_bot, SamplingProfiler
+from src.journal import WriteJournal, BufferedFinanceStorage
+from src.trend import TrendCache, MAX_MONTHS
+from src.outbox import Outbox, pooled_session
+from src.reports import ReportStore, previous_month
+from src.scheduler import ReportScheduler, DigestLog
 
 load_dotenv()
 TOKEN = os.getenv("BOT_TOKEN")
@@ -14,10 +30,137 @@ TOKEN = os.getenv("BOT_TOKEN")
 if not TOKEN:
     raise ValueError("Токен не найден! Проверь .env")
 
-bot = telebot.TeleBot(TOKEN)
+# threaded=False: обработчики выполняет ChatDispatcher - разные чаты параллельно,
+# апдейты одного чата строго по очереди
+bot = telebot.TeleBot(TOKEN, threaded=False)
+# BOT_MAX_PENDING - сколько апдейтов может ждать обработки; дальше polling/webhook придерживает новые
+dispatcher = ChatDispatcher(workers=int(os.getenv("BOT_WORKERS", "4")),
+                            max_pending=int(os.getenv("BOT_MAX_PENDING", "1000")))
+dispatcher.attach(bot)
+
+# Ответы уходят через очередь: обработчик не ждет Telegram, лимиты и 429 (retry_after)
+# учитываются в фоне. SEND_WORKERS=0 - отправлять прямо из обработчика
+SEND_WORKERS = int(os.getenv("SEND_WORKERS", "4"))
+pooled_session(pool_size=SEND_WORKERS + 2)  # + соединение long polling
+outbox = Outbox(
+    bot, workers=SEND_WORKERS,
+    global_rate=float(os.getenv("SEND_GLOBAL_RATE", "30")),
+    chat_rate=float(os.getenv("SEND_CHAT_RATE", "1"))
+)
+
+# WEBHOOK_URL=https://<хост> - Telegram присылает апдейты на Flask из keep_alive.py вместо long polling
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = "/webhook"
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+
+# Общий кэш на весь процесс: горячие пользователи не перечитывают CSV на каждое сообщение
+storage_cache = StorageCache(
+    max_entries=int(os.getenv("STORAGE_CACHE_ENTRIES", "1000")),
+    max_bytes=int(os.getenv("STORAGE_CACHE_MB", "256")) * 1024 * 1024
+)
+
+# Графики рисуются в пуле процессов, готовые PNG кэшируются по хэшу данных
+renderer = ChartRenderer(
+    workers=int(os.getenv("RENDER_WORKERS", "2")),
+    cache_size=int(os.getenv("RENDER_CACHE_SIZE", "256")),
+    dpi=int(os.getenv("CHART_DPI", "100"))
+)
+
+# Последняя выгрузка каждого пользователя - до появления новых записей
+export_cache = ExportCache(max_users=int(os.getenv("EXPORT_CACHE_USERS", "64")))
+
+# Последний /trend каждого пользователя - до появления новых записей
+trend_cache = TrendCache(max_users=int(os.getenv("TREND_CACHE_USERS", "256")))
+
+# Отчеты за прошлые месяцы (кнопки /history) - до появления новых записей; заранее их строит планировщик ниже
+report_store = ReportStore(renderer, max_entries=int(os.getenv("REPORT_STORE_SIZE", "1024")))
+
+# Метрики для GET /metrics (keep_alive.py)
+registry.gauge("storage_cache_hits_total", "Попадания в кэш хранилища", lambda: storage_cache.hits, kind="counter")
+registry.gauge("storage_cache_misses_total", "Промахи кэша хранилища", lambda: storage_cache.misses, kind="counter")
+registry.gauge("storage_cache_bytes", "Оценка памяти под кэш хранилища", lambda: storage_cache.total_bytes)
+registry.gauge("chat_dispatcher_pending", "Апдейты в очередях чатов", dispatcher.pending)
+registry.gauge("outbox_pending", "Запросы к Bot API, ждущие отправки", outbox.pending)
+registry.gauge("report_store_hits_total", "Отчеты за месяц, отданные готовыми", lambda: report_store.hits, kind="counter")
+registry.gauge("report_store_misses_total", "Отчеты за месяц, построенные по запросу", lambda: report_store.misses, kind="counter")
+# PROFILE_SLOW_MS=1000 - печатать стеки обработчиков, работавших дольше порога (GET /debug/slow)
+PROFILE_SLOW_MS = os.getenv("PROFILE_SLOW_MS")
+profiler = SamplingProfiler(threshold_ms=int(PROFILE_SLOW_MS)).start() if PROFILE_SLOW_MS else None
+
+# STORAGE_BACKEND=sqlite - все пользователи в одной базе (перенос: python -m src.sqlite_storage migrate)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "csv")
+SQLITE_PATH = os.getenv("SQLITE_PATH", "data/finance.db")
+# STORAGE_BACKEND=partitioned - помесячные Feather-партиции (нужен pyarrow; перенос: python -m src.partitioned_storage convert)
+# STORAGE_BACKEND=sharded - один файл на пользователя в data/users/xx/ (перенос: python -m src.container_storage migrate)
+
+def open_user_storage(user_id):
+    if STORAGE_BACKEND == "sqlite":
+        return SQLiteFinanceStorage(SQLITE_PATH, user_id)
+    if STORAGE_BACKEND == "partitioned":
+        return PartitionedFinanceStorage(f"data/{user_id}_finance.csv", cache=storage_cache)
+    if STORAGE_BACKEND == "sharded":
+        return open_sharded_storage("data", user_id, cache=storage_cache)
+    return FinanceStorage(f"data/{user_id}_finance.csv", cache=storage_cache)
+
+# WRITE_BEHIND_JOURNAL=data/journal.log - траты сначала в журнал и буфер, в хранилище - пачками в фоне
+WRITE_BEHIND_JOURNAL = os.getenv("WRITE_BEHIND_JOURNAL")
+journal = WriteJournal(
+    WRITE_BEHIND_JOURNAL, open_user_storage,
+    flush_rows=int(os.getenv("JOURNAL_FLUSH_ROWS", "500")),
+    flush_interval=float(os.getenv("JOURNAL_FLUSH_SECONDS", "1")),
+    fsync=os.getenv("JOURNAL_FSYNC", "1") == "1"
+) if WRITE_BEHIND_JOURNAL else None
+if journal is not None:
+    registry.gauge("journal_pending_rows", "Траты в буфере, еще не перенесенные в хранилище", journal.pending_rows)
+    registry.gauge("journal_commits_total", "Сбросы журнала на диск (один на группу записей)", lambda: journal.commits, kind="counter")
+
+def user_storage(user_id):
+    storage = open_user_storage(user_id)
+    if journal is not None:
+        return BufferedFinanceStorage(storage, journal, user_id)
+    return storage
 
 def get_user_storage(user_id):
-    return FinanceStorage(f"data/{user_id}_finance.csv")
+    # Пользователь пишет боту - планировщик подготовит ему отчет за прошлый месяц
+    scheduler.touch(user_id)
+    return user_storage(user_id)
+
+def unconverted_note(codes):
+    """Предупреждение о валютах без курса (src/currency.py): их траты в сумме посчитаны 1:1"""
+    if not codes:
+        return ""
+    return f"\n⚠️ Нет курса для {', '.join(codes)}: эти траты посчитаны 1:1"
+
+def month_caption(report):
+    cur = report.currency
+    caption = f"📊 **{report.month:02d}.{report.year}**\n"
+    caption += f"Расход: **{report.spent:,.2f} {cur}**"
+    if report.budget > 0:
+        caption += f"\nБюджет: {report.budget:,.0f} {cur}\n"
+        if report.remaining >= 0:
+            caption += f"Остаток: **{report.remaining:,.2f} {cur}**"
+        else:
+            caption += f"Перерасход: **{abs(report.remaining):,.2f} {cur}** 😱"
+    return caption + unconverted_note(getattr(report.stats, "unconverted", ()))
+
+def send_digest(user_id, report):
+    outbox.send_photo(user_id, photo=report.png, caption="Итоги прошлого месяца\n" + month_caption(report),
+                      parse_mode="Markdown")
+
+# PRECOMPUTE_REPORTS=0 - не строить отчеты в фоне; MONTHLY_DIGEST=1 - в начале месяца присылать итоги прошлого
+MONTHLY_DIGEST = os.getenv("MONTHLY_DIGEST") == "1"
+scheduler = ReportScheduler(
+    report_store, user_storage,
+    # Только когда нет апдейтов в работе и ответов в очереди - живые запросы важнее
+    busy=lambda: dispatcher.pending() > 0 or outbox.pending() > 0,
+    digest=send_digest if MONTHLY_DIGEST else None,
+    digest_log=DigestLog(os.path.join("data", "digests.json")) if MONTHLY_DIGEST else None,
+    workers=int(os.getenv("REPORT_WORKERS", "1")),
+    interval=float(os.getenv("REPORT_INTERVAL_SECONDS", "30")),
+    # Кто писал недавно - помним между перезапусками
+    active_path=os.path.join("data", "active_users.json")
+)
 
 def set_main_menu():
     commands = [
@@ -28,6 +171,7 @@ def set_main_menu():
         BotCommand("records", "📋 Список трат"),
         BotCommand("search", "🔍 Поиск"),
         BotCommand("undo", "🔙 Отмена записи"),
+        BotCommand("trend", "📈 Динамика по месяцам"),
         BotCommand("history", "📅 Архив / Excel"),
         BotCommand("reset", "🗑 Сброс данных")
     ]
@@ -56,7 +200,7 @@ def send_welcome(message):
         "(Чтобы сменить на рубли, кроны, лари или фунты — жми `/currency`)\n\n"
         "👇 **Меню команд — в кнопке слева внизу.**"
     )
-    bot.send_message(message.chat.id, text, parse_mode="Markdown")
+    outbox.send_message(message.chat.id, text, parse_mode="Markdown")
 
 # --- СМЕНА ВАЛЮТЫ (ОБНОВЛЕНО) ---
 
@@ -85,7 +229,7 @@ def change_currency_menu(message):
     markup.add(btn5, btn6)
     markup.add(btn7, btn8)
     
-    bot.send_message(message.chat.id, "💱 **Выберите валюту учета:**", reply_markup=markup, parse_mode="Markdown")
+    outbox.send_message(message.chat.id, "💱 **Выберите валюту учета:**", reply_markup=markup, parse_mode="Markdown")
 
 @bot.callback_query_handler(func=lambda call: call.data.startswith("set_cur_"))
 def callback_set_currency(call):
@@ -94,8 +238,10 @@ def callback_set_currency(call):
     storage = get_user_storage(call.message.chat.id)
     storage.set_currency(symbol)
     
-    bot.answer_callback_query(call.id, f"Валюта установлена: {symbol}")
-    bot.edit_message_text(f"✅ Готово! Теперь считаем в **{symbol}**.", call.message.chat.id, call.message.message_id, parse_mode="Markdown")
+    outbox.answer_callback_query(call.id, f"Валюта установлена: {symbol}")
+    outbox.edit_message_text(f"✅ Готово! Теперь считаем в **{symbol}**.\n"
+                             "Прежние траты остаются в своей валюте, отчеты пересчитываются по курсу на дату траты.",
+                             call.message.chat.id, call.message.message_id, parse_mode="Markdown")
 
 # --- ОСТАЛЬНЫЕ КОМАНДЫ ---
 
@@ -106,20 +252,20 @@ def set_salary(message):
     try:
         args = message.text.split()
         if len(args) < 2:
-            bot.reply_to(message, f"⚠️ Пример: `/salary 50000`", parse_mode="Markdown")
+            outbox.reply_to(message, f"⚠️ Пример: `/salary 50000`", parse_mode="Markdown")
             return
         amount = float(args[1].replace(",", "."))
         storage.set_budget(amount)
-        bot.reply_to(message, f"✅ Бюджет на месяц: **{amount:,.0f} {cur}**", parse_mode="Markdown")
+        outbox.reply_to(message, f"✅ Бюджет на месяц: **{amount:,.0f} {cur}**", parse_mode="Markdown")
     except ValueError:
-        bot.reply_to(message, "Ошибка: сумма должна быть числом.")
+        outbox.reply_to(message, "Ошибка: сумма должна быть числом.")
 
 @bot.message_handler(commands=['undo'])
 def undo_last(message):
     if get_user_storage(message.chat.id).delete_last_expense():
-        bot.reply_to(message, "↩️ Последняя запись удалена.")
+        outbox.reply_to(message, "↩️ Последняя запись удалена.")
     else:
-        bot.reply_to(message, "Нет записей для удаления.")
+        outbox.reply_to(message, "Нет записей для удаления.")
 
 @bot.message_handler(commands=['search'])
 def search_expenses(message):
@@ -128,26 +274,28 @@ def search_expenses(message):
     cur = storage.get_currency()
     
     if len(args) < 2:
-        bot.reply_to(message, "🔍 Пример: `/search такси`", parse_mode="Markdown")
+        outbox.reply_to(message, "🔍 Пример: `/search такси`", parse_mode="Markdown")
         return
     
     query = args[1]
-    results = storage.search_records(query)
+    found = storage.search(query, n=10)
+    results = found['records']
     
     if not results:
-        bot.reply_to(message, "Ничего не найдено.")
+        outbox.reply_to(message, "Ничего не найдено.")
         return
         
     text = f"🔎 **Поиск '{query}':**\n"
-    total = 0
     for r in results:
         date_str = r['date'].strftime("%d.%m")
         note = f" ({r['note']})" if r['note'] else ""
-        text += f"{date_str} | {r['category']} | {r['amount']} {cur}{note}\n"
-        total += r['amount']
+        text += f"{date_str} | {r['category']} | {r['amount']} {r['currency'] or cur}{note}\n"
         
-    text += f"\nИтого: **{total} {cur}**"
-    bot.send_message(message.chat.id, text, parse_mode="Markdown")
+    if found['count'] > len(results):
+        text += f"\n...и еще {found['count'] - len(results)}"
+    text += f"\nИтого ({found['count']} шт.): **{found['total']} {cur}**"
+    text += unconverted_note(found.get('unconverted'))
+    outbox.send_message(message.chat.id, text, parse_mode="Markdown")
 
 @bot.message_handler(commands=['records'])
 def show_records(message):
@@ -155,16 +303,16 @@ def show_records(message):
     cur = storage.get_currency()
     records = storage.get_last_records(10)
     if not records:
-        bot.send_message(message.chat.id, "Список пуст.")
+        outbox.send_message(message.chat.id, "Список пуст.")
         return
         
     text = f"📋 **Последние операции ({cur}):**\n"
     for r in records:
         date_str = r['date'].strftime("%d.%m %H:%M")
         note = f" _{r['note']}_" if r['note'] else ""
-        text += f"`{date_str}` | {r['category']} | {r['amount']} {cur}{note}\n"
+        text += f"`{date_str}` | {r['category']} | {r['amount']} {r['currency'] or cur}{note}\n"
         
-    bot.send_message(message.chat.id, text, parse_mode="Markdown")
+    outbox.send_message(message.chat.id, text, parse_mode="Markdown")
 
 @bot.message_handler(commands=['stats'])
 def send_stats(message):
@@ -177,11 +325,15 @@ def send_stats(message):
     budget_data = storage.get_budget_status()
     
     if not stats:
-        bot.send_message(user_id, "Нет данных за текущий месяц.")
+        # Отчет за прошлый месяц обычно уже готов (src/scheduler.py)
+        year, month = previous_month(now)
+        markup = InlineKeyboardMarkup()
+        markup.add(InlineKeyboardButton("📅 Прошлый месяц", callback_data=f"stats_{year}_{month}"))
+        outbox.send_message(user_id, "Нет данных за текущий месяц.", reply_markup=markup)
         return
 
     try:
-        chart_file = create_pie_chart(stats, currency_symbol=cur)
+        chart_file = renderer.render_pie(stats, currency_symbol=cur)
         
         spent = budget_data['spent']
         budget = budget_data['budget']
@@ -198,11 +350,43 @@ def send_stats(message):
                 caption += f"Лимит на день: **{daily:,.2f} {cur}**"
             else:
                 caption += f"Перерасход: **{abs(rem):,.2f} {cur}** 😱"
+        caption += unconverted_note(budget_data.get('unconverted'))
                 
-        bot.send_photo(user_id, photo=chart_file, caption=caption, parse_mode="Markdown")
+        outbox.send_photo(user_id, photo=chart_file, caption=caption, parse_mode="Markdown")
     except Exception as e:
         print(f"Error stats: {e}")
-        bot.send_message(user_id, "Ошибка построения отчета.")
+        outbox.send_message(user_id, "Ошибка построения отчета.")
+
+# --- ДИНАМИКА ПО МЕСЯЦАМ ---
+
+def send_trend(user_id, months):
+    storage = get_user_storage(user_id)
+    cur = storage.get_currency()
+    report = trend_cache.get_or_build(user_id, storage, months)
+    if report.empty:
+        outbox.send_message(user_id, f"Нет трат за последние {months} мес.")
+        return
+
+    chart_file = renderer.render_trend(report.months, report.series(), currency_symbol=cur)
+    monthly = [total for _, total in report.monthly()]
+    caption = f"📈 **{report.months[0]} — {report.months[-1]}**\n"
+    caption += f"Всего: **{report.total:,.2f} {cur}**\n"
+    caption += f"В среднем за месяц: {report.total / len(monthly):,.2f} {cur}\n"
+    caption += f"Максимум: {max(monthly):,.2f} {cur}"
+    caption += unconverted_note(report.unconverted)
+    outbox.send_photo(user_id, photo=chart_file, caption=caption, parse_mode="Markdown")
+
+@bot.message_handler(commands=['trend'])
+def trend_report(message):
+    # /trend или /trend 24 - число последних месяцев
+    arg = message.text.split(maxsplit=1)[1:] if message.text else []
+    months = int(arg[0]) if arg and arg[0].strip().isdigit() else 12
+    months = min(max(months, 1), MAX_MONTHS)
+    try:
+        send_trend(message.chat.id, months)
+    except Exception as e:
+        print(f"Error trend: {e}")
+        outbox.send_message(message.chat.id, "Ошибка построения отчета.")
 
 # --- КНОПКИ СБРОСА И ИСТОРИИ ---
 
@@ -211,7 +395,7 @@ def ask_reset(message):
     markup = InlineKeyboardMarkup()
     markup.add(InlineKeyboardButton("🗑 Удалить всё", callback_data="reset_confirm"))
     markup.add(InlineKeyboardButton("Отмена", callback_data="reset_cancel"))
-    bot.send_message(message.chat.id, "Подтвердите полный сброс:", reply_markup=markup)
+    outbox.send_message(message.chat.id, "Подтвердите полный сброс:", reply_markup=markup)
 
 @bot.message_handler(commands=['history'])
 def show_history_menu(message):
@@ -221,9 +405,11 @@ def show_history_menu(message):
     
     buttons = [InlineKeyboardButton(name, callback_data=f"stats_{year}_{num}") for num, name in months.items()]
     markup.add(*buttons[:4], *buttons[4:8], *buttons[8:])
-    markup.add(InlineKeyboardButton("📥 Скачать CSV", callback_data="download_all"))
+    markup.add(InlineKeyboardButton("📈 12 месяцев", callback_data="trend_12"),
+               InlineKeyboardButton("📈 24 месяца", callback_data="trend_24"))
+    markup.add(InlineKeyboardButton("📥 Скачать выгрузку", callback_data="download_all"))
 
-    bot.send_message(message.chat.id, "Выберите месяц:", reply_markup=markup)
+    outbox.send_message(message.chat.id, "Выберите месяц:", reply_markup=markup)
 
 @bot.callback_query_handler(func=lambda call: True)
 def handle_query(call):
@@ -235,30 +421,152 @@ def handle_query(call):
     
     if call.data == "reset_confirm":
         storage.reset_data()
-        bot.delete_message(user_id, call.message.message_id)
-        bot.send_message(user_id, "База очищена.")
+        outbox.delete_message(user_id, call.message.message_id)
+        outbox.send_message(user_id, "База очищена.")
     elif call.data == "reset_cancel":
-        bot.delete_message(user_id, call.message.message_id)
+        outbox.delete_message(user_id, call.message.message_id)
     elif call.data == "download_all":
+        # Шаг 1: период
+        markup = InlineKeyboardMarkup()
+        markup.add(*[InlineKeyboardButton(name, callback_data=f"exp_{period}") for period, name in PERIODS.items()])
+        outbox.answer_callback_query(call.id)
+        outbox.send_message(user_id, "За какой период выгрузить?", reply_markup=markup)
+    elif call.data.startswith("exp_") and call.data.count("_") == 1:
+        # Шаг 2: формат
+        period = call.data.split("_")[1]
+        markup = InlineKeyboardMarkup()
+        markup.add(*[InlineKeyboardButton(FORMATS[fmt], callback_data=f"exp_{period}_{fmt}") for fmt in available_formats()])
+        outbox.answer_callback_query(call.id)
+        outbox.edit_message_text(f"{PERIODS[period]}: в каком формате?", user_id, call.message.message_id, reply_markup=markup)
+    elif call.data.startswith("exp_"):
+        _, period, fmt = call.data.split("_")
+        export = export_cache.get_or_build(user_id, storage, period, fmt)
+        if export.rows == 0:
+            outbox.answer_callback_query(call.id, "Нет данных за этот период.")
+            return
+        outbox.answer_callback_query(call.id)
+        # Дескриптор принадлежит очереди: она закроет его после отправки
+        outbox.send_document(user_id, export.open(), visible_file_name=export.filename,
+                          caption=f"История операций: {PERIODS[period].lower()} ({export.rows} шт.)")
+    elif call.data.startswith("trend_"):
+        outbox.answer_callback_query(call.id)
         try:
-            with open(storage.filename, "rb") as f:
-                bot.send_document(user_id, f, caption="История операций")
-        except: 
-            bot.answer_callback_query(call.id, "Нет данных.")
+            send_trend(user_id, min(int(call.data.split("_")[1]), MAX_MONTHS))
+        except Exception as e:
+            print(f"Error trend: {e}")
+            outbox.send_message(user_id, "Ошибка построения отчета.")
     elif call.data.startswith("stats_"):
         try:
             _, y, m = call.data.split("_")
-            stats = storage.get_stats_by_month(int(y), int(m))
-            if stats:
-                bot.send_photo(user_id, create_pie_chart(stats, cur), caption=f"Отчет за {m}.{y}")
-            else:
-                bot.answer_callback_query(call.id, "Пусто.")
-            bot.answer_callback_query(call.id)
-        except: pass
+            report = report_store.get_or_build(user_id, storage, int(y), int(m))
+            if report.empty:
+                outbox.answer_callback_query(call.id, "Пусто.")
+                return
+            outbox.answer_callback_query(call.id)
+            outbox.send_photo(user_id, report.png, caption=month_caption(report), parse_mode="Markdown")
+        except Exception as e:
+            print(f"Error history: {e}")
+            outbox.send_message(user_id, "Ошибка построения отчета.")
+
+# --- ИМПОРТ ВЫПИСКИ ---
+
+MAX_IMPORT_MB = int(os.getenv("MAX_IMPORT_MB", "20"))  # Bot API отдает файлы до 20 МБ
+
+def download_document(document, path):
+    """Скачивает файл из Telegram на диск потоком, не держа его целиком в памяти"""
+    import requests
+    with requests.get(bot.get_file_url(document.file_id), stream=True, timeout=60) as response:
+        response.raise_for_status()
+        with open(path, "wb") as f:
+            for block in response.iter_content(64 * 1024):
+                f.write(block)
+
+@bot.message_handler(content_types=['document'])
+def import_document(message):
+    document = message.document
+    ext = os.path.splitext(document.file_name or "")[1].lower()
+    if ext not in SUPPORTED_EXTENSIONS or (ext == ".xlsx" and not xlsx_supported()):
+        outbox.reply_to(message, "📎 Пришли выписку из банка в CSV — я добавлю траты из нее.")
+        return
+    if document.file_size and document.file_size > MAX_IMPORT_MB * 1024 * 1024:
+        outbox.reply_to(message, f"Файл больше {MAX_IMPORT_MB} МБ.")
+        return
+
+    # id сообщения нужен для правок ниже - этот ответ дожидаемся
+    status = outbox.reply_to(message, "⏳ Загружаю выписку...").result(timeout=60)
+    last_update = [time.monotonic()]
+
+    def progress(rows, added):
+        # Редактируем сообщение не чаще раза в 2 секунды, чтобы не упереться в лимиты Telegram
+        if time.monotonic() - last_update[0] < 2:
+            return
+        last_update[0] = time.monotonic()
+        outbox.edit_message_text(f"⏳ Обработано строк: {rows:,}, добавлено: {added:,}", message.chat.id, status.message_id)
+
+    storage = get_user_storage(message.chat.id)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, f"statement{ext}")
+        try:
+            download_document(document, path)
+            result = import_statement(path, storage, progress=progress)
+        except ValueError as e:
+            outbox.edit_message_text(f"❌ Не получилось импортировать: {e}", message.chat.id, status.message_id)
+            return
+        except Exception as e:
+            print(f"Error import: {e}")
+            outbox.edit_message_text("❌ Ошибка импорта.", message.chat.id, status.message_id)
+            return
+
+    text = (
+        f"✅ Импорт завершен\n"
+        f"Строк в файле: {result['rows']:,}\n"
+        f"Добавлено: {result['added']:,}\n"
+        f"Дубли (уже были): {result['duplicates']:,}\n"
+        f"Пропущено (доходы и нераспознанные): {result['skipped']:,}"
+    )
+    outbox.edit_message_text(text, message.chat.id, status.message_id)
+
+def budget_line(status, cur):
+    """Строка про остаток бюджета для ответа на трату"""
+    if status['budget'] <= 0:
+        return ""
+    note = unconverted_note(status.get('unconverted'))
+    if status['remaining'] > 0:
+        return f"Остаток: {status['remaining']:,.0f} {cur} (Лимит/день: {status['daily_limit']:,.0f})" + note
+    return f"Перерасход: {abs(status['remaining']):,.0f} {cur}" + note
+
+def process_batch(message):
+    """Несколько строк в одном сообщении: одна запись в хранилище и один ответ"""
+    entries, errors = parse_batch(message.text)
+    if not entries:
+        outbox.reply_to(message, "Не понял ни одной строки. Пиши так: `Такси 500`", parse_mode="Markdown")
+        return
+
+    storage = get_user_storage(message.chat.id)
+    cur = storage.get_currency()
+    storage.add_expenses(entries)
+    status = storage.get_budget_status()
+
+    total = sum(e['amount'] for e in entries)
+    reply = f"✅ Записано: {len(entries)} на сумму {total:,.2f} {cur}\n"
+    for e in entries:
+        note_text = f" ({e['note']})" if e['note'] else ""
+        reply += f"• {e['category']}: {e['amount']} {cur}{note_text}\n"
+    if errors:
+        reply += "\n⚠️ Не записаны:\n"
+        for line_no, line, error in errors:
+            reply += f"Строка {line_no} «{line}»: {error}\n"
+    reply += budget_line(status, cur)
+
+    outbox.reply_to(message, reply)
 
 @bot.message_handler(content_types=['text'])
 def process_expense(message):
     try:
+        if len([line for line in message.text.splitlines() if line.strip()]) > 1:
+            process_batch(message)
+            return
+
         data = parse_input(message.text)
         storage = get_user_storage(message.chat.id)
         cur = storage.get_currency()
@@ -269,22 +577,35 @@ def process_expense(message):
         note_text = f" ({data['note']})" if data['note'] else ""
         
         reply = f"✅ {data['category']}: {data['amount']} {cur}{note_text}\n"
+        reply += budget_line(status, cur)
         
-        if status['budget'] > 0:
-            if status['remaining'] > 0:
-                reply += f"Остаток: {status['remaining']:,.0f} {cur} (Лимит/день: {status['daily_limit']:,.0f})"
-            else:
-                reply += f"Перерасход: {abs(status['remaining']):,.0f} {cur}"
-        
-        bot.reply_to(message, reply)
+        outbox.reply_to(message, reply)
         
     except ValueError:
-        bot.reply_to(message, "Не понял. Пиши так: `Такси 500`", parse_mode="Markdown")
+        outbox.reply_to(message, "Не понял. Пиши так: `Такси 500`", parse_mode="Markdown")
     except Exception as e:
         print(f"Error: {e}")
-        bot.reply_to(message, "Ошибка записи.")
+        outbox.reply_to(message, "Ошибка записи.")
+
+# Все обработчики объявлены - оборачиваем их замером времени
+instrument_bot(bot, profiler)
+
+def warm_pandas():
+    import pandas  # noqa: F401
 
 def run_bot():
+    # Журнал (journal.start) запускает main.py - до веб-сервера, раньше первого апдейта
+    if os.getenv("PRECOMPUTE_REPORTS", "1") == "1":
+        scheduler.start()
     print("Бот запущен. Обновляю меню...")
     set_main_menu()
+    if WEBHOOK_URL:
+        # Маршрут уже зарегистрирован в keep_alive.enable_webhook, осталось сообщить адрес Telegram
+        bot.remove_webhook()
+        bot.set_webhook(url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET)
+        print(f"Режим webhook: {WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}")
+        warm_up(warm_pandas, renderer.warm_up)
+        return
+    # Тяжелые зависимости догружаем в фоне, когда бот уже отвечает
+    track_first_updates(bot, on_first=lambda: warm_up(warm_pandas, renderer.warm_up))
     bot.infinity_polling()  
\ No newline at end of file
@@ -0,0 +1,111 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+def _file_signature(path):
+    """Отпечаток файла: (mtime_ns, size). None - файла нет."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _estimate_size(value):
+    """Грубая оценка занимаемой памяти в байтах"""
+    if hasattr(value, "memory_usage"):
+        # DataFrame: учитываем строки (deep=True), иначе object-колонки почти бесплатны
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    return 256
+
+
+class StorageCache:
+    """
+    Общий на процесс LRU-кэш состояния пользователей (история, бюджеты, валюта).
+
+    Ключ - путь к файлу. Запись считается актуальной, пока совпадают mtime и размер файла,
+    поэтому внешние правки подхватываются автоматически. Запись через FinanceStorage
+    обновляет кэш сама (put), и повторного парсинга не происходит.
+
+    Производные структуры (например, поисковый индекс) кладутся под своим ключом
+    с source= путем файла, из которого они построены.
+    """
+
+    def __init__(self, max_entries=1000, max_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # path -> (signature, value, size)
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def total_bytes(self):
+        return self._bytes
+
+    def get(self, path, loader, source=None):
+        """Возвращает значение из кэша или загружает его через loader()"""
+        value = self.peek(path, source)
+        if value is not None:
+            return value
+        with self._lock:
+            self.misses += 1
+        signature = _file_signature(source or path)
+        value = loader()
+        self._store(path, signature, value)
+        return value
+
+    def peek(self, path, source=None):
+        """Значение из кэша, если файл не менялся с момента загрузки; иначе None"""
+        signature = _file_signature(source or path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None:
+                return None
+            if entry[0] != signature:
+                self._drop(path)
+                return None
+            self._entries.move_to_end(path)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, path, value, source=None):
+        """Сохраняет значение после записи в файл (сквозная запись)"""
+        self._store(path, _file_signature(source or path), value)
+
+    def invalidate(self, path):
+        with self._lock:
+            self._drop(path)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _store(self, path, signature, value):
+        size = _estimate_size(value)
+        with self._lock:
+            self._drop(path)
+            if size > self.max_bytes:
+                # Слишком большой объект не кэшируем, чтобы не вытеснить всех остальных
+                return
+            self._entries[path] = (signature, value, size)
+            self._bytes += size
+            self._evict()
+
+    def _drop(self, path):
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, (_, _, size) = self._entries.popitem(last=False)
+            self._bytes -= size
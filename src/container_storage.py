@@ -0,0 +1,260 @@
+import os
+import sys
+import glob
+import json
+import shutil
+import hashlib
+
+from src.rollup import MonthlyRollup
+from src.storage import FinanceStorage, COLUMNS, LEDGER_COLUMNS, DATE_FORMAT, atomic_write, locked, pd
+from src.metrics import instrument_storage
+
+# Первая строка контейнера (настройки) занимает целое число таких блоков и дополняется
+# пробелами: смена валюты или бюджета перезаписывает ее на месте, не трогая траты
+META_BLOCK = 4096
+
+
+def shard_path(data_dir, user_id):
+    """data/users/<2 hex-символа хэша id>/<id>.fin - 256 каталогов вместо одного плоского"""
+    shard = hashlib.sha1(str(user_id).encode("utf-8")).hexdigest()[:2]
+    return os.path.join(data_dir, "users", shard, f"{user_id}.fin")
+
+
+def encode_meta(meta, size=META_BLOCK):
+    data = json.dumps(meta, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    while len(data) + 1 > size:
+        size += META_BLOCK
+    return data.ljust(size - 1) + b"\n"
+
+
+@instrument_storage
+class ContainerFinanceStorage(FinanceStorage):
+    """
+    Все данные пользователя в одном файле-контейнере:
+    первая строка - JSON с валютой и бюджетами, дальше - тот же CSV трат, что у FinanceStorage.
+
+    Траты по-прежнему только дописываются в конец, настройки читаются вместе с ними
+    одним open. Итоги по месяцам ({id}_rollup.json) - производные данные, лежат рядом.
+    """
+
+    backend = "container"
+
+    def __init__(self, filename, cache=None):
+        super().__init__(filename, cache)
+        self.meta_key = f"{filename}#meta"
+
+    def _skip_preamble(self, f):
+        f.readline()
+
+    # --- НАСТРОЙКИ (ПЕРВАЯ СТРОКА) ---
+    def _read_meta(self):
+        if not os.path.exists(self.filename):
+            return {"currency": "$", "budgets": {}}
+        with open(self.filename, "rb") as f:
+            return json.loads(f.readline())
+
+    def _load_meta(self):
+        if self.cache is not None:
+            return self.cache.get(self.meta_key, self._read_meta, source=self.filename)
+        return self._read_meta()
+
+    def _peek_derived(self):
+        """Все, что кэшируется по отпечатку контейнера, - чтобы вернуть в кэш после записи"""
+        if self.cache is None:
+            return {}
+        keys = (self.filename, self.search_key, self.meta_key)
+        return {key: self.cache.peek(key, source=self.filename) for key in keys}
+
+    def _restore_derived(self, derived, **updates):
+        derived.update(updates)
+        for key, value in derived.items():
+            if value is not None:
+                self.cache.put(key, value, source=self.filename)
+
+    def _create(self):
+        meta = self._read_meta()
+        header = (",".join(COLUMNS) + "\n").encode("utf-8")
+
+        def write(tmp):
+            with open(tmp, "wb") as f:
+                f.write(encode_meta(meta) + header)
+        atomic_write(self.filename, write)
+
+    def _write_meta(self, meta):
+        """Перезаписывает первую строку; если новая не помещается в старый размер - весь файл"""
+        if not os.path.exists(self.filename):
+            self._create()
+        derived = self._peek_derived()
+        with open(self.filename, "r+b") as f:
+            old_size = len(f.readline())
+            line = encode_meta(meta, old_size)
+            if len(line) == old_size:
+                f.seek(0)
+                f.write(line)
+                line = None
+        if line is not None:
+            def write(tmp):
+                with open(self.filename, "rb") as src, open(tmp, "wb") as dst:
+                    src.readline()
+                    dst.write(line)
+                    shutil.copyfileobj(src, dst)
+            atomic_write(self.filename, write)
+            # Размер файла изменился - итоги по месяцам пересчитаются при следующем чтении
+        if self.cache is not None:
+            self._restore_derived(derived, **{self.meta_key: meta})
+
+    def get_currency(self):
+        return self._load_meta().get("currency", "$")
+
+    def _legacy_currency(self):
+        meta = self._load_meta()
+        return meta.get("legacy_currency") or meta.get("currency", "$")
+
+    @locked
+    def set_currency(self, currency_symbol):
+        meta = self._load_meta()
+        meta = dict(meta, currency=currency_symbol, legacy_currency=self._pinned_legacy(meta))
+        self._write_meta(meta)
+
+    def _load_budgets(self):
+        return self._read_budgets()
+
+    def _read_budgets(self):
+        budgets = self._load_meta().get("budgets", {})
+        rows = [(int(key[:4]), int(key[5:7]), float(amount)) for key, amount in sorted(budgets.items())]
+        return pd.DataFrame(rows, columns=["year", "month", "amount"])
+
+    @locked
+    def set_budget(self, amount):
+        now = pd.Timestamp.now()
+        meta = self._load_meta()
+        budgets = dict(meta.get("budgets", {}), **{f"{now.year:04d}-{now.month:02d}": float(amount)})
+        self._write_meta(dict(meta, budgets=budgets))
+
+    # --- ТРАТЫ ---
+    def _append_rows(self, rows):
+        if not os.path.exists(self.filename):
+            self._create()
+        meta = self.cache.peek(self.meta_key, source=self.filename) if self.cache is not None else None
+        super()._append_rows(rows)
+        if meta is not None:
+            self.cache.put(self.meta_key, meta, source=self.filename)
+
+    def _write_frame(self, df):
+        meta = self._load_meta()
+
+        def write(tmp):
+            with open(tmp, "wb") as f:
+                f.write(encode_meta(meta))
+                f.write(df.to_csv(index=False, date_format=DATE_FORMAT).encode("utf-8"))
+        atomic_write(self.filename, write)
+        if self.cache is not None:
+            self.cache.invalidate(self.filename)
+            self.cache.invalidate(self.search_key)
+            self.cache.put(self.meta_key, meta, source=self.filename)
+
+    @locked
+    def delete_last_expense(self):
+        meta = self.cache.peek(self.meta_key, source=self.filename) if self.cache is not None else None
+        deleted = super().delete_last_expense()
+        if meta is not None:
+            self.cache.put(self.meta_key, meta, source=self.filename)
+        return deleted
+
+    @locked
+    def reset_data(self):
+        # Траты и бюджеты удаляем, валюту оставляем
+        meta = dict(self._load_meta(), budgets={})
+        header = (",".join(COLUMNS) + "\n").encode("utf-8")
+
+        def write(tmp):
+            with open(tmp, "wb") as f:
+                f.write(encode_meta(meta) + header)
+        atomic_write(self.filename, write)
+        if self.cache is not None:
+            self.cache.invalidate(self.filename)
+            self.cache.invalidate(self.search_key)
+            self.cache.put(self.meta_key, meta, source=self.filename)
+        self._save_rollup(MonthlyRollup())
+
+
+def open_storage(data_dir, user_id, cache=None):
+    """
+    Хранилище пользователя в шардированной раскладке. Пока пользователь не перенесен
+    (контейнера нет, а старые data/{id}_finance.csv и т.п. есть) - работаем со старыми файлами.
+    """
+    path = shard_path(data_dir, user_id)
+    if not os.path.exists(path):
+        legacy = FinanceStorage(os.path.join(data_dir, f"{user_id}_finance.csv"), cache=cache)
+        if any(os.path.exists(p) for p in (legacy.filename, legacy.budget_filename, legacy.config_filename)):
+            return legacy
+    return ContainerFinanceStorage(path, cache=cache)
+
+
+def _legacy_user_ids(data_dir):
+    ids = set()
+    for pattern, suffix in (("*_finance.csv", "_finance.csv"), ("*_budget.csv", "_budget.csv"), ("*_config.json", "_config.json")):
+        for filename in glob.glob(os.path.join(data_dir, pattern)):
+            user_id = os.path.basename(filename)[:-len(suffix)]
+            if user_id.lstrip("-").isdigit():
+                ids.add(user_id)
+    return sorted(ids, key=int)
+
+
+def migrate(data_dir="data"):
+    """
+    Собирает data/{id}_finance.csv, _budget.csv и _config.json в контейнеры data/users/xx/{id}.fin.
+    Уже перенесенные пользователи пропускаются (в контейнере могут быть новые траты).
+    Старые файлы не удаляются: после проверки их можно убрать вручную.
+    """
+    migrated = 0
+    for user_id in _legacy_user_ids(data_dir):
+        path = shard_path(data_dir, user_id)
+        if os.path.exists(path):
+            continue
+        legacy = FinanceStorage(os.path.join(data_dir, f"{user_id}_finance.csv"))
+        budgets = legacy._load_budgets()
+        meta = {
+            "currency": legacy.get_currency(),
+            "legacy_currency": legacy._legacy_currency(),
+            "budgets": {f"{int(y):04d}-{int(m):02d}": float(a)
+                        for y, m, a in budgets[["year", "month", "amount"]].itertuples(index=False)},
+        }
+        header = legacy._read_header()
+
+        def write(tmp):
+            with open(tmp, "w+b") as f:
+                f.write(encode_meta(meta))
+                if header in (COLUMNS, LEDGER_COLUMNS):
+                    # Формат тот же - копируем байты как есть, без разбора CSV
+                    with open(legacy.filename, "rb") as src:
+                        shutil.copyfileobj(src, f)
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        f.write(b"\n")
+                elif header is None:
+                    f.write((",".join(COLUMNS) + "\n").encode("utf-8"))
+                else:
+                    f.write(legacy._load_data()[COLUMNS].to_csv(index=False, date_format=DATE_FORMAT).encode("utf-8"))
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        atomic_write(path, write)
+        migrated += 1
+        print(f"OK  {user_id} -> {path}")
+    return migrated
+
+
+def main(argv=None):
+    """python -m src.container_storage migrate [data]"""
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] != "migrate":
+        print(main.__doc__)
+        return 2
+    data_dir = argv[1] if len(argv) > 1 else "data"
+    count = migrate(data_dir)
+    print(f"Перенесено пользователей: {count}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
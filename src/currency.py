@@ -0,0 +1,184 @@
+"""
+Курсы валют и пересчет сумм между валютами.
+
+Курсы лежат в локальном CSV (RATES_PATH, по умолчанию data/rates.csv):
+
+    date,currency,rate
+    2024-03-01,EUR,0.92
+    2024-03-01,RUB,91.5
+
+rate - сколько единиц валюты дают за 1 USD на эту дату. Валюта - ISO-код или символ
+из меню /currency. Для даты траты берется последний курс не позже нее (если трата
+раньше первого курса - самый ранний). Файл читается один раз и перечитывается,
+когда меняется (обновлять его можно из cron, не перезапуская бота).
+
+Валюты без единого курса в таблице не пересчитываются (считаются 1:1), а итоги
+помечаются: Totals.unconverted - их коды, и бот пишет об этом в ответе.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from src.cache import _file_signature
+from src.startup import lazy_import
+
+pd = lazy_import("pandas")
+np = lazy_import("numpy")
+
+# Символы из меню /currency -> ISO-коды в таблице курсов
+SYMBOLS = {
+    "$": "USD",
+    "€": "EUR",
+    "₽": "RUB",
+    "Br": "BYN",
+    "din": "RSD",
+    "Kč": "CZK",
+    "₾": "GEL",
+    "E£": "EGP",
+}
+# Валюта, к которой заданы курсы
+BASE = "USD"
+RATES_PATH = os.getenv("RATES_PATH", os.path.join("data", "rates.csv"))
+
+
+class Totals(dict):
+    """{категория: сумма} плюс unconverted - коды валют, для которых не нашлось курса"""
+
+    def __init__(self, totals=(), unconverted=()):
+        super().__init__(totals)
+        self.unconverted = tuple(unconverted)
+
+    def copy(self):
+        return Totals(self, self.unconverted)
+
+
+def unconverted_of(*totals):
+    """Коды валют без курса по нескольким итогам (обычные dict - без таких валют)"""
+    return tuple(sorted({code for t in totals for code in getattr(t, "unconverted", ())}))
+
+
+def code_of(currency):
+    """Символ или код валюты -> ISO-код"""
+    currency = str(currency)
+    return SYMBOLS.get(currency, currency.upper())
+
+
+class RateTable:
+    """Курсы к USD по датам, в памяти - один DataFrame date/code/rate, отсортированный по дате"""
+
+    def __init__(self, path=RATES_PATH):
+        self.path = path
+        self._signature = None
+        self._table = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        signature = _file_signature(self.path)
+        with self._lock:
+            if self._table is None or signature != self._signature:
+                self._table = self._read()
+                self._signature = signature
+            return self._signature, self._table
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return pd.DataFrame({"date": pd.Series(dtype="datetime64[ns]"), "code": pd.Series(dtype=str),
+                                 "rate": pd.Series(dtype=float)})
+        df = pd.read_csv(self.path, parse_dates=["date"])
+        return pd.DataFrame({
+            "date": df["date"].astype("datetime64[ns]"),
+            "code": df["currency"].map(code_of),
+            "rate": pd.to_numeric(df["rate"], errors="coerce"),
+        }).dropna().sort_values("date", kind="stable", ignore_index=True)
+
+    @property
+    def version(self):
+        """Меняется вместе с файлом курсов: часть ключа кэша пересчитанных итогов"""
+        return self._load()[0]
+
+    def rates_at(self, dates, codes):
+        """Курсы к USD для пар (дата, код) - два merge_asof на весь столбец. Неизвестные - NaN"""
+        table = self._load()[1]
+        left = pd.DataFrame({"date": pd.to_datetime(dates).astype("datetime64[ns]"), "code": codes,
+                             "row": np.arange(len(codes))}).sort_values("date", kind="stable")
+        merged = pd.merge_asof(left, table, on="date", by="code", direction="backward")
+        missing = merged["rate"].isna().to_numpy()
+        if missing.any():
+            # Трата раньше первого курса валюты - берем самый ранний
+            earlier = pd.merge_asof(left[missing], table, on="date", by="code", direction="forward")
+            merged.loc[missing, "rate"] = earlier["rate"].to_numpy()
+        merged.loc[merged["code"] == BASE, "rate"] = 1.0
+        return merged.sort_values("row")["rate"].to_numpy()
+
+    def convert_cents(self, cents, currencies, dates, target, missing=None):
+        """
+        Суммы в копейках (по валютам currencies на даты dates) -> копейки в валюте target.
+        Суммы, для которых нет курса, остаются как есть; их коды добавляются в set missing.
+        """
+        cents = np.asarray(cents, dtype="int64")
+        codes = pd.Series(currencies, dtype=object).map(code_of).to_numpy()
+        target_code = code_of(target)
+        foreign = codes != target_code
+        if not foreign.any():
+            return cents
+        dates = pd.Series(dates).to_numpy()[foreign]
+        ratio = self.rates_at(dates, np.full(len(dates), target_code, dtype=object)) / \
+            self.rates_at(dates, codes[foreign])
+        unknown = np.isnan(ratio)
+        if unknown.any():
+            # Какой из двух курсов отсутствует - неважно: пара не пересчитывается
+            codes_missing = set(codes[foreign][unknown])
+            print(f"[currency] нет курса {sorted(codes_missing)} -> {target_code}, суммы не пересчитаны")
+            if missing is not None:
+                missing.update(str(code) for code in codes_missing)
+            ratio[unknown] = 1.0
+        result = cents.copy()
+        result[foreign] = np.round(cents[foreign] * ratio).astype("int64")
+        return result
+
+
+def category_totals(df, target, table=None):
+    """
+    Totals {категория: сумма в target} по DataFrame с колонками date/category/currency
+    и amount (или amount_cents) - один векторный пересчет и один group-by.
+    """
+    if df.empty:
+        return Totals()
+    table = table or rates
+    missing = set()
+    cents = df["amount_cents"] if "amount_cents" in df.columns else pd.to_numeric(df["amount"]).mul(100).round()
+    converted = table.convert_cents(cents, df["currency"].astype(str), df["date"], target, missing)
+    sums = pd.Series(converted, index=df.index).groupby(df["category"].astype(str)).sum()
+    return Totals({str(category): int(total) / 100 for category, total in sums.items() if total}, sorted(missing))
+
+
+class ConvertedTotals:
+    """
+    Пересчитанные в другую валюту итоги месяца: (пользователь, YYYY-MM, валюта) -> {категория: сумма}.
+    Запись актуальна, пока не изменились данные пользователя (storage.data_version()) и файл курсов.
+    """
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (пользователь, месяц, валюта) -> (версия, итоги)
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key, version, build):
+        version = (version, rates.version)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                return entry[1].copy()
+
+        totals = build()
+        with self._lock:
+            self._entries[key] = (version, totals)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return totals.copy()
+
+
+rates = RateTable()
+converted_totals = ConvertedTotals()
@@ -0,0 +1,110 @@
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+def chat_id_of(update):
+    """Чат, к которому относится апдейт (None - если чата нет, например inline-запрос)"""
+    for name in ("message", "edited_message", "channel_post", "edited_channel_post"):
+        message = getattr(update, name, None)
+        if message is not None:
+            return message.chat.id
+    call = getattr(update, "callback_query", None)
+    if call is not None and call.message is not None:
+        return call.message.chat.id
+    return None
+
+
+class ChatDispatcher:
+    """
+    Выполняет задачи на общем пуле потоков: разные чаты - параллельно,
+    задачи одного чата - строго по очереди и в порядке поступления.
+
+    У каждого чата своя очередь. Пока она не пуста, в пуле стоит ровно одна задача
+    на ее разбор; после каждого апдейта она переставляется в конец пула, чтобы
+    один активный чат не занимал поток надолго.
+
+    Всего в очередях не больше max_pending задач: submit ждет, пока место освободится.
+    Так всплеск апдейтов не копится в памяти, а поток polling/webhook перестает
+    забирать новые (поэтому submit нельзя вызывать из самих задач).
+    """
+
+    def __init__(self, workers=4, max_pending=1000):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chat")
+        self._queues = {}  # chat_id -> deque задач
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._room = threading.Condition(self._lock)
+        self._pending = 0
+
+    def submit(self, chat_id, fn, *args, **kwargs):
+        # Апдейты без чата упорядочивать не с чем - у каждого своя "очередь"
+        key = chat_id if chat_id is not None else object()
+        with self._lock:
+            self._room.wait_for(lambda: self._pending < self.max_pending)
+            self._pending += 1
+            tasks = self._queues.get(key)
+            if tasks is not None:
+                tasks.append((fn, args, kwargs))
+                return
+            self._queues[key] = deque([(fn, args, kwargs)])
+        self._executor.submit(self._run_next, key)
+
+    def pending(self):
+        """Сколько задач ждет или выполняется сейчас"""
+        with self._lock:
+            return self._pending
+
+    def join(self, timeout=None):
+        """Ждет, пока все поставленные задачи выполнятся"""
+        with self._lock:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def _run_next(self, key):
+        with self._lock:
+            fn, args, kwargs = self._queues[key][0]
+        try:
+            fn(*args, **kwargs)
+        except Exception as e:
+            print(f"Error dispatcher: {e}")
+        finally:
+            with self._lock:
+                tasks = self._queues[key]
+                tasks.popleft()
+                self._pending -= 1
+                self._room.notify()
+                if not tasks:
+                    del self._queues[key]
+                if self._pending == 0:
+                    self._idle.notify_all()
+                more = key in self._queues
+            if more:
+                self._executor.submit(self._run_next, key)
+
+    def attach(self, bot):
+        """
+        Подменяет bot.process_new_updates: апдейты раскладываются по чатам и
+        обрабатываются на пуле. Бот нужно создавать с threaded=False, чтобы
+        обработчики выполнялись прямо в потоке пула.
+
+        Доставка - не более одного раза: смещение getUpdates сдвигается, когда апдейт
+        поставлен в очередь, а не когда обработан (иначе polling получал бы его снова,
+        пока он ждет своей очереди). Если бот упадет или будет перезапущен, принятые,
+        но не обработанные апдейты теряются - не больше max_pending штук.
+        """
+        process = bot.process_new_updates
+
+        def process_new_updates(updates):
+            for update in updates:
+                # Смещение для getUpdates двигаем сразу, иначе polling получит те же апдейты повторно
+                if update.update_id > bot.last_update_id:
+                    bot.last_update_id = update.update_id
+                self.submit(chat_id_of(update), process, [update])
+
+        bot.process_new_updates = process_new_updates
+        return bot
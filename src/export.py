@@ -0,0 +1,216 @@
+import os
+import io
+import gzip
+import shutil
+import threading
+import importlib.util
+import tempfile
+from collections import OrderedDict
+from datetime import datetime
+
+from src.storage import LEDGER_COLUMNS, DATE_FORMAT
+
+# CSV больше этого размера отправляем сжатым
+GZIP_THRESHOLD = 1024 * 1024
+# Выгрузки до этого размера держим в памяти, большие - файлами в EXPORT_DIR
+SPOOL_MAX_BYTES = 512 * 1024
+# Только под выгрузки: оставшееся от прошлого запуска удаляет clear_export_dir()
+EXPORT_DIR = os.getenv("EXPORT_DIR", os.path.join(tempfile.gettempdir(), "finance-bot-exports"))
+
+PERIODS = {
+    "month": "Этот месяц",
+    "prev": "Прошлый месяц",
+    "year": "Этот год",
+    "all": "Всё время",
+}
+FORMATS = {
+    "csv": "CSV",
+    "xlsx": "Excel",
+    "parquet": "Parquet",
+}
+# Для каких форматов нужен необязательный пакет
+FORMAT_DEPENDENCIES = {"xlsx": "openpyxl", "parquet": "pyarrow"}
+
+
+def available_formats():
+    """Форматы, для которых установлены зависимости (CSV есть всегда)"""
+    return [fmt for fmt in FORMATS
+            if fmt not in FORMAT_DEPENDENCIES or importlib.util.find_spec(FORMAT_DEPENDENCIES[fmt]) is not None]
+
+
+def period_range(period, now=None):
+    """(начало, конец) периода; None - без ограничения"""
+    now = now or datetime.now()
+    month_start = datetime(now.year, now.month, 1)
+    if period == "month":
+        return month_start, None
+    if period == "prev":
+        prev_start = datetime(now.year - 1, 12, 1) if now.month == 1 else datetime(now.year, now.month - 1, 1)
+        return prev_start, month_start
+    if period == "year":
+        return datetime(now.year, 1, 1), None
+    if period == "all":
+        return None, None
+    raise ValueError(f"Неизвестный период: {period}")
+
+
+def _write_csv(frames, out):
+    out.write((",".join(LEDGER_COLUMNS) + "\n").encode("utf-8"))
+    rows = 0
+    for frame in frames:
+        # В памяти только текст одного куска
+        text = frame.to_csv(index=False, header=False, date_format=DATE_FORMAT, lineterminator="\n")
+        out.write(text.encode("utf-8"))
+        rows += len(frame)
+    return rows
+
+
+def _write_xlsx(frames, out):
+    import openpyxl
+
+    # write_only: строки сразу уходят в поток, а не копятся в модели книги
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("Расходы")
+    sheet.append(LEDGER_COLUMNS)
+    rows = 0
+    for frame in frames:
+        for date, category, amount, note, currency in frame.itertuples(index=False):
+            sheet.append([date.to_pydatetime(), category, float(amount), note, currency])
+        rows += len(frame)
+    workbook.save(out)
+    return rows
+
+
+def _write_parquet(frames, out):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([("date", pa.timestamp("us")), ("category", pa.string()),
+                        ("amount", pa.float64()), ("note", pa.string()), ("currency", pa.string())])
+    rows = 0
+    with pq.ParquetWriter(out, schema) as writer:
+        for frame in frames:
+            frame = frame.astype({"category": str, "amount": float, "note": str, "currency": str})
+            writer.write_table(pa.Table.from_pandas(frame, schema=schema, preserve_index=False))
+            rows += len(frame)
+    return rows
+
+
+WRITERS = {"csv": _write_csv, "xlsx": _write_xlsx, "parquet": _write_parquet}
+
+
+def _temp_file():
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    return tempfile.NamedTemporaryFile(prefix="export_", dir=EXPORT_DIR, delete=False)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def clear_export_dir():
+    """Удаляет выгрузки, оставшиеся от прошлого запуска (вызывается при старте)"""
+    if not os.path.isdir(EXPORT_DIR):
+        return
+    for name in os.listdir(EXPORT_DIR):
+        if name.startswith("export_"):
+            _remove(os.path.join(EXPORT_DIR, name))
+
+
+class Export:
+    """
+    Готовый файл выгрузки + имя для Telegram. Небольшая выгрузка хранится в памяти (data),
+    большая - во временном файле в EXPORT_DIR (path), который удаляет close().
+    """
+
+    def __init__(self, path, filename, rows, data=None):
+        self.path = path
+        self.filename = filename
+        self.rows = rows
+        self.data = data
+
+    def open(self):
+        """
+        Новый дескриптор с начала: у каждой отправки своя позиция чтения,
+        и отправка из очереди дочитает файл, даже если кэш уже закрыл выгрузку
+        """
+        if self.data is not None:
+            return io.BytesIO(self.data)
+        return open(self.path, "rb")
+
+    def close(self):
+        if self.path is not None:
+            _remove(self.path)
+
+
+def build_export(storage, period="all", fmt="csv", now=None, chunksize=50000):
+    """
+    Собирает выгрузку потоком: куски истории из storage.iter_frames сразу пишутся
+    во временный файл, без сборки всей истории в один DataFrame. Если сборка
+    прервалась ошибкой, временные файлы удаляются.
+    """
+    if fmt not in WRITERS or fmt not in available_formats():
+        raise ValueError(f"Формат {fmt} недоступен")
+    start, end = period_range(period, now)
+    filename = f"expenses_{period}.{fmt}"
+    paths = []
+    try:
+        with _temp_file() as out:
+            paths.append(out.name)
+            rows = WRITERS[fmt](storage.iter_frames(start, end, chunksize), out)
+            size = out.tell()
+
+        if fmt == "csv" and size > GZIP_THRESHOLD:
+            with open(paths[-1], "rb") as raw, _temp_file() as compressed:
+                paths.append(compressed.name)
+                with gzip.GzipFile(fileobj=compressed, mode="wb", filename=filename) as gz:
+                    shutil.copyfileobj(raw, gz)
+                size = compressed.tell()
+            _remove(paths[0])
+            filename += ".gz"
+
+        if size <= SPOOL_MAX_BYTES:
+            with open(paths[-1], "rb") as f:
+                data = f.read()
+            _remove(paths[-1])
+            return Export(None, filename, rows, data)
+    except BaseException:
+        for path in paths:
+            _remove(path)
+        raise
+
+    return Export(paths[-1], filename, rows)
+
+
+class ExportCache:
+    """
+    Последняя выгрузка каждого пользователя. Отдается повторно, пока не изменились
+    данные (storage.data_version()) и параметры (период, формат, границы периода).
+    """
+
+    def __init__(self, max_users=64):
+        self.max_users = max_users
+        self._entries = OrderedDict()  # user_key -> (ключ, Export)
+        self._lock = threading.Lock()
+
+    def get_or_build(self, user_key, storage, period, fmt, now=None):
+        key = (period, fmt, period_range(period, now), storage.data_version())
+        with self._lock:
+            entry = self._entries.get(user_key)
+            if entry is not None and entry[0] == key:
+                self._entries.move_to_end(user_key)
+                return entry[1]
+
+        export = build_export(storage, period, fmt, now)
+        with self._lock:
+            old = self._entries.pop(user_key, None)
+            if old is not None:
+                old[1].close()
+            self._entries[user_key] = (key, export)
+            while len(self._entries) > self.max_users:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                evicted.close()
+        return export
@@ -0,0 +1,199 @@
+import csv
+import importlib.util
+
+from src.startup import lazy_import
+from src.storage import COLUMNS, hash_records
+
+pd = lazy_import("pandas")
+
+# Как называются нужные колонки в выгрузках разных банков (сравнение без регистра)
+COLUMN_ALIASES = {
+    "date": ["date", "дата", "дата операции", "дата платежа", "дата транзакции", "transaction date", "posting date"],
+    "category": ["category", "категория", "категория операции", "тип операции"],
+    "amount": ["amount", "сумма", "сумма операции", "сумма платежа", "сумма в валюте счета", "sum"],
+    "note": ["note", "описание", "описание операции", "комментарий", "назначение платежа", "description", "merchant"],
+}
+DEFAULT_CATEGORY = "Импорт"
+SUPPORTED_EXTENSIONS = (".csv", ".txt", ".xlsx")
+
+
+def xlsx_supported():
+    """XLSX читаем только если установлен openpyxl (необязательная зависимость)"""
+    return importlib.util.find_spec("openpyxl") is not None
+
+
+def map_columns(columns):
+    """{колонка файла: поле FinanceStorage}; без даты или суммы импорт невозможен"""
+    normalized = {str(c).strip().lower(): c for c in columns}
+    mapping = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in normalized:
+                mapping[normalized[alias]] = field
+                break
+    missing = {"date", "amount"} - set(mapping.values())
+    if missing:
+        raise ValueError(f"Не нашел колонки: {', '.join(sorted(missing))}. Есть: {', '.join(map(str, columns))}")
+    return mapping
+
+
+def _detect_csv_format(path):
+    """Кодировка (utf-8 или cp1251, как у выгрузок российских банков) и разделитель"""
+    with open(path, "rb") as f:
+        sample = f.read(64 * 1024)
+    try:
+        text = sample.decode("utf-8-sig")
+        encoding = "utf-8-sig"
+    except UnicodeDecodeError:
+        text = sample.decode("cp1251", errors="replace")
+        encoding = "cp1251"
+    try:
+        delimiter = csv.Sniffer().sniff(text.split("\n", 1)[0], delimiters=",;\t").delimiter
+    except csv.Error:
+        delimiter = ","
+    return encoding, delimiter
+
+
+def _csv_chunks(path, chunksize):
+    encoding, delimiter = _detect_csv_format(path)
+    yield from pd.read_csv(path, sep=delimiter, encoding=encoding, dtype=str,
+                           chunksize=chunksize, skipinitialspace=True)
+
+
+def _xlsx_chunks(path, chunksize):
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = None
+        for row in rows:
+            if any(cell is not None for cell in row):
+                header = [str(cell).strip() if cell is not None else "" for cell in row]
+                break
+        if header is None:
+            return
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= chunksize:
+                yield pd.DataFrame(batch, columns=header).fillna("").astype(str)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=header).fillna("").astype(str)
+    finally:
+        workbook.close()
+
+
+def read_chunks(path, chunksize=5000):
+    """Файл выписки кусками по chunksize строк, без загрузки целиком"""
+    if path.lower().endswith(".xlsx"):
+        if not xlsx_supported():
+            raise ValueError("Для XLSX нужен пакет openpyxl. Пришли выписку в CSV.")
+        return _xlsx_chunks(path, chunksize)
+    return _csv_chunks(path, chunksize)
+
+
+def _parse_amounts(values):
+    cleaned = (values.astype(str)
+               .str.replace("\u00a0", "", regex=False)
+               .str.replace(" ", "", regex=False)
+               .str.replace(",", ".", regex=False))
+    return pd.to_numeric(cleaned, errors="coerce")
+
+
+def _parse_dates(values):
+    """
+    Даты выписки: ISO (2024-03-01, 2024-03-01 10:00 - так же даты из XLSX) разбираются
+    как есть, остальное (01.03.2024) - день первым. Формат определяется для каждой строки,
+    а не по первой, поэтому разные форматы в одном файле не превращаются в NaT.
+    """
+    values = values.astype(str).str.strip()
+    iso = values.str.match(r"^\d{4}-\d{2}-\d{2}")
+    dates = pd.Series(pd.NaT, index=values.index, dtype="datetime64[ns]")
+    if iso.any():
+        dates[iso] = pd.to_datetime(values[iso], format="ISO8601", errors="coerce")
+    if (~iso).any():
+        dates[~iso] = pd.to_datetime(values[~iso], format="mixed", dayfirst=True, errors="coerce")
+    return dates
+
+
+def _one_line(values):
+    """Многострочные описания банка -> одна строка: переводы строк и пробелы схлопываются в пробел"""
+    return values.astype(str).str.replace(r"\s+", " ", regex=True).str.strip()
+
+
+def normalize_chunk(chunk, mapping, expenses_are_negative):
+    """Кусок выписки -> DataFrame в схеме date/category/amount/note; битые строки отбрасываются"""
+    chunk = chunk.rename(columns=mapping)
+    df = pd.DataFrame({
+        "date": _parse_dates(chunk["date"]),
+        "category": _one_line(chunk["category"].fillna(DEFAULT_CATEGORY)) if "category" in chunk else DEFAULT_CATEGORY,
+        "amount": _parse_amounts(chunk["amount"]),
+        "note": _one_line(chunk["note"].fillna("")) if "note" in chunk else "",
+    }, columns=COLUMNS)
+    df = df.dropna(subset=["date", "amount"])
+    if expenses_are_negative:
+        # В выписке расходы со знаком минус, поступления (зарплата, кэшбэк) не импортируем
+        df = df[df["amount"] < 0].copy()
+        df["amount"] = -df["amount"]
+    df = df[df["amount"] > 0]
+    df.loc[df["category"].isin(["", "nan"]), "category"] = DEFAULT_CATEGORY
+    df.loc[df["note"] == "nan", "note"] = ""
+    return df
+
+
+def expenses_are_negative(path, chunksize=5000):
+    """
+    Есть ли в выписке отрицательные суммы - по всему файлу, а не по первому куску:
+    поступления в начале выписки не должны превратиться в траты. Читается до первого минуса.
+    """
+    amount_column = None
+    for chunk in read_chunks(path, chunksize):
+        if amount_column is None:
+            amount_column = next(c for c, f in map_columns(chunk.columns).items() if f == "amount")
+        if (_parse_amounts(chunk[amount_column]) < 0).any():
+            return True
+    return False
+
+
+def import_statement(path, storage, chunksize=5000, progress=None):
+    """
+    Потоковый импорт выписки в хранилище пользователя.
+
+    Каждый кусок нормализуется, очищается от дублей по хэшам (и уже сохраненных записей,
+    и строк этого же файла) и записывается одной пакетной операцией add_expenses.
+    progress(обработано_строк, добавлено) вызывается после каждого куска.
+    Возвращает {"rows", "added", "duplicates", "skipped"}.
+    """
+    seen = storage.record_hashes()
+    result = {"rows": 0, "added": 0, "duplicates": 0, "skipped": 0}
+    mapping = None
+    # Есть минусы - значит, это выписка с поступлениями: импортируем только расходы
+    negative = expenses_are_negative(path, chunksize)
+
+    for chunk in read_chunks(path, chunksize):
+        if mapping is None:
+            mapping = map_columns(chunk.columns)
+        result["rows"] += len(chunk)
+
+        df = normalize_chunk(chunk, mapping, negative)
+        result["skipped"] += len(chunk) - len(df)
+
+        hashes = hash_records(df)
+        fresh = []
+        for h in hashes:
+            fresh.append(h not in seen)
+            seen.add(h)
+        df = df[fresh] if len(df) else df
+        result["duplicates"] += len(hashes) - len(df)
+
+        if len(df):
+            storage.add_expenses(df.to_dict("records"))
+            result["added"] += len(df)
+        if progress is not None:
+            progress(result["rows"], result["added"])
+
+    if mapping is None:
+        raise ValueError("Файл пустой")
+    return result
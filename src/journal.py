@@ -0,0 +1,402 @@
+import os
+import json
+import atexit
+import threading
+from datetime import datetime
+
+from src.storage import DATE_FORMAT, budget_summary
+from src.records import Record
+
+
+def _encode(key, row):
+    return json.dumps({
+        "u": key,
+        "d": row["date"].strftime(DATE_FORMAT),
+        "c": row["category"],
+        "a": float(row["amount"]),
+        "n": row["note"],
+        "cur": row.get("currency"),
+    }, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+def _decode(line):
+    entry = json.loads(line)
+    return entry["u"], {
+        "date": datetime.strptime(entry["d"], DATE_FORMAT),
+        "category": entry["c"],
+        "amount": entry["a"],
+        "note": entry["n"],
+        "currency": entry.get("cur"),
+    }
+
+
+def _marker(key, kind, count):
+    """
+    Отметка переноса одного пользователя (WriteJournal.flush_user):
+    "f" - первые count его записей в журнале переносятся в хранилище,
+    "r" - перенос не удался, эти записи снова ждут в журнале.
+    """
+    return json.dumps({"u": key, kind: count}).encode("utf-8") + b"\n"
+
+
+def read_journal(path):
+    """
+    {пользователь: (записи по порядку, сколько первых из них, возможно, уже в хранилище)}.
+    Записи, перенесенные по отметкам flush_user, не возвращаются; оборванная последняя
+    строка (сбой посреди записи) пропускается.
+    """
+    queues, maybe = {}, {}
+    if not os.path.exists(path):
+        return {}
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+                if "f" in entry:
+                    # Предыдущий перенос без отметки "r" завершился - его записи уже в хранилище
+                    queue = queues.setdefault(entry["u"], [])
+                    maybe[entry["u"]] = queue[:entry["f"]]
+                    del queue[:entry["f"]]
+                elif "r" in entry:
+                    queues[entry["u"]] = maybe.pop(entry["u"], []) + queues.get(entry["u"], [])
+                else:
+                    key, row = _decode(line)
+                    queues.setdefault(key, []).append(row)
+            except (ValueError, KeyError):
+                continue
+    batches = {}
+    for key in set(queues) | set(maybe):
+        rows = maybe.get(key, []) + queues.get(key, [])
+        if rows:
+            batches[key] = (rows, len(maybe.get(key, [])))
+    return batches
+
+
+class WriteJournal:
+    """
+    Отложенная запись трат (write-behind) для всех пользователей процесса.
+
+    append() дописывает траты в журнал на диске и в буфер в памяти и возвращается,
+    как только журнал сброшен на диск; одновременные записи разных чатов делят
+    один fsync (group commit). Фоновый поток переносит буфер в хранилища пачками -
+    по flush_rows записей или раз в flush_interval секунд. На время переноса журнал
+    переименовывается в {path}.flushing. При старте оба файла проигрываются заново,
+    поэтому подтвержденная пользователю трата не теряется при падении процесса.
+
+    open_storage(key) - настоящее хранилище пользователя (FinanceStorage и т.п.).
+    """
+
+    def __init__(self, path, open_storage, flush_rows=500, flush_interval=1.0, fsync=True):
+        self.path = path
+        self.flushing_path = f"{path}.flushing"
+        self.open_storage = open_storage
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.commits = 0       # сколько раз журнал сбрасывался на диск
+        self._pending = {}     # key -> [записи], еще не переданные в хранилище
+        self._flushing = {}    # key -> [записи], которые переносятся прямо сейчас
+        self._pending_rows = 0
+        self._written = 0      # номер последней записи в журнал
+        self._synced = 0       # номер последней записи, сброшенной на диск
+        self._file = None
+        self._lock = threading.Lock()        # буфер и файл журнала
+        self._wakeup = threading.Condition(self._lock)
+        self._sync_lock = threading.Lock()   # один fsync за раз, остальные ждут его результата
+        self._flush_lock = threading.Lock()  # один перенос в хранилища за раз
+        self._user_locks = {}
+        self._stopped = False
+        self._thread = None
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def start(self):
+        """Проигрывает журнал после прошлого запуска и запускает фоновый перенос"""
+        if self._thread is not None:
+            return self
+        self.replay()
+        self._file = open(self.path, "ab")
+        self._thread = threading.Thread(target=self._run, name="journal", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+        return self
+
+    def close(self):
+        with self._lock:
+            self._stopped = True
+            self._wakeup.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def user_lock(self, key):
+        """Блокировка пользователя: чтение "хранилище + буфер" не пересекается с переносом"""
+        with self._lock:
+            return self._user_locks.setdefault(key, threading.RLock())
+
+    # --- ЗАПИСЬ ---
+    def append(self, key, rows):
+        data = b"".join(_encode(key, row) for row in rows)
+        with self._lock:
+            self._file.write(data)
+            self._written += 1
+            seq = self._written
+            self._pending.setdefault(key, []).extend(rows)
+            self._pending_rows += len(rows)
+            if self._pending_rows >= self.flush_rows:
+                self._wakeup.notify()
+        self._commit(seq)
+
+    def _commit(self, seq):
+        with self._sync_lock:
+            if self._synced >= seq:
+                # Пока ждали блокировку, нашу запись сбросил на диск чужой fsync
+                return
+            with self._lock:
+                self._file.flush()
+                target = self._written
+                fd = self._file.fileno()
+            if self.fsync:
+                os.fsync(fd)
+            self._synced = target
+            self.commits += 1
+
+    def buffered(self, key):
+        """Записи пользователя, которых еще нет в хранилище (по порядку)"""
+        with self._lock:
+            return self._flushing.get(key, []) + self._pending.get(key, [])
+
+    def pending_rows(self):
+        with self._lock:
+            return self._pending_rows
+
+    # --- ПЕРЕНОС В ХРАНИЛИЩА ---
+    def _run(self):
+        while True:
+            with self._lock:
+                self._wakeup.wait_for(lambda: self._stopped or self._pending_rows >= self.flush_rows,
+                                      self.flush_interval)
+                if self._stopped:
+                    return
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error journal: {e}")
+
+    def flush(self):
+        """Переносит весь буфер в хранилища; возвращает число записей"""
+        with self._flush_lock:
+            with self._sync_lock, self._lock:
+                if not self._pending:
+                    return 0
+                batches = self._pending
+                self._pending = {}
+                self._pending_rows = 0
+                self._flushing = dict(batches)
+                # Новые траты идут в свежий журнал, переносимые остаются в .flushing до конца переноса
+                self._file.flush()
+                if self.fsync:
+                    os.fsync(self._file.fileno())
+                self._file.close()
+                os.replace(self.path, self.flushing_path)
+                self._file = open(self.path, "ab")
+                self._synced = self._written
+
+            failed = {}
+            for key, rows in batches.items():
+                with self.user_lock(key):
+                    try:
+                        self.open_storage(key).add_expenses(rows)
+                    except Exception as e:
+                        print(f"Error journal flush {key}: {e}")
+                        failed[key] = rows
+                    with self._lock:
+                        del self._flushing[key]
+                        if key in failed:
+                            # Вернем в начало буфера и в новый журнал - попробуем в следующий раз
+                            self._pending[key] = rows + self._pending.get(key, [])
+                            self._pending_rows += len(rows)
+            if failed:
+                self._rewrite_failed(failed)
+            os.remove(self.flushing_path)
+            return sum(len(rows) for rows in batches.values()) - sum(len(rows) for rows in failed.values())
+
+    def flush_user(self, key):
+        """
+        Переносит в хранилище буфер одного пользователя (перед чтением, которому нужны
+        все его траты); буферы остальных не трогает. Нет записей в буфере - ничего не делает.
+        """
+        with self._flush_lock:
+            with self._lock:
+                rows = self._pending.pop(key, None)
+                if not rows:
+                    return 0
+                self._pending_rows -= len(rows)
+                self._flushing[key] = rows
+                # Отметка до записи в хранилище: после сбоя эти записи сверяются с его хвостом
+                self._file.write(_marker(key, "f", len(rows)))
+                self._written += 1
+                seq = self._written
+            self._commit(seq)
+
+            with self.user_lock(key):
+                try:
+                    self.open_storage(key).add_expenses(rows)
+                    failed = False
+                except Exception as e:
+                    print(f"Error journal flush {key}: {e}")
+                    failed = True
+                with self._lock:
+                    del self._flushing[key]
+                    if failed:
+                        self._pending[key] = rows + self._pending.get(key, [])
+                        self._pending_rows += len(rows)
+                        self._file.write(_marker(key, "r", len(rows)))
+                        self._written += 1
+                        seq = self._written
+            if failed:
+                self._commit(seq)
+                return 0
+            return len(rows)
+
+    def _rewrite_failed(self, failed):
+        with self._lock:
+            for key, rows in failed.items():
+                self._file.write(b"".join(_encode(key, row) for row in rows))
+            self._written += 1
+            seq = self._written
+        self._commit(seq)
+
+    def replay(self):
+        """
+        Доносит в хранилища записи, оставшиеся в журнале после падения.
+        Пачка из .flushing могла успеть записаться целиком - тогда хвост хранилища
+        совпадает с ней, и повторно она не добавляется.
+        """
+        replayed = 0
+        for path, check_applied in ((self.flushing_path, True), (self.path, False)):
+            for key, (rows, maybe) in read_journal(path).items():
+                storage = self.open_storage(key)
+                if check_applied and self._already_applied(storage, rows):
+                    continue
+                if maybe and self._already_applied(storage, rows[:maybe]):
+                    # Сбой после переноса одного пользователя (flush_user), но до следующей отметки
+                    rows = rows[maybe:]
+                    if not rows:
+                        continue
+                storage.add_expenses(rows)
+                replayed += len(rows)
+            if os.path.exists(path):
+                os.remove(path)
+        if replayed:
+            print(f"[journal] восстановлено записей: {replayed}")
+        return replayed
+
+    @staticmethod
+    def _already_applied(storage, rows):
+        tail = storage.get_last_records(len(rows))[::-1]
+        return len(tail) == len(rows) and all(
+            r["date"] == row["date"] and r["category"] == row["category"] and float(r["amount"]) == row["amount"]
+            for r, row in zip(tail, rows)
+        )
+
+
+class BufferedFinanceStorage:
+    """
+    Хранилище пользователя поверх WriteJournal: то же API, что у FinanceStorage.
+
+    Траты уходят в журнал, а последние записи, статистика и бюджет читаются как
+    "хранилище + буфер", поэтому новая трата видна сразу. Остальные операции
+    (поиск, удаление, выгрузка...) сначала переносят в хранилище буфер этого пользователя.
+    """
+
+    def __init__(self, storage, journal, key):
+        self.storage = storage
+        self.journal = journal
+        self.key = key
+
+    def __getattr__(self, name):
+        attr = getattr(self.storage, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            self.journal.flush_user(self.key)
+            return attr(*args, **kwargs)
+        return call
+
+    # Конфиг и бюджет не зависят от буфера
+    def get_currency(self):
+        return self.storage.get_currency()
+
+    def set_currency(self, currency_symbol):
+        # Траты из буфера записываются в той валюте, в которой их вводили
+        self.journal.flush_user(self.key)
+        return self.storage.set_currency(currency_symbol)
+
+    def set_budget(self, amount):
+        return self.storage.set_budget(amount)
+
+    def get_budget(self, year, month):
+        return self.storage.get_budget(year, month)
+
+    def add_expense(self, category, amount, note=""):
+        self.journal.append(self.key, [{"date": datetime.now(), "category": category, "amount": amount, "note": note,
+                                        "currency": self.get_currency()}])
+
+    def add_expenses(self, entries):
+        now = datetime.now()
+        current = self.get_currency()
+        rows = [
+            {
+                "date": entry.get("date") or now,
+                "category": entry["category"],
+                "amount": entry["amount"],
+                "note": entry.get("note", ""),
+                "currency": entry.get("currency") or current
+            }
+            for entry in entries
+        ]
+        if rows:
+            self.journal.append(self.key, rows)
+        return len(rows)
+
+    def get_last_records(self, n=10):
+        with self.journal.user_lock(self.key):
+            records = [Record.from_row(row) for row in self.journal.buffered(self.key)[::-1][:n]]
+            if len(records) < n:
+                records += self.storage.get_last_records(n - len(records))
+        return records
+
+    def get_stats_by_month(self, year, month, currency=None):
+        current = self.get_currency()
+        if currency not in (None, current) or any(row.get("currency") not in (None, current)
+                                                   for row in self.journal.buffered(self.key)):
+            # Пересчет по курсам делает хранилище - сначала переносим туда буфер
+            self.journal.flush_user(self.key)
+            return self.storage.get_stats_by_month(year, month, currency)
+        with self.journal.user_lock(self.key):
+            stats = self.storage.get_stats_by_month(year, month).copy()
+            for row in self.journal.buffered(self.key):
+                if row["date"].year == year and row["date"].month == month:
+                    stats[row["category"]] = stats.get(row["category"], 0.0) + float(row["amount"])
+        return stats
+
+    def get_available_months(self):
+        with self.journal.user_lock(self.key):
+            months = set(self.storage.get_available_months())
+            months.update((row["date"].year, row["date"].month) for row in self.journal.buffered(self.key))
+        return sorted(months)
+
+    def get_budget_status(self):
+        now = datetime.now()
+        with self.journal.user_lock(self.key):
+            budget = self.storage.get_budget_status()["budget"]
+            return budget_summary(budget, self.get_stats_by_month(now.year, now.month), now)
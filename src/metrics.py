@@ -0,0 +1,300 @@
+import sys
+import time
+import inspect
+import functools
+import threading
+import traceback
+from collections import Counter as StackCounter
+
+# Границы корзин гистограмм задержек, секунды
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Монотонный счетчик с метками"""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels[name] for name in self.labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield self.name + _format_labels(self.labels, key), value
+
+
+class Histogram:
+    """Гистограмма в формате Prometheus: накопительные корзины, сумма и количество"""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}  # метки -> [счетчики корзин..., +Inf, сумма]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[i] += 1
+            data[-2] += 1
+            data[-1] += value
+
+    def count(self, **labels):
+        data = self._values.get(tuple(labels[name] for name in self.labels))
+        return data[-2] if data else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, list(data)) for key, data in self._values.items())
+        for key, data in items:
+            for bound, count in zip(self.buckets + ("+Inf",), data):
+                yield self.name + "_bucket" + _format_labels(self.labels, key, [("le", bound)]), count
+            yield self.name + "_sum" + _format_labels(self.labels, key), data[-1]
+            yield self.name + "_count" + _format_labels(self.labels, key), data[-2]
+
+
+class Gauge:
+    """
+    Значение, которое читается в момент запроса: fn() -> число или {значения меток: число}.
+    kind="counter" - для готовых счетчиков других объектов (например, StorageCache.hits).
+    """
+
+    def __init__(self, name, help, fn, labels=(), kind="gauge"):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.labels = tuple(labels)
+        self.kind = kind
+
+    def samples(self):
+        value = self.fn()
+        if not isinstance(value, dict):
+            value = {(): value}
+        for key, v in sorted(value.items()):
+            key = key if isinstance(key, tuple) else (key,)
+            yield self.name + _format_labels(self.labels, key), v
+
+
+class Registry:
+    """Набор метрик процесса; render() - текст для GET /metrics"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, fn, labels=(), kind="gauge"):
+        """Регистрирует (или заменяет) значение, которое считается при каждом запросе"""
+        metric = Gauge(name, help, fn, labels, kind)
+        with self._lock:
+            self._metrics[name] = metric
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                print(f"Error metrics {metric.name}: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name} {_format_value(value)}" for name, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HANDLER_SECONDS = registry.histogram("bot_handler_seconds", "Время обработчика бота", ["handler"])
+HANDLER_ERRORS = registry.counter("bot_handler_errors_total", "Исключения, вылетевшие из обработчика", ["handler"])
+STORAGE_SECONDS = registry.histogram("storage_call_seconds", "Время вызова метода хранилища", ["backend", "method"])
+STORAGE_BYTES = registry.counter("storage_bytes_total", "Байт прочитано/записано хранилищем", ["backend", "direction"])
+STORAGE_ROWS = registry.counter("storage_rows_total", "Записей прочитано/записано хранилищем", ["backend", "direction"])
+RENDER_SECONDS = registry.histogram("chart_render_seconds", "Время получения графика", ["kind", "source"])
+SEND_SECONDS = registry.histogram("telegram_send_seconds", "От постановки в очередь до ответа Bot API", ["method"])
+SEND_RESULTS = registry.counter("telegram_send_total", "Попытки запросов к Bot API", ["method", "result"])
+REPORT_JOBS = registry.counter("report_jobs_total", "Отчеты за прошлый месяц, построенные в фоне", ["result"])
+
+
+def record_io(backend, direction, nbytes=0, rows=0):
+    """Учет ввода-вывода хранилища; direction - "read" или "write" """
+    if nbytes:
+        STORAGE_BYTES.inc(nbytes, backend=backend, direction=direction)
+    if rows:
+        STORAGE_ROWS.inc(rows, backend=backend, direction=direction)
+
+
+_storage_depth = threading.local()
+
+
+def instrument_storage(cls):
+    """
+    Декоратор класса хранилища: время каждого публичного метода в storage_call_seconds.
+    Учитывается только внешний вызов (get_budget_status, а не вложенный get_stats_by_month).
+    Метка backend берется из атрибута класса backend.
+    """
+    def wrap(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            depth = getattr(_storage_depth, "value", 0)
+            _storage_depth.value = depth + 1
+            start = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                _storage_depth.value = depth
+                if depth == 0:
+                    STORAGE_SECONDS.observe(time.perf_counter() - start, backend=self.backend, method=method.__name__)
+        return wrapper
+
+    for name, attr in list(vars(cls).items()):
+        # Генераторы (iter_frames) не оборачиваем: время их создания ничего не говорит
+        if name.startswith("_") or not inspect.isfunction(attr) or inspect.isgeneratorfunction(attr):
+            continue
+        setattr(cls, name, wrap(attr))
+    return cls
+
+
+class SamplingProfiler:
+    """
+    Необязательный сэмплирующий профилировщик обработчиков.
+
+    Пока обработчик выполняется, фоновый поток раз в interval секунд снимает стек его потока.
+    Если обработчик работал дольше threshold_ms, собранные стеки сохраняются (keep самых
+    медленных) и печатаются: видно, где именно он провел время.
+    """
+
+    def __init__(self, threshold_ms=1000, interval=0.01, keep=10):
+        self.threshold_ms = threshold_ms
+        self.interval = interval
+        self.keep = keep
+        self.slowest = []   # [(ms, название, Counter стеков)] по убыванию времени
+        self._active = {}   # ident потока -> (название, Counter стеков)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                active = list(self._active.items())
+            if not active:
+                continue
+            frames = sys._current_frames()
+            for ident, (_, stacks) in active:
+                frame = frames.get(ident)
+                if frame is not None:
+                    stack = ";".join(f"{f.name} ({f.filename.rsplit('/', 1)[-1]}:{f.lineno})"
+                                     for f in traceback.extract_stack(frame))
+                    stacks[stack] += 1
+
+    def begin(self, name):
+        with self._lock:
+            self._active[threading.get_ident()] = (name, StackCounter())
+
+    def end(self, elapsed_ms):
+        with self._lock:
+            name, stacks = self._active.pop(threading.get_ident(), (None, None))
+            if name is None or elapsed_ms < self.threshold_ms:
+                return
+            self.slowest.append((elapsed_ms, name, stacks))
+            self.slowest.sort(key=lambda item: item[0], reverse=True)
+            del self.slowest[self.keep:]
+        print(f"[profiler] {name}: {elapsed_ms:.0f} ms\n" + self._format_stacks(stacks))
+
+    @staticmethod
+    def _format_stacks(stacks, limit=5):
+        total = sum(stacks.values()) or 1
+        return "\n".join(f"  {count * 100 // total}%  {stack}" for stack, count in stacks.most_common(limit))
+
+    def dump(self):
+        """Текстовый отчет по самым медленным обработчикам"""
+        with self._lock:
+            slowest = list(self.slowest)
+        return "\n\n".join(f"{name}: {ms:.0f} ms\n{self._format_stacks(stacks)}" for ms, name, stacks in slowest) + "\n"
+
+
+def instrument_bot(bot, profiler=None):
+    """
+    Оборачивает все зарегистрированные обработчики бота: время в bot_handler_seconds,
+    исключения в bot_handler_errors_total, медленные вызовы - в profiler (если задан).
+    Вызывать после объявления всех обработчиков.
+    """
+    def wrap(function):
+        name = function.__name__
+
+        @functools.wraps(function)
+        def handler(*args, **kwargs):
+            if profiler is not None:
+                profiler.begin(name)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            except Exception:
+                HANDLER_ERRORS.inc(handler=name)
+                raise
+            finally:
+                elapsed = time.perf_counter() - start
+                HANDLER_SECONDS.observe(elapsed, handler=name)
+                if profiler is not None:
+                    profiler.end(elapsed * 1000)
+        return handler
+
+    for attr in ("message_handlers", "edited_message_handlers", "callback_query_handlers", "inline_handlers"):
+        for entry in getattr(bot, attr, []):
+            entry["function"] = wrap(entry["function"])
+    return bot
@@ -0,0 +1,331 @@
+import os
+import time
+import atexit
+import heapq
+import itertools
+import functools
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+from src.metrics import SEND_SECONDS, SEND_RESULTS
+
+# Лимиты Bot API: около 30 сообщений в секунду на бота и 1 в секунду в один чат
+# (короткие всплески в личном чате Telegram пропускает)
+GLOBAL_RATE = 30
+CHAT_RATE = 1
+CHAT_BURST = 3
+# Методы бота, которые идут через очередь
+METHODS = ("send_message", "send_photo", "send_document", "reply_to",
+           "answer_callback_query", "edit_message_text", "delete_message")
+# Простаивающих чатов больше этого - убираем тех, чей лимит уже восстановился
+MAX_IDLE_CHATS = 1000
+# Номер позиционного аргумента chat_id у методов бота (reply_to - по message.chat.id)
+CHAT_ARG = {"send_message": 0, "send_photo": 0, "send_document": 0, "delete_message": 0,
+            "edit_message_text": 1}
+
+
+class TokenBucket:
+    """rate запросов в секунду, всплеск до capacity. Время передается снаружи"""
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = now
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, now):
+        """Через сколько секунд можно отправить (0 - уже можно)"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def full(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+def chat_of(method, args, kwargs):
+    """Чат запроса: по нему соблюдается порядок и лимит на чат (None - без чата)"""
+    if method == "reply_to":
+        return (args[0] if args else kwargs["message"]).chat.id
+    if "chat_id" in kwargs:
+        return kwargs["chat_id"]
+    index = CHAT_ARG.get(method)
+    return args[index] if index is not None and len(args) > index else None
+
+
+class _Upload:
+    """
+    Файл в очереди: не читается в память целиком, а отдается боту при каждой попытке
+    с позиции, где был при постановке в очередь. Закрытый к моменту отправки файл
+    открывается заново по имени (и закрывается после попытки).
+    Переданный файл принадлежит очереди: она закрывает его, когда запрос завершен.
+    """
+
+    __slots__ = ("file", "path", "offset")
+
+    def __init__(self, file):
+        self.file = file
+        name = getattr(file, "name", None)
+        self.path = name if isinstance(name, str) and os.path.exists(name) else None
+        self.offset = file.tell() if hasattr(file, "tell") else 0
+
+    def open(self):
+        """(файл, закрыть ли его после попытки)"""
+        if not getattr(self.file, "closed", False):
+            self.file.seek(self.offset)
+            return self.file, False
+        if self.path is None:
+            raise ValueError("Файл закрыт до отправки")
+        file = open(self.path, "rb")
+        file.seek(self.offset)
+        return file, True
+
+    def close(self):
+        if not getattr(self.file, "closed", True):
+            self.file.close()
+
+
+def _wrap(value):
+    return _Upload(value) if hasattr(value, "read") else value
+
+
+def retry_delay(error, attempt, max_retries):
+    """Пауза перед повтором запроса или None, если повторять не нужно"""
+    from telebot.apihelper import ApiTelegramException, ApiHTTPException
+    from requests import RequestException
+
+    if attempt >= max_retries:
+        return None
+    if isinstance(error, ApiTelegramException):
+        if error.error_code == 429:
+            return float((error.result_json.get("parameters") or {}).get("retry_after", 1))
+        if error.error_code < 500:
+            # 400 (сообщение не изменилось...), 403 (бот заблокирован) - повтор не поможет
+            return None
+    elif not isinstance(error, (ApiHTTPException, RequestException)):
+        return None
+    return min(2.0 ** (attempt - 1), 30.0)
+
+
+def pooled_session(pool_size=8):
+    """
+    Один пул keep-alive соединений на все потоки бота. По умолчанию pyTelegramBotAPI
+    заводит свою сессию в каждом потоке и раз в 10 минут открывает соединения заново.
+    """
+    import requests
+    from telebot import apihelper
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    apihelper.session = session
+    return session
+
+
+class _Send:
+    __slots__ = ("method", "args", "kwargs", "future", "attempts", "queued")
+
+    def __init__(self, method, args, kwargs):
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.attempts = 0
+        self.queued = time.perf_counter()
+
+
+class _Chat:
+    __slots__ = ("queue", "bucket", "busy")
+
+    def __init__(self, bucket):
+        self.queue = deque()
+        self.bucket = bucket
+        self.busy = False
+
+
+class Outbox:
+    """
+    Очередь исходящих запросов к Bot API: outbox.send_message(...) вместо bot.send_message(...).
+
+    Обработчик только ставит ответ в очередь и получает Future; отправляют фоновые потоки.
+    Запросы одного чата уходят строго по порядку, с лимитом на чат и общим лимитом бота
+    (token bucket). На 429 ждем retry_after, придержав только этот чат; сетевые ошибки и 5xx
+    повторяем с растущей паузой, остальные ошибки не повторяем.
+    workers=0 - отправлять сразу в вызывающем потоке (тесты).
+    """
+
+    def __init__(self, bot, workers=4, global_rate=GLOBAL_RATE, chat_rate=CHAT_RATE,
+                 chat_burst=CHAT_BURST, max_retries=5, clock=time.monotonic):
+        self.bot = bot
+        self.workers = workers
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.clock = clock
+        self._global = TokenBucket(global_rate, global_rate, clock())
+        self._chats = {}  # chat_id -> _Chat
+        self._ready = []  # куча (когда можно отправлять, n, chat_id) - чаты с непустой очередью
+        self._order = itertools.count()
+        self._cond = threading.Condition()
+        self._pending = 0
+        self._threads = []
+        self._closed = False
+
+    def __getattr__(self, name):
+        if name not in METHODS:
+            raise AttributeError(name)
+        return functools.partial(self.submit, name)
+
+    def submit(self, method, *args, **kwargs):
+        item = _Send(method, tuple(_wrap(a) for a in args), {k: _wrap(v) for k, v in kwargs.items()})
+        if self.workers == 0:
+            self._send_now(item)
+            return item.future
+
+        key = chat_of(method, args, kwargs)
+        # Запросы без чата упорядочивать не с чем - у каждого своя "очередь"
+        key = key if key is not None else object()
+        with self._cond:
+            self._start()
+            now = self.clock()
+            chat = self._chats.get(key)
+            if chat is None:
+                if len(self._chats) >= MAX_IDLE_CHATS:
+                    self._forget_idle(now)
+                chat = self._chats[key] = _Chat(TokenBucket(self.chat_rate, self.chat_burst, now))
+            chat.queue.append(item)
+            self._pending += 1
+            if len(chat.queue) == 1 and not chat.busy:
+                self._schedule(key, now)
+        return item.future
+
+    def pending(self):
+        """Сколько запросов ждет отправки или отправляется сейчас"""
+        with self._cond:
+            return self._pending
+
+    def join(self, timeout=None):
+        """Ждет, пока очередь опустеет"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._pending == 0, timeout)
+
+    def close(self, timeout=10):
+        """Дожидается отправки очереди (не дольше timeout) и останавливает потоки"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._pending == 0, timeout)
+            self._closed = True
+            self._cond.notify_all()
+
+    def _start(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"outbox-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        atexit.register(self.close)
+
+    def _schedule(self, key, when):
+        heapq.heappush(self._ready, (when, next(self._order), key))
+        self._cond.notify()
+
+    def _forget_idle(self, now):
+        for key in [key for key, chat in self._chats.items()
+                    if not chat.queue and not chat.busy and chat.bucket.full(now)]:
+            del self._chats[key]
+
+    def _next(self):
+        """Следующий запрос, который можно отправить с учетом лимитов (под self._cond)"""
+        while not self._closed:
+            now = self.clock()
+            if self._ready and self._ready[0][0] <= now:
+                _, _, key = heapq.heappop(self._ready)
+                chat = self._chats[key]
+                wait = max(chat.bucket.delay(now), self._global.delay(now))
+                if wait > 0:
+                    heapq.heappush(self._ready, (now + wait, next(self._order), key))
+                    continue
+                chat.bucket.take(now)
+                self._global.take(now)
+                chat.busy = True
+                return key, chat
+            self._cond.wait(self._ready[0][0] - now if self._ready else None)
+        return None, None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                key, chat = self._next()
+            if chat is None:
+                return
+            item = chat.queue[0]
+            delay = self._attempt(item)
+            with self._cond:
+                chat.busy = False
+                if delay is None:
+                    chat.queue.popleft()
+                    self._pending -= 1
+                    if self._pending == 0:
+                        self._cond.notify_all()
+                if chat.queue:
+                    # Остальные запросы чата ждут вместе с повтором: порядок важнее
+                    self._schedule(key, self.clock() + (delay or 0))
+                elif not isinstance(key, int):
+                    del self._chats[key]
+
+    def _attempt(self, item):
+        """Один запрос. None - запрос завершен (успешно или окончательно неудачно), иначе пауза до повтора"""
+        item.attempts += 1
+        opened = []
+
+        def unwrap(value):
+            if not isinstance(value, _Upload):
+                return value
+            file, close = value.open()
+            if close:
+                opened.append(file)
+            return file
+
+        try:
+            try:
+                args = [unwrap(a) for a in item.args]
+                kwargs = {k: unwrap(v) for k, v in item.kwargs.items()}
+                result = getattr(self.bot, item.method)(*args, **kwargs)
+            finally:
+                for file in opened:
+                    file.close()
+        except Exception as e:
+            delay = retry_delay(e, item.attempts, self.max_retries)
+            if delay is not None:
+                SEND_RESULTS.inc(method=item.method, result="retry")
+                return delay
+            SEND_RESULTS.inc(method=item.method, result="failed")
+            print(f"Error send {item.method}: {e}")
+            item.future.set_exception(e)
+        else:
+            SEND_RESULTS.inc(method=item.method, result="ok")
+            item.future.set_result(result)
+        SEND_SECONDS.observe(time.perf_counter() - item.queued, method=item.method)
+        # Повторов больше не будет - файлы запроса не нужны
+        for value in itertools.chain(item.args, item.kwargs.values()):
+            if isinstance(value, _Upload):
+                value.close()
+        return None
+
+    def _send_now(self, item):
+        while True:
+            delay = self._attempt(item)
+            if delay is None:
+                return
+            time.sleep(delay)
@@ -28,4 +28,21 @@ def parse_input(user_text):
         "category": category,
         "amount": amount,
         "note": note
-    }
\ No newline at end of file
+    }
+
+def parse_batch(user_text):
+    """
+    Разбирает сообщение из нескольких строк "Категория Цена Комментарий" за один проход.
+    Возвращает (записи, ошибки), где ошибки - список (номер строки, строка, текст ошибки).
+    Пустые строки пропускаются, ошибочные не мешают записать остальные.
+    """
+    entries = []
+    errors = []
+    for line_no, line in enumerate(user_text.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            entries.append(parse_input(line))
+        except ValueError as e:
+            errors.append((line_no, line.strip(), str(e)))
+    return entries, errors
@@ -0,0 +1,356 @@
+import os
+import sys
+import copy
+import glob
+import json
+import importlib.util
+
+from src.storage import FinanceStorage, LEDGER_COLUMNS, atomic_write, locked, pd
+from src.metrics import instrument_storage, record_io
+from src.records import records_from_frame, compact_frame, CachedHistory
+from src.trend import totals_from_cents
+from src.currency import rates, Totals
+
+def partitioned_supported():
+    """Для колоночного формата нужен pyarrow (необязательная зависимость)"""
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def _arrow():
+    if not partitioned_supported():
+        raise RuntimeError("Для STORAGE_BACKEND=partitioned нужен пакет pyarrow")
+    import pyarrow
+    import pyarrow.compute
+    import pyarrow.feather
+
+    return pyarrow
+
+
+def _schema(pa):
+    # Сумма хранится в копейках (int64), категория - словарем, дата - timestamp
+    # без разбора текста; seq - сквозной номер записи (порядок добавления)
+    return pa.schema([
+        ("seq", pa.int64()),
+        ("date", pa.timestamp("us")),
+        ("category", pa.dictionary(pa.int32(), pa.string())),
+        ("amount_cents", pa.int64()),
+        ("note", pa.string()),
+        ("currency", pa.dictionary(pa.int32(), pa.string())),
+    ])
+
+
+@instrument_storage
+class PartitionedFinanceStorage(FinanceStorage):
+    """
+    История пользователя в колоночных партициях по месяцам: data/{id}_parts/YYYY-MM.feather.
+
+    Статистика за месяц читает одну партицию, полная история читается через memory map
+    (Feather без сжатия). manifest.json хранит число строк и последний seq каждого месяца.
+    Бюджет и валюта - те же файлы, что у FinanceStorage.
+    """
+
+    backend = "partitioned"
+
+    def __init__(self, filename, cache=None):
+        super().__init__(filename, cache)
+        self.parts_dir = f"{self.base_path}_parts"
+        self.manifest_filename = os.path.join(self.parts_dir, "manifest.json")
+        self.data_source = self.manifest_filename
+        self.data_key = f"{self.parts_dir}#data"
+        self.search_key = f"{self.parts_dir}#search"
+        self.pa = _arrow()
+        os.makedirs(self.parts_dir, exist_ok=True)
+
+    # --- МАНИФЕСТ ---
+    def _load_manifest(self):
+        if self.cache is not None:
+            return self.cache.get(self.manifest_filename, self._read_manifest)
+        return self._read_manifest()
+
+    def _read_manifest(self):
+        if os.path.exists(self.manifest_filename):
+            with open(self.manifest_filename, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return {"next_seq": 0, "months": {}}
+
+    def _save_manifest(self, manifest):
+        def write(tmp):
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(manifest, f, sort_keys=True)
+        atomic_write(self.manifest_filename, write)
+        if self.cache is not None:
+            self.cache.put(self.manifest_filename, manifest)
+
+    # --- ПАРТИЦИИ ---
+    def _partition_path(self, key):
+        return os.path.join(self.parts_dir, f"{key}.feather")
+
+    def _read_table(self, key, columns=None):
+        path = self._partition_path(key)
+        if not os.path.exists(path):
+            return None
+        table = self.pa.feather.read_table(path, memory_map=True)
+        if "currency" not in table.column_names:
+            # Партиция из времени до валют у записей: все траты в валюте до первой смены
+            currency = self.pa.repeat(self._legacy_currency(), table.num_rows).dictionary_encode()
+            table = table.append_column("currency", currency).cast(_schema(self.pa))
+        if columns is not None:
+            table = table.select(columns)
+        record_io(self.backend, "read", table.nbytes, table.num_rows)
+        return table
+
+    def _write_table(self, key, table):
+        # Без сжатия: иначе при чтении нельзя отобразить файл в память без копирования
+        path = self._partition_path(key)
+        atomic_write(path, lambda tmp: self.pa.feather.write_feather(table, tmp, compression="uncompressed"))
+        record_io(self.backend, "write", os.path.getsize(path))
+
+    def _make_table(self, df, seq):
+        """DataFrame date/category/amount/note/currency + номера записей -> таблица партиции"""
+        pa = self.pa
+        amounts = pd.to_numeric(df["amount"]).mul(100).round().astype("int64")
+        return pa.table({
+            "seq": pa.array(seq, type=pa.int64()),
+            "date": pa.array(pd.to_datetime(df["date"]).astype("datetime64[us]"), type=pa.timestamp("us")),
+            "category": pa.array(df["category"].astype(str)).dictionary_encode(),
+            "amount_cents": pa.array(amounts, type=pa.int64()),
+            "note": pa.array(df["note"].fillna("").astype(str), type=pa.string()),
+            "currency": pa.array(df["currency"].astype(str)).dictionary_encode(),
+        }).cast(_schema(pa))
+
+    @staticmethod
+    def _to_frame(table):
+        """Таблица партиции -> DataFrame в схеме FinanceStorage (плюс seq), по порядку добавления"""
+        df = table.sort_by("seq").to_pandas()
+        df["amount"] = df.pop("amount_cents") / 100
+        return df[["seq"] + LEDGER_COLUMNS]
+
+    def _append_frame(self, df):
+        """Раскладывает записи по месяцам; переписываются только затронутые партиции"""
+        manifest = copy.deepcopy(self._load_manifest())
+        first_seq = manifest["next_seq"]
+        table = self._make_table(df.reset_index(drop=True), range(first_seq, first_seq + len(df)))
+        keys = pd.to_datetime(df["date"]).dt.strftime("%Y-%m").to_numpy()
+        for key in sorted(set(keys)):
+            part = table.filter(self.pa.array(keys == key))
+            existing = self._read_table(key)
+            if existing is not None:
+                part = self.pa.concat_tables([existing, part])
+            self._write_table(key, part)
+            manifest["months"][key] = {"rows": part.num_rows, "max_seq": self.pa.compute.max(part["seq"]).as_py()}
+        manifest["next_seq"] = first_seq + len(df)
+        self._save_manifest(manifest)
+
+    def _append_rows(self, rows):
+        cached = self.cache.peek(self.data_key, source=self.data_source) if self.cache is not None else None
+        index = self._peek_search_index()
+        new_rows = pd.DataFrame(rows, columns=LEDGER_COLUMNS)
+        self._append_frame(new_rows)
+        record_io(self.backend, "write", rows=len(rows))
+
+        if self.cache is not None:
+            if cached is not None and not cached.empty:
+                cached.append(rows)
+                self.cache.put(self.data_key, cached, source=self.data_source)
+            else:
+                self.cache.invalidate(self.data_key)
+            if index is not None:
+                for row in rows:
+                    index.add(row["category"], row["amount"], row["note"])
+                self.cache.put(self.search_key, index, source=self.data_source)
+
+    # --- ЧТЕНИЕ ---
+    def _load_data(self):
+        """Вся история (кэшируется до следующей записи). Не изменять!"""
+        if self.cache is not None:
+            return self.cache.get(self.data_key, lambda: CachedHistory(self._read_data()), source=self.data_source).frame()
+        return self._read_data()
+
+    def _read_data(self):
+        manifest = self._load_manifest()
+        tables = [self._read_table(key) for key in sorted(manifest["months"])]
+        tables = [t for t in tables if t is not None]
+        if not tables:
+            return pd.DataFrame(columns=LEDGER_COLUMNS)
+        return compact_frame(self._to_frame(self.pa.concat_tables(tables))[LEDGER_COLUMNS].reset_index(drop=True))
+
+    @locked
+    def get_last_records(self, n=10):
+        cached = self.cache.peek(self.data_key, source=self.data_source) if self.cache is not None else None
+        if cached is not None:
+            return cached.last_records(n)
+        # Месяцы с самыми свежими записями; следующий месяц нужен, только если в нем
+        # могут быть записи новее n-й найденной (например, после импорта старой выписки)
+        months = sorted(self._load_manifest()["months"].items(), key=lambda kv: kv[1]["max_seq"], reverse=True)
+        df = None
+        for key, info in months:
+            if df is not None and len(df) >= n and info["max_seq"] < df["seq"].iloc[n - 1]:
+                break
+            frame = self._to_frame(self._read_table(key))
+            df = frame if df is None else pd.concat([df, frame], ignore_index=True)
+            df = df.sort_values("seq", ascending=False, ignore_index=True)
+        if df is None or df.empty:
+            return []
+        return records_from_frame(df.head(n))
+
+    @locked
+    def get_stats_by_month(self, year, month, currency=None):
+        """Траты по категориям за месяц - чтение одной партиции"""
+        key = f"{year:04d}-{month:02d}"
+        path = self._partition_path(key)
+        if not os.path.exists(path):
+            return {}
+
+        def compute():
+            df = self._read_table(key, columns=["currency", "category", "amount_cents"]).to_pandas()
+            sums = df.groupby(["currency", "category"], observed=True)["amount_cents"].sum()
+            by_currency = {}
+            for (cur, category), cents in sums.items():
+                by_currency.setdefault(str(cur), {})[str(category)] = cents / 100
+            return by_currency
+
+        by_currency = self.cache.get(f"{path}#stats", compute, source=path) if self.cache is not None else compute()
+        return self._in_currency(key, by_currency, currency or self.get_currency())
+
+    def _month_frame(self, key):
+        return self._read_table(key, columns=["date", "category", "amount_cents", "currency"]).to_pandas()
+
+    @locked
+    def get_monthly_totals(self, first, last, currency=None):
+        """{YYYY-MM: {категория: сумма}} за месяцы first..last - партиции диапазона, один group-by"""
+        frames = []
+        for key in sorted(self._load_manifest()["months"]):
+            if first <= key <= last:
+                df = self._read_table(key, columns=["date", "category", "amount_cents", "currency"]).to_pandas()
+                frames.append(df.assign(month=key, category=df["category"].astype(str),
+                                        currency=df["currency"].astype(str)))
+        if not frames:
+            return {}
+        df = pd.concat(frames, ignore_index=True)
+        target = currency or self.get_currency()
+        missing = set()
+        if (df["currency"] != target).any():
+            # Пересчет всего диапазона одним merge_asof по курсам на даты трат
+            df["amount_cents"] = rates.convert_cents(df["amount_cents"], df["currency"], df["date"], target, missing)
+        return Totals(totals_from_cents(df.groupby(["month", "category"])["amount_cents"].sum()), sorted(missing))
+
+    @locked
+    def get_available_months(self):
+        return [tuple(int(p) for p in key.split("-")) for key in sorted(self._load_manifest()["months"])]
+
+    # --- ИЗМЕНЕНИЕ ---
+    def _has_unlabeled_records(self):
+        return any("currency" not in self.pa.feather.read_table(self._partition_path(key), memory_map=True).column_names
+                   for key in self._load_manifest()["months"])
+
+    @locked
+    def delete_last_expense(self):
+        manifest = copy.deepcopy(self._load_manifest())
+        if not manifest["months"]:
+            return False
+        cached = self.cache.peek(self.data_key, source=self.data_source) if self.cache is not None else None
+        index = self._peek_search_index()
+
+        key, info = max(manifest["months"].items(), key=lambda kv: kv[1]["max_seq"])
+        df = self._to_frame(self._read_table(key))
+        deleted = df.iloc[-1]
+        rest = df.iloc[:-1]
+        if rest.empty:
+            os.remove(self._partition_path(key))
+            del manifest["months"][key]
+        else:
+            self._write_table(key, self._make_table(rest, rest["seq"]))
+            manifest["months"][key] = {"rows": len(rest), "max_seq": int(rest["seq"].iloc[-1])}
+        self._save_manifest(manifest)
+
+        if cached is not None:
+            cached.drop_last()
+            self.cache.put(self.data_key, cached, source=self.data_source)
+        elif self.cache is not None:
+            self.cache.invalidate(self.data_key)
+        if index is not None:
+            index.remove_last(deleted["category"], deleted["note"])
+            self.cache.put(self.search_key, index, source=self.data_source)
+        return True
+
+    def _clear_partitions(self):
+        for path in glob.glob(os.path.join(self.parts_dir, "*.feather")):
+            os.remove(path)
+        self._save_manifest({"next_seq": 0, "months": {}})
+        if self.cache is not None:
+            self.cache.invalidate(self.data_key)
+            self.cache.invalidate(self.search_key)
+
+    @locked
+    def reset_data(self):
+        # Партиции и бюджет удаляем, конфиг (валюту) оставляем
+        self._clear_partitions()
+        if os.path.exists(self.budget_filename):
+            os.remove(self.budget_filename)
+        if self.cache is not None:
+            self.cache.invalidate(self.budget_filename)
+
+    @locked
+    def replace_data(self, df):
+        """Заменяет всю историю записями df (для переноса из CSV)"""
+        self._clear_partitions()
+        if len(df):
+            self._append_frame(df[LEDGER_COLUMNS])
+
+    # --- ВЫГРУЗКА ---
+    def data_version(self):
+        manifest = self._load_manifest()
+        return (manifest["next_seq"], sum(info["rows"] for info in manifest["months"].values()))
+
+    def iter_frames(self, start=None, end=None, chunksize=50000):
+        """История по месяцам (даты в [start, end)); в памяти одна партиция за раз"""
+        with self.lock:
+            keys = sorted(self._load_manifest()["months"])
+        first = start.strftime("%Y-%m") if start is not None else None
+        last = end.strftime("%Y-%m") if end is not None else None
+        for key in keys:
+            if (first is not None and key < first) or (last is not None and key > last):
+                continue
+            table = self._read_table(key)
+            if table is None:
+                continue
+            df = self._to_frame(table)[LEDGER_COLUMNS]
+            if start is not None:
+                df = df[df['date'] >= start]
+            if end is not None:
+                df = df[df['date'] < end]
+            for offset in range(0, len(df), chunksize):
+                yield df.iloc[offset:offset + chunksize]
+
+
+def convert(data_dir="data"):
+    """
+    Переносит data/{id}_finance.csv в партиции data/{id}_parts.
+    CSV не удаляется; повторный запуск пересобирает партиции заново.
+    """
+    converted = 0
+    for filename in sorted(glob.glob(os.path.join(data_dir, "*_finance.csv"))):
+        user_id = os.path.basename(filename)[:-len("_finance.csv")]
+        if not user_id.lstrip("-").isdigit():
+            continue
+        df = FinanceStorage(filename)._load_data()
+        PartitionedFinanceStorage(filename).replace_data(df)
+        converted += 1
+        print(f"OK  {user_id}: {len(df)} записей")
+    return converted
+
+
+def main(argv=None):
+    """python -m src.partitioned_storage convert [data]"""
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] != "convert":
+        print(main.__doc__)
+        return 2
+    data_dir = argv[1] if len(argv) > 1 else "data"
+    count = convert(data_dir)
+    print(f"Перенесено пользователей: {count}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+import sys
+from datetime import datetime, timedelta
+
+from src.startup import lazy_import
+
+pd = lazy_import("pandas")
+np = lazy_import("numpy")
+
+EPOCH = datetime(1970, 1, 1)
+# Колонки с повторяющимися строками: в кэше хранятся как коды категорий, а не объекты str
+CATEGORICAL_COLUMNS = ["category", "note", "currency"]
+
+
+def to_cents(amount):
+    """Сумма в копейках (int), с округлением до ближайшей копейки"""
+    return int(round(float(amount) * 100))
+
+
+def from_cents(cents):
+    return cents / 100
+
+
+def to_epoch_us(date):
+    """Наивная дата -> микросекунды от 1970-01-01 (часовой пояс не учитывается, как и в CSV)"""
+    delta = date - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+class Record:
+    """
+    Одна трата для обработчиков бота: сумма в копейках, дата в микросекундах от эпохи,
+    категория и валюта - общие (интернированные) строки. Поддерживает r['amount'] и т.п., как словарь.
+    """
+
+    __slots__ = ("epoch_us", "category", "cents", "note", "currency")
+
+    def __init__(self, epoch_us, category, cents, note="", currency=None):
+        self.epoch_us = epoch_us
+        self.category = sys.intern(str(category))
+        self.cents = cents
+        self.note = note
+        self.currency = sys.intern(str(currency)) if currency is not None else None
+
+    @classmethod
+    def from_row(cls, row):
+        """Из словаря date/category/amount/note/currency (строка CSV, журнал)"""
+        return cls(to_epoch_us(pd.Timestamp(row["date"]).to_pydatetime()), row["category"],
+                   to_cents(row["amount"]), row.get("note", "") or "", row.get("currency"))
+
+    @property
+    def date(self):
+        return EPOCH + timedelta(microseconds=self.epoch_us)
+
+    @property
+    def amount(self):
+        return from_cents(self.cents)
+
+    def __getitem__(self, name):
+        if name not in ("date", "category", "amount", "note", "currency"):
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def as_dict(self):
+        """Поля строки CSV (валюта - отдельно, r.currency)"""
+        return {"date": self.date, "category": self.category, "amount": self.amount, "note": self.note}
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            return (self.epoch_us, self.category, self.cents, self.note, self.currency) == \
+                   (other.epoch_us, other.category, other.cents, other.note, other.currency)
+        return NotImplemented
+
+    def __repr__(self):
+        return f"Record({self.date:%Y-%m-%d %H:%M:%S}, {self.category!r}, {self.amount}, {self.currency!r}, {self.note!r})"
+
+
+def _strings(column):
+    """Колонка -> [str]; tolist() берет значения категорий напрямую, без astype(str) всей колонки"""
+    return [str(value) for value in column.tolist()]
+
+
+def records_from_frame(df):
+    """Строки DataFrame date/category/amount/note/currency -> [Record] без промежуточных словарей"""
+    if df.empty:
+        return []
+    epoch = pd.to_datetime(df["date"]).to_numpy().astype("datetime64[us]").astype("int64")
+    cents = (pd.to_numeric(df["amount"]).to_numpy() * 100).round().astype("int64")
+    currencies = _strings(df["currency"]) if "currency" in df.columns else [None] * len(df)
+    return [Record(int(e), c, int(a), n, cur) for e, c, a, n, cur in
+            zip(epoch, _strings(df["category"]), cents, _strings(df["note"]), currencies)]
+
+
+def _values_at(column, positions):
+    """Значения колонки по позициям списком str; у категориальной - через коды, без копии значений"""
+    values = column.array
+    if column.dtype == "category":
+        # Код -1 (пропуск) берет последний элемент - "nan", как astype(str)
+        return np.append(values.categories.to_numpy(dtype=object), "nan")[values.codes[positions]].tolist()
+    return [str(value) for value in values[positions].tolist()]
+
+
+def records_at(df, positions):
+    """
+    Записи по номерам строк (в порядке positions). Значения берутся из колонок по позициям -
+    без df.iloc, который копирует срез целиком вместе с категориями и индексом.
+    """
+    if not len(positions):
+        return []
+    positions = np.asarray(positions, dtype=np.intp)
+    dates = df["date"].to_numpy()
+    if dates.dtype.kind != "M":
+        dates = pd.to_datetime(df["date"]).to_numpy()
+    epoch = dates[positions].astype("datetime64[us]").astype("int64")
+    cents = (df["amount"].to_numpy(dtype="float64")[positions] * 100).round().astype("int64")
+    currencies = _values_at(df["currency"], positions) if "currency" in df.columns else [None] * len(positions)
+    return [Record(int(e), c, int(a), n, cur) for e, c, a, n, cur in
+            zip(epoch, _values_at(df["category"], positions), cents, _values_at(df["note"], positions), currencies)]
+
+
+def compact_frame(df):
+    """Повторяющиеся строки (категория, заметка) - в pandas category: коды вместо объектов"""
+    return df.astype({column: "category" for column in CATEGORICAL_COLUMNS if column in df.columns})
+
+
+def append_compact(df, new_rows):
+    """
+    Добавляет строки к компактной истории, сохраняя категориальные колонки
+    (обычный concat с новыми значениями превратил бы их обратно в object).
+    """
+    from pandas.api.types import union_categoricals
+
+    new_rows = compact_frame(new_rows)
+    combined = pd.concat([df, new_rows], ignore_index=True)
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns and column in new_rows.columns:
+            values = union_categoricals([df[column].astype("category"), new_rows[column]], ignore_order=True)
+            combined[column] = pd.Categorical(values)
+    return combined
+
+
+class CachedHistory:
+    """
+    История пользователя в StorageCache: компактный DataFrame плюс хвост недавно
+    добавленных строк (словари). Запись только дописывает хвост - O(1), без concat всей
+    истории; в DataFrame хвост вливается при первом чтении всей истории (frame())
+    или когда он вырастает до MAX_TAIL строк. Менять только под блокировкой хранилища.
+    """
+
+    MAX_TAIL = 1000
+
+    def __init__(self, frame):
+        self._frame = frame
+        self._tail = []
+        self._frame_bytes = int(frame.memory_usage(index=True, deep=True).sum())
+
+    def __len__(self):
+        return len(self._frame) + len(self._tail)
+
+    @property
+    def empty(self):
+        return len(self) == 0
+
+    @property
+    def nbytes(self):
+        """Оценка памяти для StorageCache (строка хвоста - около 200 байт)"""
+        return self._frame_bytes + 200 * len(self._tail)
+
+    def frame(self):
+        """Вся история одним DataFrame (не изменять!)"""
+        if self._tail:
+            self._frame = append_compact(self._frame, pd.DataFrame(self._tail, columns=self._frame.columns))
+            self._tail = []
+            self._frame_bytes = int(self._frame.memory_usage(index=True, deep=True).sum())
+        return self._frame
+
+    def append(self, rows):
+        columns = list(self._frame.columns)
+        self._tail.extend({column: row.get(column, "") for column in columns} for row in rows)
+        if len(self._tail) >= self.MAX_TAIL:
+            self.frame()
+
+    def drop_last(self):
+        if self._tail:
+            self._tail.pop()
+        else:
+            self._frame = self._frame.iloc[:-1]
+
+    def last_records(self, n):
+        """n последних записей, от новых к старым"""
+        records = [Record.from_row(row) for row in self._tail[::-1][:n]]
+        if len(records) < n:
+            records += records_from_frame(self._frame.tail(n - len(records)).iloc[::-1])
+        return records
@@ -0,0 +1,124 @@
+import json
+import time
+import atexit
+import hashlib
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from src.metrics import RENDER_SECONDS
+
+
+def _render_pie(stats, currency_symbol, dpi):
+    """Выполняется в процессе пула: matplotlib грузится только там"""
+    from src.visualizer import create_pie_chart
+    return create_pie_chart(stats, currency_symbol=currency_symbol, dpi=dpi).getvalue()
+
+
+def _render_trend(months, series, currency_symbol, dpi):
+    from src.visualizer import create_stacked_bar_chart
+    return create_stacked_bar_chart(months, series, currency_symbol=currency_symbol, dpi=dpi).getvalue()
+
+
+def _warm_up_worker():
+    import src.visualizer  # noqa: F401
+
+
+def chart_key(kind, *args):
+    """Хэш входных данных графика - ключ кэша картинок"""
+    payload = json.dumps([kind, args], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class ChartRenderer:
+    """
+    Рисует графики в отдельных процессах и кэширует готовые PNG.
+
+    Обработчик бота только ждет результат, а не держит GIL на время работы matplotlib,
+    поэтому остальные чаты продолжают обслуживаться. Одинаковые данные (повторный /stats,
+    прошлый месяц в /history) отдаются из кэша без рисования.
+    workers=0 - рисовать в вызывающем потоке (тесты, окружения без multiprocessing).
+    """
+
+    def __init__(self, workers=2, cache_size=256, dpi=100, timeout=60):
+        self.workers = workers
+        self.cache_size = cache_size
+        self.dpi = dpi
+        self.timeout = timeout
+        self._cache = OrderedDict()  # key -> png bytes
+        self._pending = {}           # key -> Future, чтобы не рисовать одно и то же дважды
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            # spawn: форк процесса с живыми потоками бота может унести с собой захваченные блокировки
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            atexit.register(self.shutdown)
+        return self._pool
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def warm_up(self):
+        """Поднимает процессы пула и импортирует в них matplotlib заранее"""
+        if self.workers > 0:
+            pool = self._get_pool()
+            for _ in range(self.workers):
+                pool.submit(_warm_up_worker)
+
+    def render_pie(self, stats, currency_symbol="$"):
+        """PNG круговой диаграммы (bytes)"""
+        stats = {str(k): float(v) for k, v in stats.items()}
+        return self._render(_render_pie, stats, currency_symbol, self.dpi)
+
+    def render_trend(self, months, series, currency_symbol="$"):
+        """PNG столбчатой диаграммы по месяцам (bytes); series: {категория: [сумма по месяцам]}"""
+        series = {str(k): [float(v) for v in values] for k, values in series.items()}
+        return self._render(_render_trend, list(months), series, currency_symbol, self.dpi)
+
+    def _render(self, func, *args):
+        start = time.perf_counter()
+        kind = func.__name__.replace("_render_", "")
+        key = chart_key(func.__name__, *args)
+        with self._lock:
+            png = self._cache.get(key)
+            if png is not None:
+                self._cache.move_to_end(key)
+                RENDER_SECONDS.observe(time.perf_counter() - start, kind=kind, source="cache")
+                return png
+            future = self._pending.get(key)
+            owner = future is None
+            if owner:
+                future = self._pending[key] = Future()
+
+        if not owner:
+            png = future.result(timeout=self.timeout)
+            RENDER_SECONDS.observe(time.perf_counter() - start, kind=kind, source="shared")
+            return png
+
+        try:
+            if self.workers > 0:
+                png = self._get_pool().submit(func, *args).result(timeout=self.timeout)
+            else:
+                png = func(*args)
+        except BaseException as e:
+            with self._lock:
+                del self._pending[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._pending[key]
+            self._cache[key] = png
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        future.set_result(png)
+        RENDER_SECONDS.observe(time.perf_counter() - start, kind=kind, source="render")
+        return png
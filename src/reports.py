@@ -0,0 +1,88 @@
+import threading
+from collections import OrderedDict
+
+from src.trend import last_months
+
+
+def previous_month(now=None):
+    """(год, месяц) прошлого - уже закрытого - месяца"""
+    key = last_months(2, now)[0]
+    return int(key[:4]), int(key[5:7])
+
+
+class MonthReport:
+    """Отчет за месяц: траты по категориям, бюджет и готовый PNG круговой диаграммы"""
+
+    def __init__(self, year, month, currency, stats, budget, png=None):
+        self.year = year
+        self.month = month
+        self.currency = currency
+        self.stats = stats
+        self.budget = budget
+        self.png = png
+
+    @property
+    def spent(self):
+        return sum(self.stats.values())
+
+    @property
+    def remaining(self):
+        return self.budget - self.spent
+
+    @property
+    def empty(self):
+        return not self.stats
+
+
+def build_month_report(storage, renderer, year, month):
+    currency = storage.get_currency()
+    stats = storage.get_stats_by_month(year, month)
+    return _month_report(renderer, year, month, currency, stats, storage.get_budget(year, month))
+
+
+def _month_report(renderer, year, month, currency, stats, budget):
+    png = renderer.render_pie(stats, currency_symbol=currency) if stats else None
+    return MonthReport(year, month, currency, stats, budget, png)
+
+
+class ReportStore:
+    """
+    Готовые отчеты за месяц: (пользователь, год, месяц) -> MonthReport, не больше max_entries.
+    Отчет отдается, пока не изменились итоги самого месяца (по категориям, в текущей валюте),
+    валюта и бюджет месяца; иначе строится заново. Траты текущего месяца отчет за прошлый
+    не сбрасывают. Планировщик (src/scheduler.py) заполняет его заранее.
+    """
+
+    def __init__(self, renderer, max_entries=1024):
+        self.renderer = renderer
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (пользователь, год, месяц) -> (ключ, MonthReport)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_or_build(self, user_key, storage, year, month):
+        entry_key = (user_key, year, month)
+        # Итоги месяца берутся из rollup/индекса - это дешево, дорог только PNG
+        currency = storage.get_currency()
+        stats = storage.get_stats_by_month(year, month)
+        budget = storage.get_budget(year, month)
+        key = (currency, budget, tuple(sorted(stats.items())), getattr(stats, "unconverted", ()))
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry is not None and entry[0] == key:
+                self._entries.move_to_end(entry_key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        report = _month_report(self.renderer, year, month, currency, stats, budget)
+        with self._lock:
+            self._entries[entry_key] = (key, report)
+            self._entries.move_to_end(entry_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return report
@@ -0,0 +1,152 @@
+import os
+import sys
+import json
+import glob
+
+# Точность хранения сумм; меньше - считаем нулем (накопленная ошибка float)
+PRECISION = 6
+EPSILON = 1e-9
+# Версия формата файла итогов; файлы другой версии пересчитываются по CSV
+VERSION = 3
+
+
+def month_key(year, month):
+    return f"{int(year):04d}-{int(month):02d}"
+
+
+class MonthlyRollup:
+    """
+    Итоги трат по (год, месяц, валюта, категория), которые лежат рядом с CSV пользователя.
+    Суммы хранятся в валюте записей, пересчет в валюту отчета - при чтении (src/currency.py).
+
+    source - отпечаток CSV (mtime_ns, размер), для которого итоги актуальны. Если файл
+    поменялся в обход FinanceStorage, отпечаток не совпадет и итоги будут пересчитаны.
+    """
+
+    def __init__(self, months=None, source=None):
+        self.months = months or {}
+        self.source = source
+
+    @classmethod
+    def load(cls, filename):
+        """Читает итоги из файла; None, если файла нет или он поврежден"""
+        if not os.path.exists(filename):
+            return None
+        try:
+            with open(filename, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+            if raw.get("version") != VERSION:
+                # Итоги без разбивки по валютам (до версии 2) или с отпечатком только по размеру (до версии 3)
+                return None
+            source = raw.get("source")
+            return cls(raw.get("months", {}), tuple(source) if source else None)
+        except (ValueError, OSError):
+            return None
+
+    @classmethod
+    def from_frame(cls, df, source=None):
+        """Полный пересчет по DataFrame с колонками date/category/amount/currency"""
+        rollup = cls(source=source)
+        if df.empty:
+            return rollup
+        keys = df['date'].dt.strftime("%Y-%m")
+        grouped = df.groupby([keys, df['currency'], df['category']], observed=True)['amount'].sum()
+        for (key, currency, category), total in grouped.items():
+            rollup.months.setdefault(key, {}).setdefault(str(currency), {})[str(category)] = round(float(total), PRECISION)
+        return rollup
+
+    def save(self, filename):
+        # Пишем во временный файл и подменяем, чтобы не оставить половину JSON
+        tmp = f"{filename}.tmp"
+        # dumps + одна запись: json.dump в файл идет через медленный потоковый кодировщик на Python
+        data = json.dumps({"version": VERSION, "source": self.source, "months": self.months}, ensure_ascii=False)
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp, filename)
+
+    def add(self, date, category, amount, currency):
+        key = month_key(date.year, date.month)
+        currencies = self.months.setdefault(key, {})
+        categories = currencies.setdefault(currency, {})
+        total = round(categories.get(category, 0.0) + float(amount), PRECISION)
+        if abs(total) < EPSILON:
+            categories.pop(category, None)
+            if not categories:
+                del currencies[currency]
+            if not currencies:
+                del self.months[key]
+        else:
+            categories[category] = total
+
+    def remove(self, date, category, amount, currency):
+        self.add(date, category, -float(amount), currency)
+
+    def month(self, year, month):
+        """{валюта: {категория: сумма}} за месяц (копия)"""
+        return _copy(self.months.get(month_key(year, month), {}))
+
+    def between(self, first, last):
+        """{YYYY-MM: {валюта: {категория: сумма}}} за месяцы first..last включительно (копия)"""
+        return {key: _copy(currencies) for key, currencies in self.months.items() if first <= key <= last}
+
+    def available_months(self):
+        """Список (год, месяц), за которые есть траты, по возрастанию"""
+        return [tuple(int(p) for p in key.split("-")) for key in sorted(self.months)]
+
+    def diff(self, other):
+        """Месяцы/категории, где итоги расходятся (для проверки консистентности)"""
+        problems = []
+        mine, theirs = self._flat(), other._flat()
+        for key in sorted(set(mine) | set(theirs)):
+            a = mine.get(key, 0.0)
+            b = theirs.get(key, 0.0)
+            if abs(a - b) > 1e-6:
+                problems.append((*key, a, b))
+        return problems
+
+    def _flat(self):
+        """{("YYYY-MM валюта", категория): сумма}"""
+        return {(f"{key} {currency}", category): total
+                for key, currencies in self.months.items()
+                for currency, categories in currencies.items()
+                for category, total in categories.items()}
+
+
+def _copy(currencies):
+    return {currency: dict(categories) for currency, categories in currencies.items()}
+
+
+def main(argv=None):
+    """
+    python -m src.rollup check [data]   - сверить итоги с CSV
+    python -m src.rollup rebuild [data] - пересчитать итоги всех пользователей
+    """
+    from src.storage import FinanceStorage
+
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in ("check", "rebuild"):
+        print(main.__doc__)
+        return 2
+    command = argv[0]
+    data_dir = argv[1] if len(argv) > 1 else "data"
+
+    bad = 0
+    for filename in sorted(glob.glob(os.path.join(data_dir, "*_finance.csv"))):
+        storage = FinanceStorage(filename)
+        if command == "rebuild":
+            storage.rebuild_rollup()
+            print(f"OK  {filename}")
+            continue
+        problems = storage.check_rollup()
+        if problems:
+            bad += 1
+            print(f"BAD {filename}: {len(problems)} расхождений")
+            for key, category, stored, actual in problems[:10]:
+                print(f"    {key} {category}: {stored} != {actual}")
+        else:
+            print(f"OK  {filename}")
+    return 1 if bad else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
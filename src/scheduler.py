@@ -0,0 +1,236 @@
+"""
+Фоновая подготовка отчетов за прошлый месяц.
+
+Бот отмечает пользователей, которые ему пишут (touch). Раз в interval секунд планировщик
+строит для них отчет за прошлый - уже закрытый - месяц (траты по категориям, бюджет, PNG)
+в ReportStore (src/reports.py), и кнопки /history отдают готовое. Работает только пока
+бот простаивает (busy() == False) и не больше workers отчетов одновременно, чтобы не
+отнимать потоки и пул графиков у живых апдейтов.
+
+В первые DIGEST_DAYS дней месяца планировщик может один раз прислать итоги прошлого
+месяца (digest): отправка идет через Outbox с его лимитами, кому уже отправлено -
+помнит DigestLog, в том числе между перезапусками.
+
+Список активных пользователей с active_path тоже переживает перезапуск: он сохраняется
+после каждого прохода, в котором кто-то писал, и при остановке, - иначе после деплоя
+отчеты и итоги месяца ждали бы, пока каждый пользователь снова напишет.
+"""
+import os
+import json
+import time
+import atexit
+import threading
+from datetime import datetime, timedelta
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from src.metrics import REPORT_JOBS
+from src.reports import previous_month
+from src.storage import atomic_write
+
+# Пользователь, не писавший дольше, перестает считаться активным
+ACTIVE_DAYS = 35
+# Больше активных пользователей не держим - забываем тех, кто писал давно
+MAX_ACTIVE_USERS = 10000
+# Итоги месяца отправляются в первые дни следующего
+DIGEST_DAYS = 3
+# Как часто проверять, освободился ли бот, с
+IDLE_POLL = 1.0
+
+
+class DigestLog:
+    """Кому уже отправлены итоги месяца: {"month": "YYYY-MM", "users": [...]}; path=None - только в памяти"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._month = None
+        self._users = set()
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    data = json.load(f)
+                self._month, self._users = data["month"], set(data["users"])
+            except (OSError, ValueError, KeyError) as e:
+                print(f"[scheduler] не прочитан {path}: {e}")
+
+    def claim(self, user_id, month):
+        """True - итоги month пользователю еще не отправлялись (и теперь отмечены)"""
+        with self._lock:
+            if month != self._month:
+                self._month, self._users = month, set()
+            if user_id in self._users:
+                return False
+            self._users.add(user_id)
+            if self.path:
+                self._save()
+            return True
+
+    def _save(self):
+        data = {"month": self._month, "users": sorted(self._users)}
+
+        def write(tmp):
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        atomic_write(self.path, write)
+
+
+class ReportScheduler:
+    """
+    store - ReportStore, open_storage(user_id) - хранилище пользователя,
+    busy() - True, пока у бота есть необработанные апдейты или неотправленные ответы,
+    digest(user_id, report) - отправка итогов месяца (None - не отправлять),
+    active_path - JSON с активными пользователями (None - только в памяти).
+    workers=0 - отчеты строятся прямо в run_once (для тестов).
+    """
+
+    def __init__(self, store, open_storage, busy=lambda: False, digest=None, digest_log=None,
+                 workers=1, interval=30.0, clock=datetime.now, active_path=None):
+        self.store = store
+        self.open_storage = open_storage
+        self.busy = busy
+        self.digest = digest
+        self.digest_log = digest_log or DigestLog()
+        self.interval = interval
+        self.clock = clock
+        self._active = OrderedDict()  # пользователь -> когда писал последний раз
+        self._built = {}              # пользователь -> (год, месяц, когда построен)
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max(workers, 1))
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="reports") if workers > 0 else None
+        self._stop = threading.Event()
+        self._thread = None
+        self.active_path = active_path
+        self._touched = False  # были touch после последнего сохранения
+        if active_path and os.path.exists(active_path):
+            self._load_active()
+
+    def _load_active(self):
+        """[[пользователь, ISO-время], ...] по возрастанию времени; давно не писавших пропускаем"""
+        expired = self.clock() - timedelta(days=ACTIVE_DAYS)
+        try:
+            with open(self.active_path, encoding="utf-8") as f:
+                entries = json.load(f)
+            for user_id, seen in entries[-MAX_ACTIVE_USERS:]:
+                seen = datetime.fromisoformat(seen)
+                if seen >= expired:
+                    self._active[user_id] = seen
+        except (OSError, ValueError, TypeError) as e:
+            print(f"[scheduler] не прочитан {self.active_path}: {e}")
+
+    def save_active(self):
+        """Сохраняет активных пользователей, если с прошлого раза кто-то писал"""
+        if not self.active_path:
+            return
+        with self._lock:
+            if not self._touched:
+                return
+            self._touched = False
+            entries = [[user_id, seen.isoformat()] for user_id, seen in self._active.items()]
+
+        def write(tmp):
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(entries, f)
+
+        try:
+            directory = os.path.dirname(self.active_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            atomic_write(self.active_path, write)
+        except OSError as e:
+            with self._lock:
+                self._touched = True
+            print(f"[scheduler] не сохранен {self.active_path}: {e}")
+
+    def start(self):
+        if self._thread is not None:
+            return self
+        self._thread = threading.Thread(target=self._run, name="report-scheduler", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+        return self
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+        self.save_active()
+
+    def touch(self, user_id):
+        """Пользователь написал боту"""
+        with self._lock:
+            self._active[user_id] = self.clock()
+            self._active.move_to_end(user_id)
+            self._touched = True
+            while len(self._active) > MAX_ACTIVE_USERS:
+                user, _ = self._active.popitem(last=False)
+                self._built.pop(user, None)
+
+    def due(self, now=None):
+        """Активные пользователи, чей отчет за прошлый месяц не построен или устарел"""
+        now = now or self.clock()
+        year, month = previous_month(now)
+        expired = now - timedelta(days=ACTIVE_DAYS)
+        with self._lock:
+            while self._active and next(iter(self._active.values())) < expired:
+                user, _ = self._active.popitem(last=False)
+                self._built.pop(user, None)
+            result = []
+            for user, seen in self._active.items():
+                built = self._built.get(user)
+                # Писал после построения - данные могли измениться (отчет перестроится, только если изменились)
+                if built is None or built[:2] != (year, month) or seen > built[2]:
+                    result.append(user)
+            return result
+
+    def run_once(self, now=None):
+        """Один проход: ставит в работу отчеты всех due-пользователей; возвращает их число"""
+        now = now or self.clock()
+        users = self.due(now)
+        for user_id in users:
+            if not self._wait_idle():
+                break
+            self._slots.acquire()
+            if self._pool is None:
+                self._job(user_id, now)
+            else:
+                self._pool.submit(self._job, user_id, now)
+        return len(users)
+
+    def _wait_idle(self):
+        while self.busy():
+            if self._stop.wait(IDLE_POLL):
+                return False
+        return not self._stop.is_set()
+
+    def _job(self, user_id, now):
+        try:
+            year, month = previous_month(now)
+            report = self.store.get_or_build(user_id, self.open_storage(user_id), year, month)
+            with self._lock:
+                if user_id in self._active:
+                    self._built[user_id] = (year, month, now)
+            if (self.digest is not None and not report.empty and now.day <= DIGEST_DAYS
+                    and self.digest_log.claim(user_id, f"{year:04d}-{month:02d}")):
+                self.digest(user_id, report)
+            REPORT_JOBS.inc(result="ok")
+        except Exception as e:
+            REPORT_JOBS.inc(result="failed")
+            print(f"[scheduler] отчет {user_id}: {e}")
+        finally:
+            self._slots.release()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            start = time.perf_counter()
+            count = self.run_once()
+            self.save_active()
+            if count:
+                print(f"[scheduler] отчетов в работе: {count} за {time.perf_counter() - start:.1f} с")
@@ -0,0 +1,93 @@
+import re
+import bisect
+from array import array
+
+from src.records import to_cents, from_cents
+
+_WORD = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """Слова в нижнем регистре; пунктуация и спецсимволы отбрасываются"""
+    return _WORD.findall(str(text).lower())
+
+
+class SearchIndex:
+    """
+    Инвертированный индекс по категории и заметке одного пользователя.
+
+    Позиция записи - ее номер строки в истории (0, 1, 2, ...). Записи добавляются
+    и удаляются только с конца, поэтому списки позиций всегда отсортированы.
+    Запрос - набор слов; каждое слово ищется как префикс, слова объединяются через И.
+    """
+
+    def __init__(self):
+        self.postings = {}  # слово -> [позиции по возрастанию]
+        self.words = []     # отсортированный словарь для поиска по префиксу
+        self.amounts = array("q")  # сумма в копейках по позиции - итоги без чтения истории и без ошибки float
+
+    @classmethod
+    def from_frame(cls, df):
+        index = cls()
+        for category, amount, note in df[["category", "amount", "note"]].itertuples(index=False):
+            index.add(category, amount, note)
+        return index
+
+    def __len__(self):
+        return len(self.amounts)
+
+    @property
+    def nbytes(self):
+        # Оценка для лимита памяти кэша
+        return 56 * len(self.amounts) + 80 * len(self.words)
+
+    def add(self, category, amount, note=""):
+        position = len(self.amounts)
+        self.amounts.append(to_cents(amount))
+        for word in set(tokenize(category) + tokenize(note)):
+            positions = self.postings.get(word)
+            if positions is None:
+                self.postings[word] = [position]
+                bisect.insort(self.words, word)
+            else:
+                positions.append(position)
+
+    def remove_last(self, category, note=""):
+        """Удаляет последнюю запись (её категорию и заметку нужно передать)"""
+        if not self.amounts:
+            return
+        position = len(self.amounts) - 1
+        self.amounts.pop()
+        for word in set(tokenize(category) + tokenize(note)):
+            positions = self.postings.get(word)
+            if positions and positions[-1] == position:
+                positions.pop()
+                if not positions:
+                    del self.postings[word]
+                    del self.words[bisect.bisect_left(self.words, word)]
+
+    def _prefix_positions(self, prefix):
+        start = bisect.bisect_left(self.words, prefix)
+        matched = set()
+        for word in self.words[start:]:
+            if not word.startswith(prefix):
+                break
+            matched.update(self.postings[word])
+        return matched
+
+    def search(self, query):
+        """Позиции всех подходящих записей, от новых к старым"""
+        words = tokenize(query)
+        if not words:
+            return []
+        # Начинаем с самого редкого префикса, чтобы пересечения были короче
+        sets = sorted((self._prefix_positions(word) for word in words), key=len)
+        result = sets[0]
+        for other in sets[1:]:
+            if not result:
+                break
+            result = result & other
+        return sorted(result, reverse=True)
+
+    def total(self, positions):
+        return from_cents(sum(self.amounts[p] for p in positions))
@@ -0,0 +1,421 @@
+import os
+import sys
+import glob
+import sqlite3
+import threading
+from datetime import datetime
+
+from src.storage import COLUMNS, LEDGER_COLUMNS, DATE_FORMAT, budget_summary, hash_records, pd
+from src.search_index import tokenize
+from src.metrics import instrument_storage, record_io
+from src.records import Record, to_epoch_us, to_cents, from_cents
+from src.trend import totals_from_cents
+from src.currency import rates, category_totals, converted_totals, Totals
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS expenses (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    category TEXT NOT NULL,
+    amount REAL NOT NULL,
+    note TEXT NOT NULL DEFAULT '',
+    -- NULL - текущая валюта пользователя (записи до появления валют у трат)
+    currency TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_expenses_user_date ON expenses (user_id, date);
+CREATE INDEX IF NOT EXISTS idx_expenses_user_category ON expenses (user_id, category);
+-- Последние записи и /undo - обратным проходом по этому индексу, без сортировки всей истории пользователя
+CREATE INDEX IF NOT EXISTS idx_expenses_user_id ON expenses (user_id, id);
+
+CREATE TABLE IF NOT EXISTS budgets (
+    user_id INTEGER NOT NULL,
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    amount REAL NOT NULL,
+    PRIMARY KEY (user_id, year, month)
+);
+
+CREATE TABLE IF NOT EXISTS config (
+    user_id INTEGER PRIMARY KEY,
+    currency TEXT NOT NULL
+);
+
+-- Полнотекстовый индекс для /search. owner = 'u<user_id>', чтобы фильтр по пользователю шел через индекс
+-- (в запросе - в кавычках: у групповых чатов id отрицательные)
+CREATE VIRTUAL TABLE IF NOT EXISTS expenses_fts USING fts5(owner, category, note, content='');
+
+CREATE TRIGGER IF NOT EXISTS expenses_fts_insert AFTER INSERT ON expenses BEGIN
+    INSERT INTO expenses_fts (rowid, owner, category, note)
+    VALUES (new.id, 'u' || new.user_id, new.category, new.note);
+END;
+
+CREATE TRIGGER IF NOT EXISTS expenses_fts_delete AFTER DELETE ON expenses BEGIN
+    INSERT INTO expenses_fts (expenses_fts, rowid, owner, category, note)
+    VALUES ('delete', old.id, 'u' || old.user_id, old.category, old.note);
+END;
+"""
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_initialized = set()
+
+
+def connect(db_path):
+    """
+    Соединение с базой для текущего потока (sqlite3 не любит делить соединения между потоками).
+    WAL позволяет читать параллельно с записью.
+    """
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(db_path)
+    if conn is None:
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(db_path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with _schema_lock:
+            if db_path not in _initialized:
+                conn.executescript(SCHEMA)
+                _add_currency_column(conn)
+                _backfill_search_index(conn)
+                _initialized.add(db_path)
+        connections[db_path] = conn
+    return conn
+
+
+def _add_currency_column(conn):
+    """Базы, созданные до появления валюты у трат: колонка currency, у старых записей NULL"""
+    if "currency" not in [row[1] for row in conn.execute("PRAGMA table_info(expenses)")]:
+        with conn:
+            conn.execute("ALTER TABLE expenses ADD COLUMN currency TEXT")
+
+
+def _backfill_search_index(conn):
+    """Базы, созданные до появления FTS-индекса, индексируем один раз целиком"""
+    if conn.execute("SELECT COUNT(*) FROM expenses_fts").fetchone()[0] > 0:
+        return
+    with conn:
+        conn.execute(
+            "INSERT INTO expenses_fts (rowid, owner, category, note) "
+            "SELECT id, 'u' || user_id, category, note FROM expenses"
+        )
+
+
+def _month_range(year, month):
+    """Границы месяца в формате хранения дат: [начало, начало следующего)"""
+    start = datetime(year, month, 1)
+    end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+    return start.strftime(DATE_FORMAT), end.strftime(DATE_FORMAT)
+
+
+def _to_record(row):
+    date, category, amount, note, currency = row
+    return Record(to_epoch_us(datetime.strptime(date, DATE_FORMAT)), category, to_cents(amount), note, currency)
+
+
+@instrument_storage
+class SQLiteFinanceStorage:
+    """
+    То же API, что у FinanceStorage, но все пользователи лежат в одной базе SQLite.
+    Выборки за месяц идут по индексу (user_id, date), а не полным чтением истории.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, db_path, user_id):
+        self.db_path = db_path
+        self.user_id = int(user_id)
+
+    @property
+    def conn(self):
+        return connect(self.db_path)
+
+    # --- РАБОТА С КОНФИГОМ (ВАЛЮТА) ---
+    def set_currency(self, currency_symbol):
+        """Сохраняет валюту пользователя. Прежние траты остаются в своей валюте"""
+        current = self.get_currency()
+        with self.conn:
+            if currency_symbol != current:
+                self.conn.execute(
+                    "UPDATE expenses SET currency = ? WHERE user_id = ? AND currency IS NULL",
+                    (current, self.user_id)
+                )
+            self.conn.execute(
+                "INSERT INTO config (user_id, currency) VALUES (?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET currency = excluded.currency",
+                (self.user_id, currency_symbol)
+            )
+
+    def get_currency(self):
+        """Читает валюту (по умолчанию $)"""
+        row = self.conn.execute("SELECT currency FROM config WHERE user_id = ?", (self.user_id,)).fetchone()
+        return row[0] if row else "$"
+
+    # --- РАБОТА С ДАННЫМИ ---
+    def add_expense(self, category, amount, note=""):
+        currency = self.get_currency()
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO expenses (user_id, date, category, amount, note, currency) VALUES (?, ?, ?, ?, ?, ?)",
+                (self.user_id, datetime.now().strftime(DATE_FORMAT), category, amount, note, currency)
+            )
+        record_io(self.backend, "write", rows=1)
+
+    def add_expenses(self, entries):
+        """Пакетная запись одной транзакцией"""
+        now = datetime.now()
+        current = self.get_currency()
+        rows = [
+            (self.user_id, (entry.get("date") or now).strftime(DATE_FORMAT),
+             entry["category"], entry["amount"], entry.get("note", ""), entry.get("currency") or current)
+            for entry in entries
+        ]
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO expenses (user_id, date, category, amount, note, currency) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        record_io(self.backend, "write", rows=len(rows))
+        return len(rows)
+
+    def delete_last_expense(self):
+        with self.conn:
+            cursor = self.conn.execute(
+                "DELETE FROM expenses WHERE id = (SELECT MAX(id) FROM expenses WHERE user_id = ?)",
+                (self.user_id,)
+            )
+        return cursor.rowcount > 0
+
+    def get_last_records(self, n=10):
+        rows = self.conn.execute(
+            "SELECT date, category, amount, note, COALESCE(currency, ?) FROM expenses "
+            "WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+            (self.get_currency(), self.user_id, n)
+        ).fetchall()
+        record_io(self.backend, "read", rows=len(rows))
+        return [_to_record(row) for row in rows]
+
+    def search(self, query, n=10):
+        """То же, что FinanceStorage.search, но через FTS5: слова ищутся как префиксы"""
+        words = tokenize(query)
+        if not words:
+            return {"records": [], "count": 0, "total": 0.0}
+        match = " AND ".join([f'owner:"u{self.user_id}"'] + [f'"{word}"*' for word in words])
+        current = self.get_currency()
+        by_currency = {currency: (count, cents) for currency, count, cents in self.conn.execute(
+            # Сумма в копейках: сложение REAL накапливало бы ошибку (0.1 + 0.2)
+            "SELECT COALESCE(e.currency, ?), COUNT(*), SUM(CAST(ROUND(e.amount * 100) AS INTEGER)) FROM expenses_fts f "
+            "JOIN expenses e ON e.id = f.rowid WHERE expenses_fts MATCH ? GROUP BY 1",
+            (current, match)
+        )}
+        count = sum(count for count, _ in by_currency.values())
+        unconverted = ()
+        total = from_cents(sum(cents for _, cents in by_currency.values()))
+        if set(by_currency) - {current}:
+            # Есть траты в других валютах - пересчитываем найденные одним проходом
+            found = pd.DataFrame(self.conn.execute(
+                "SELECT e.date, e.category, e.amount, COALESCE(e.currency, ?) FROM expenses_fts f "
+                "JOIN expenses e ON e.id = f.rowid WHERE expenses_fts MATCH ?",
+                (current, match)
+            ).fetchall(), columns=["date", "category", "amount", "currency"])
+            found["date"] = pd.to_datetime(found["date"], format=DATE_FORMAT)
+            totals = category_totals(found, current)
+            total, unconverted = round(sum(totals.values()), 2), totals.unconverted
+        rows = self.conn.execute(
+            "SELECT e.date, e.category, e.amount, e.note, COALESCE(e.currency, ?) FROM expenses_fts f "
+            "JOIN expenses e ON e.id = f.rowid WHERE expenses_fts MATCH ? "
+            "ORDER BY f.rowid DESC LIMIT ?",
+            (current, match, n)
+        ).fetchall()
+        return {"records": [_to_record(row) for row in rows], "count": count, "total": total, "unconverted": unconverted}
+
+    def search_records(self, query):
+        return self.search(query)["records"]
+
+    def reset_data(self):
+        # Удаляем траты и бюджет, но конфиг (валюту) оставляем
+        with self.conn:
+            self.conn.execute("DELETE FROM expenses WHERE user_id = ?", (self.user_id,))
+            self.conn.execute("DELETE FROM budgets WHERE user_id = ?", (self.user_id,))
+
+    def get_stats_by_month(self, year, month, currency=None):
+        """Траты по категориям за месяц в валюте currency (по умолчанию - текущей)"""
+        start, end = _month_range(year, month)
+        current = self.get_currency()
+        target = currency or current
+        by_currency = {}
+        for cur, category, total in self.conn.execute(
+            "SELECT COALESCE(currency, ?), category, SUM(amount) FROM expenses "
+            "WHERE user_id = ? AND date >= ? AND date < ? GROUP BY 1, 2",
+            (current, self.user_id, start, end)
+        ):
+            by_currency.setdefault(cur, {})[category] = total
+        if set(by_currency) <= {target}:
+            return by_currency.get(target, {})
+        # Траты в разных валютах: пересчет всех трат месяца, с кэшем до новых записей
+        return converted_totals.get_or_build(
+            (f"{self.db_path}#{self.user_id}", f"{year:04d}-{month:02d}", target), self.data_version(),
+            lambda: category_totals(self._frame(start, end, current), target)
+        )
+
+    def _frame(self, start, end, current):
+        """Траты за [start, end) (даты в формате хранения) - date/category/amount/currency"""
+        rows = self.conn.execute(
+            "SELECT date, category, amount, COALESCE(currency, ?) FROM expenses "
+            "WHERE user_id = ? AND date >= ? AND date < ?",
+            (current, self.user_id, start, end)
+        ).fetchall()
+        record_io(self.backend, "read", rows=len(rows))
+        df = pd.DataFrame(rows, columns=["date", "category", "amount", "currency"])
+        df["date"] = pd.to_datetime(df["date"], format=DATE_FORMAT)
+        return df
+
+    def get_monthly_totals(self, first, last, currency=None):
+        """{YYYY-MM: {категория: сумма}} за месяцы first..last - один GROUP BY по индексу"""
+        start = _month_range(int(first[:4]), int(first[5:7]))[0]
+        end = _month_range(int(last[:4]), int(last[5:7]))[1]
+        current = self.get_currency()
+        target = currency or current
+        rows = self.conn.execute(
+            "SELECT substr(date, 1, 7), COALESCE(currency, ?), category, SUM(CAST(ROUND(amount * 100) AS INTEGER)) "
+            "FROM expenses WHERE user_id = ? AND date >= ? AND date < ? GROUP BY 1, 2, 3",
+            (current, self.user_id, start, end)
+        ).fetchall()
+        record_io(self.backend, "read", rows=len(rows))
+        if any(cur != target for _, cur, _, _ in rows):
+            # Пересчет всего диапазона одним merge_asof по курсам на даты трат
+            df = self._frame(start, end, current)
+            missing = set()
+            cents = rates.convert_cents(df["amount"].mul(100).round(), df["currency"], df["date"], target, missing)
+            return Totals(totals_from_cents(pd.Series(cents).groupby([df["date"].dt.strftime("%Y-%m"), df["category"]]).sum()),
+                          sorted(missing))
+        return totals_from_cents({(key, category): cents for key, _, category, cents in rows})
+
+    def get_available_months(self):
+        """Список (год, месяц), за которые есть траты"""
+        rows = self.conn.execute(
+            "SELECT DISTINCT substr(date, 1, 7) FROM expenses WHERE user_id = ? ORDER BY 1",
+            (self.user_id,)
+        ).fetchall()
+        return [tuple(int(p) for p in key.split("-")) for (key,) in rows]
+
+    # --- БЮДЖЕТ ---
+    def set_budget(self, amount):
+        now = datetime.now()
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO budgets (user_id, year, month, amount) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(user_id, year, month) DO UPDATE SET amount = excluded.amount",
+                (self.user_id, now.year, now.month, float(amount))
+            )
+
+    def get_budget(self, year, month):
+        """Бюджет на месяц (0 - не задан)"""
+        row = self.conn.execute(
+            "SELECT amount FROM budgets WHERE user_id = ? AND year = ? AND month = ?",
+            (self.user_id, year, month)
+        ).fetchone()
+        return row[0] if row else 0.0
+
+    def get_budget_status(self):
+        now = datetime.now()
+        budget_amount = self.get_budget(now.year, now.month)
+        return budget_summary(budget_amount, self.get_stats_by_month(now.year, now.month), now)
+
+    def record_hashes(self):
+        """Хэши всех записей - для поиска дублей при импорте выписок"""
+        rows = self.conn.execute(
+            "SELECT date, category, amount, note FROM expenses WHERE user_id = ?", (self.user_id,)
+        ).fetchall()
+        record_io(self.backend, "read", rows=len(rows))
+        return set(hash_records(pd.DataFrame(rows, columns=COLUMNS)))
+
+    # --- ВЫГРУЗКА ---
+    def data_version(self):
+        """Меняется при любой записи: ключ для кэша выгрузок"""
+        return self.conn.execute(
+            "SELECT COUNT(*), MAX(id) FROM expenses WHERE user_id = ?", (self.user_id,)
+        ).fetchone()
+
+    def iter_frames(self, start=None, end=None, chunksize=50000):
+        """История кусками по chunksize строк (даты в [start, end)) - курсором по индексу"""
+        sql = "SELECT date, category, amount, note, COALESCE(currency, ?) FROM expenses WHERE user_id = ?"
+        params = [self.get_currency(), self.user_id]
+        if start is not None:
+            sql += " AND date >= ?"
+            params.append(start.strftime(DATE_FORMAT))
+        if end is not None:
+            sql += " AND date < ?"
+            params.append(end.strftime(DATE_FORMAT))
+        cursor = self.conn.execute(sql + " ORDER BY id", params)
+        while True:
+            rows = cursor.fetchmany(chunksize)
+            if not rows:
+                break
+            record_io(self.backend, "read", rows=len(rows))
+            chunk = pd.DataFrame(rows, columns=LEDGER_COLUMNS)
+            chunk['date'] = pd.to_datetime(chunk['date'], format=DATE_FORMAT)
+            yield chunk
+
+
+def migrate(data_dir="data", db_path=None):
+    """
+    Переносит файлы data/{id}_finance.csv, _budget.csv и _config.json в базу.
+    Повторный запуск безопасен: данные пользователя в базе заменяются целиком.
+    """
+    from src.storage import FinanceStorage
+
+    db_path = db_path or os.path.join(data_dir, "finance.db")
+    conn = connect(db_path)
+    migrated = 0
+    for filename in sorted(glob.glob(os.path.join(data_dir, "*_finance.csv"))):
+        user_id = os.path.basename(filename)[:-len("_finance.csv")]
+        if not user_id.lstrip("-").isdigit():
+            continue
+        source = FinanceStorage(filename)
+        df = source._load_data()
+        rows = [
+            (int(user_id), date.strftime(DATE_FORMAT), str(category), float(amount), str(note), str(currency))
+            for date, category, amount, note, currency in df[LEDGER_COLUMNS].itertuples(index=False)
+        ]
+        budgets = source._load_budgets()
+        with conn:
+            conn.execute("DELETE FROM expenses WHERE user_id = ?", (int(user_id),))
+            conn.execute("DELETE FROM budgets WHERE user_id = ?", (int(user_id),))
+            conn.executemany(
+                "INSERT INTO expenses (user_id, date, category, amount, note, currency) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO budgets (user_id, year, month, amount) VALUES (?, ?, ?, ?)",
+                [(int(user_id), int(y), int(m), float(a)) for y, m, a in budgets[["year", "month", "amount"]].itertuples(index=False)]
+            )
+            if os.path.exists(source.config_filename):
+                conn.execute(
+                    "INSERT OR REPLACE INTO config (user_id, currency) VALUES (?, ?)",
+                    (int(user_id), source.get_currency())
+                )
+        migrated += 1
+        print(f"OK  {user_id}: {len(rows)} записей")
+    return migrated
+
+
+def main(argv=None):
+    """python -m src.sqlite_storage migrate [data] [data/finance.db]"""
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] != "migrate":
+        print(main.__doc__)
+        return 2
+    data_dir = argv[1] if len(argv) > 1 else "data"
+    db_path = argv[2] if len(argv) > 2 else None
+    count = migrate(data_dir, db_path)
+    print(f"Перенесено пользователей: {count}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+import sys
+import time
+import importlib
+import threading
+
+# Момент, от которого считаем время старта (модуль импортируется первым в main.py)
+STARTED_AT = time.perf_counter()
+
+
+class StartupReport:
+    """Тайминги холодного старта: импорты модулей, первый getUpdates, фоновый прогрев"""
+
+    def __init__(self):
+        self.events = []  # (название, миллисекунды)
+        self._lock = threading.Lock()
+        self.first_updates_ms = None
+
+    def record(self, name, ms):
+        with self._lock:
+            self.events.append((name, ms))
+
+    def since_start_ms(self):
+        return (time.perf_counter() - STARTED_AT) * 1000
+
+    def dump(self):
+        print("[startup] --- отчет о запуске ---")
+        with self._lock:
+            events = list(self.events)
+        for name, ms in events:
+            print(f"[startup] {name}: {ms:.0f} ms")
+        if self.first_updates_ms is not None:
+            print(f"[startup] первый getUpdates через {self.first_updates_ms:.0f} ms после старта")
+
+
+report = StartupReport()
+
+
+def timed_import(name):
+    """import_module с записью времени в отчет"""
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    report.record(f"import {name}", (time.perf_counter() - start) * 1000)
+    return module
+
+
+class LazyModule:
+    """
+    Модуль, который импортируется при первом обращении к атрибуту.
+    Тяжелые зависимости (pandas) не тормозят старт, если запросу они не нужны.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    if self._name in sys.modules:
+                        self._module = sys.modules[self._name]
+                    else:
+                        start = time.perf_counter()
+                        module = importlib.import_module(self._name)
+                        report.record(f"lazy import {self._name}", (time.perf_counter() - start) * 1000)
+                        self._module = module
+        return self._module
+
+    def __getattr__(self, item):
+        return getattr(self._load(), item)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_import(name):
+    return LazyModule(name)
+
+
+def warm_up(*tasks):
+    """
+    Запускает прогрев в фоновом потоке (например, импорт pandas), чтобы первый
+    тяжелый запрос после пробуждения не ждал его. tasks - вызываемые объекты.
+    """
+    def run():
+        for task in tasks:
+            start = time.perf_counter()
+            try:
+                task()
+            except Exception as e:
+                print(f"[startup] прогрев не удался: {e}")
+                continue
+            name = getattr(task, "__name__", repr(task))
+            report.record(f"warm-up {name} (фон)", (time.perf_counter() - start) * 1000)
+        report.dump()
+
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def track_first_updates(bot, on_first=None):
+    """
+    Оборачивает bot.get_updates, чтобы засечь первый ответ Telegram.
+    После первого вызова обертка снимается и вызывается on_first().
+    """
+    original = bot.get_updates
+
+    def first_get_updates(*args, **kwargs):
+        result = original(*args, **kwargs)
+        if report.first_updates_ms is None:
+            report.first_updates_ms = report.since_start_ms()
+            bot.get_updates = original
+            if on_first is not None:
+                on_first()
+        return result
+
+    bot.get_updates = first_get_updates
@@ -1,14 +1,72 @@
-import pandas as pd
+import io
 import os
+import csv
 import json
 import calendar
+import functools
+import threading
 from datetime import datetime
 
+from src.cache import _file_signature
+from src.rollup import MonthlyRollup
+from src.metrics import instrument_storage, record_io
+from src.startup import lazy_import
+from src.search_index import SearchIndex
+from src.records import Record, records_from_frame, records_at, compact_frame, CachedHistory
+from src.currency import category_totals, converted_totals, Totals, unconverted_of
+
+# pandas грузится при первом обращении: /start и запись траты обходятся без него
+pd = lazy_import("pandas")
+
+COLUMNS = ["date", "category", "amount", "note"]
+# Колонка currency появляется в файле, когда в нем впервые оказываются траты в разных валютах.
+# Траты без нее - в валюте, которая была у пользователя до первой смены (legacy_currency в конфиге)
+LEDGER_COLUMNS = COLUMNS + ["currency"]
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+_user_locks = {}
+_user_locks_guard = threading.Lock()
+
+
+def user_lock(filename):
+    """Одна блокировка на файл пользователя на весь процесс"""
+    with _user_locks_guard:
+        return _user_locks.setdefault(os.path.abspath(filename), threading.RLock())
+
+
+def locked(method):
+    """Выполняет метод под блокировкой пользователя: чтение-изменение-запись не перемешиваются"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def atomic_write(path, write):
+    """write(tmp_path) пишет во временный файл, который затем атомарно подменяет path"""
+    tmp = f"{path}.tmp"
+    write(tmp)
+    os.replace(tmp, path)
+
+@instrument_storage
 class FinanceStorage:
-    def __init__(self, filename):
+    backend = "csv"
+
+    def __init__(self, filename, cache=None):
         self.filename = filename
-        self.budget_filename = filename.replace("_finance.csv", "_budget.csv")
-        self.config_filename = filename.replace("_finance.csv", "_config.json")
+        # Общий StorageCache (src/cache.py); None - читаем файлы каждый раз
+        self.cache = cache
+        self.lock = user_lock(filename)
+        base = filename[:-len("_finance.csv")] if filename.endswith("_finance.csv") else os.path.splitext(filename)[0]
+        self.base_path = base
+        # Файл, изменение которого делает устаревшими производные структуры в кэше (поисковый индекс)
+        self.data_source = filename
+        self.budget_filename = f"{base}_budget.csv"
+        self.config_filename = f"{base}_config.json"
+        self.rollup_filename = f"{base}_rollup.json"
+        # Ключ поискового индекса в кэше (на диск не пишется)
+        self.search_key = f"{filename}#search"
         
         # Создаем папку data, если нет
         directory = os.path.dirname(filename)
@@ -16,133 +74,582 @@ class FinanceStorage:
             os.makedirs(directory, exist_ok=True)
             
     # --- РАБОТА С КОНФИГОМ (ВАЛЮТА) ---
+    @locked
     def set_currency(self, currency_symbol):
-        """Сохраняет валюту пользователя"""
+        """Сохраняет валюту пользователя. Прежние траты остаются в своей валюте"""
         config = {"currency": currency_symbol}
-        with open(self.config_filename, "w", encoding="utf-8") as f:
-            json.dump(config, f)
+        legacy = self._pinned_legacy(self._load_config())
+        if legacy:
+            config["legacy_currency"] = legacy
+
+        def write(tmp):
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(config, f)
+        atomic_write(self.config_filename, write)
+        if self.cache is not None:
+            self.cache.put(self.config_filename, config)
 
     def get_currency(self):
         """Читает валюту (по умолчанию $)"""
+        return self._load_config().get("currency", "$")
+
+    def _legacy_currency(self):
+        """Валюта трат, записанных без колонки currency (та, что была до первой смены валюты)"""
+        config = self._load_config()
+        return config.get("legacy_currency") or config.get("currency", "$")
+
+    def _pinned_legacy(self, config):
+        """
+        legacy_currency для конфига при смене валюты: запоминаем прежнюю валюту,
+        только если есть траты без колонки currency (иначе им не в чем остаться)
+        """
+        if config.get("legacy_currency") or not self._has_unlabeled_records():
+            return config.get("legacy_currency")
+        return config.get("currency", "$")
+
+    def _has_unlabeled_records(self):
+        return self._read_header() != LEDGER_COLUMNS and self._tail(1)[0] is not None
+
+    def _load_config(self):
+        if self.cache is not None:
+            return self.cache.get(self.config_filename, self._read_config)
+        return self._read_config()
+
+    def _read_config(self):
         if os.path.exists(self.config_filename):
             try:
                 with open(self.config_filename, "r", encoding="utf-8") as f:
-                    config = json.load(f)
-                    return config.get("currency", "$")
+                    return json.load(f)
             except:
-                return "$"
-        return "$"
+                return {}
+        return {}
 
     # --- РАБОТА С ДАННЫМИ ---
     def _load_data(self):
+        """История трат. Результат может быть общим объектом из кэша - не изменять!"""
+        if self.cache is not None:
+            return self.cache.get(self.filename, lambda: CachedHistory(self._read_data())).frame()
+        return self._read_data()
+
+    def _read_data(self):
         if os.path.exists(self.filename):
-            df = pd.read_csv(self.filename, parse_dates=['date'])
+            with open(self.filename, "rb") as f:
+                self._skip_preamble(f)
+                df = pd.read_csv(f, parse_dates=['date'])
             if 'note' not in df.columns:
                 df['note'] = "" 
-            return df.fillna("")
+            if 'currency' not in df.columns:
+                df['currency'] = self._legacy_currency()
+            record_io(self.backend, "read", os.path.getsize(self.filename), len(df))
+            return compact_frame(df.fillna(""))
         else:
-            return pd.DataFrame(columns=["date", "category", "amount", "note"])
+            return pd.DataFrame(columns=LEDGER_COLUMNS)
+
+    def _read_header(self):
+        """Возвращает список колонок из первой строки CSV (или None, если файла нет)"""
+        if not os.path.exists(self.filename) or os.path.getsize(self.filename) == 0:
+            return None
+        with open(self.filename, "r", encoding="utf-8", newline="") as f:
+            self._skip_preamble(f)
+            return next(csv.reader(f), None)
+
+    def _skip_preamble(self, f):
+        """Пропускает служебные строки перед заголовком CSV (у обычного файла их нет)"""
+
+    def _append_rows(self, rows):
+        """
+        Дописывает строки в конец CSV, не перечитывая историю.
+        Формат тот же, что у pandas.to_csv, поэтому старые файлы и выгрузка не ломаются.
+        """
+        header = self._read_header()
+        legacy = self._legacy_currency()
+        ledger = header == LEDGER_COLUMNS or any(row["currency"] != legacy for row in rows)
+        columns = LEDGER_COLUMNS if ledger else COLUMNS
+        if header is not None and header != columns:
+            # Старый формат (например, без колонки note) или первая трата после смены валюты -
+            # один раз переписываем целиком
+            df = self._load_data()
+            df = pd.concat([df[columns], pd.DataFrame(rows, columns=LEDGER_COLUMNS)[columns]], ignore_index=True)
+            self._write_frame(df)
+            self.rebuild_rollup()
+            return
+
+        rollup = self._load_rollup()
+
+        cached = self.cache.peek(self.filename) if self.cache is not None else None
+        index = self._peek_search_index()
+        size_before = self._data_size()
+
+        with open(self.filename, "a", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f, lineterminator="\n")
+            if header is None:
+                writer.writerow(columns)
+            elif not self._ends_with_newline():
+                f.write("\n")
+            for row in rows:
+                writer.writerow([
+                    row["date"].strftime(DATE_FORMAT),
+                    row["category"],
+                    row["amount"],
+                    row["note"]
+                ] + ([row["currency"]] if ledger else []))
 
+        record_io(self.backend, "write", self._data_size() - size_before, len(rows))
+
+        for row in rows:
+            rollup.add(row["date"], row["category"], row["amount"], row["currency"])
+        self._save_rollup(rollup)
+
+        if self.cache is not None:
+            if cached is not None and not cached.empty:
+                # Строки уходят в хвост кэшированной истории, DataFrame не пересобирается
+                cached.append(rows)
+                self.cache.put(self.filename, cached)
+            else:
+                self.cache.invalidate(self.filename)
+            if index is not None:
+                for row in rows:
+                    index.add(row["category"], row["amount"], row["note"])
+                self.cache.put(self.search_key, index, source=self.data_source)
+
+    def _write_frame(self, df):
+        """Переписывает историю целиком (смена формата файла)"""
+        atomic_write(self.filename, lambda tmp: df.to_csv(tmp, index=False, date_format=DATE_FORMAT))
+        if self.cache is not None:
+            self.cache.invalidate(self.filename)
+            self.cache.invalidate(self.search_key)
+
+    def _ends_with_newline(self):
+        with open(self.filename, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    @locked
     def add_expense(self, category, amount, note=""):
-        df = self._load_data()
-        current_date = datetime.now()
-        
         new_row = {
-            "date": current_date, 
-            "category": category, 
+            "date": datetime.now(),
+            "category": category,
             "amount": amount,
-            "note": note
+            "note": note,
+            "currency": self.get_currency()
         }
-        
-        new_df = pd.DataFrame([new_row])
-        if df.empty:
-            df = new_df
-        else:
-            df = pd.concat([df, new_df], ignore_index=True)
-            
-        df.to_csv(self.filename, index=False)
+        self._append_rows([new_row])
+
+    @locked
+    def add_expenses(self, entries):
+        """
+        Пакетная запись: одна дозапись в CSV, одно обновление итогов и кэша.
+        entries - словари category/amount/note (и необязательно date, currency).
+        """
+        now = datetime.now()
+        current = self.get_currency()
+        rows = [
+            {
+                "date": entry.get("date") or now,
+                "category": entry["category"],
+                "amount": entry["amount"],
+                "note": entry.get("note", ""),
+                "currency": entry.get("currency") or current
+            }
+            for entry in entries
+        ]
+        if rows:
+            self._append_rows(rows)
+        return len(rows)
 
+    def _tail(self, n):
+        """
+        Последние n записей, прочитанные блоками с конца файла (без разбора всей истории).
+        Возвращает (offset начала первой из них, [строки записей от старых к новым]); записей нет - (None, []).
+        Перевод строки в кавычках (многострочная заметка) границей записи не считается.
+        """
+        if n <= 0 or not os.path.exists(self.filename):
+            return None, []
+        with open(self.filename, "rb") as f:
+            self._skip_preamble(f)
+            f.readline()
+            header_end = f.tell()
+            pos = end = f.seek(0, os.SEEK_END)
+            data = b""
+            block = 4096
+            while pos > header_end:
+                step = min(block, pos - header_end)
+                pos -= step
+                f.seek(pos)
+                data = f.read(step) + data
+                block = min(block * 2, 1024 * 1024)
+                body = data.rstrip(b"\r\n")
+                # Нужно n записей плюс граница перед первой из них
+                if body.count(b"\n") < n:
+                    continue
+                if body.count(b'"') % 2:
+                    # Блок начинается внутри поля в кавычках - границы записей в нем не видны, разбираем весь файл
+                    f.seek(header_end)
+                    data = f.read()
+                    pos = header_end
+                    break
+                if len(split_records(body)) > n:
+                    break
+        record_io(self.backend, "read", end - pos)
+
+        body = data.rstrip(b"\r\n")
+        if not body:
+            return None, []
+        records = split_records(body)[-n:]
+        offset = pos + len(body) - len(b"\n".join(records))
+        return offset, [record.decode("utf-8").rstrip("\r") for record in records]
+
+    def _parse_row(self, line, header=COLUMNS):
+        """Разбирает одну строку CSV в словарь записи"""
+        values = next(csv.reader([line]))
+        row = dict(zip(header, values))
+        return {
+            "date": pd.Timestamp(row["date"]),
+            "category": row["category"],
+            "amount": float(row["amount"]),
+            "note": row.get("note", ""),
+            "currency": row.get("currency") or self._legacy_currency()
+        }
+
+    @locked
     def delete_last_expense(self):
-        df = self._load_data()
-        if not df.empty:
-            df = df.iloc[:-1]
-            df.to_csv(self.filename, index=False)
-            return True
-        return False
+        offset, lines = self._tail(1)
+        if offset is None:
+            return False
+        rollup = self._load_rollup()
+        cached = self.cache.peek(self.filename) if self.cache is not None else None
+        index = self._peek_search_index()
+        # Сначала разбор: если строка не читается, файл не трогаем
+        deleted = self._parse_row(lines[-1], self._read_header())
+        with open(self.filename, "r+b") as f:
+            f.truncate(offset)
 
+        rollup.remove(deleted["date"], deleted["category"], deleted["amount"], deleted["currency"])
+        self._save_rollup(rollup)
+        if cached is not None:
+            cached.drop_last()
+            self.cache.put(self.filename, cached)
+        elif self.cache is not None:
+            self.cache.invalidate(self.filename)
+        if index is not None:
+            index.remove_last(deleted["category"], deleted["note"])
+            self.cache.put(self.search_key, index, source=self.data_source)
+        return True
+
+    @locked
     def get_last_records(self, n=10):
-        df = self._load_data()
-        if df.empty:
-            return []
-        return df.tail(n).iloc[::-1].to_dict('records')
+        cached = self.cache.peek(self.filename) if self.cache is not None else None
+        if cached is None:
+            # Истории в памяти нет - читаем с конца файла только n строк, стоимость не зависит от ее длины
+            header = self._read_header()
+            _, lines = self._tail(n)
+            return [Record.from_row(self._parse_row(line, header)) for line in reversed(lines)]
+        return cached.last_records(n)
+
+    # --- ПОИСК (src/search_index.py) ---
+    def _peek_search_index(self):
+        if self.cache is None:
+            return None
+        return self.cache.peek(self.search_key, source=self.data_source)
+
+    def _load_search_index(self):
+        build = lambda: SearchIndex.from_frame(self._load_data())
+        if self.cache is not None:
+            return self.cache.get(self.search_key, build, source=self.data_source)
+        return build()
+
+    @locked
+    def search(self, query, n=10):
+        """
+        Поиск по словам (префиксам) в категории и заметке.
+        Возвращает {"records": n самых новых совпадений, "count": всего, "total": сумма всех,
+        "unconverted": валюты без курса, посчитанные в total 1:1}.
+        """
+        index = self._load_search_index()
+        positions = index.search(query)
+        records = []
+        total = index.total(positions)
+        unconverted = ()
+        if positions:
+            df = self._load_data()
+            records = records_at(df, positions[:n])
+            target = self.get_currency()
+            if has_other_currency(df["currency"], target):
+                # Есть траты в других валютах - пересчитываем все найденные одним проходом
+                totals = category_totals(df.iloc[positions], target)
+                total, unconverted = round(sum(totals.values()), 2), totals.unconverted
+        return {"records": records, "count": len(positions), "total": total, "unconverted": unconverted}
 
     def search_records(self, query):
-        df = self._load_data()
-        if df.empty:
-            return []
-        
-        query = query.lower()
-        mask = (df['category'].str.lower().str.contains(query)) | \
-               (df['note'].str.lower().str.contains(query))
-               
-        results = df[mask]
-        return results.tail(10).iloc[::-1].to_dict('records')
+        return self.search(query)["records"]
 
+    @locked
     def reset_data(self):
         # Удаляем CSV и бюджет, но конфиг (валюту) оставляем
-        empty_df = pd.DataFrame(columns=["date", "category", "amount", "note"])
-        empty_df.to_csv(self.filename, index=False)
+        empty_df = pd.DataFrame(columns=COLUMNS)
+        atomic_write(self.filename, lambda tmp: empty_df.to_csv(tmp, index=False))
         if os.path.exists(self.budget_filename):
             os.remove(self.budget_filename)
+        if self.cache is not None:
+            self.cache.invalidate(self.filename)
+            self.cache.invalidate(self.budget_filename)
+            self.cache.invalidate(self.search_key)
+        self._save_rollup(MonthlyRollup())
+
+    @locked
+    def get_stats_by_month(self, year, month, currency=None):
+        """
+        Траты по категориям за месяц в валюте currency (по умолчанию - текущей).
+        Если все траты месяца в этой валюте - из итогов, без чтения истории.
+        """
+        key = f"{year:04d}-{month:02d}"
+        return self._in_currency(key, self._load_rollup().month(year, month), currency or self.get_currency())
+
+    @locked
+    def get_available_months(self):
+        """Список (год, месяц), за которые есть траты"""
+        return self._load_rollup().available_months()
 
-    def get_stats_by_month(self, year, month):
+    @locked
+    def get_monthly_totals(self, first, last, currency=None):
+        """{YYYY-MM: {категория: сумма}} за месяцы first..last - один проход по итогам"""
+        target = currency or self.get_currency()
+        totals = {key: self._in_currency(key, by_currency, target)
+                  for key, by_currency in self._load_rollup().between(first, last).items()}
+        return Totals({key: stats for key, stats in totals.items() if stats}, unconverted_of(*totals.values()))
+
+    # --- ВАЛЮТЫ (src/currency.py) ---
+    def _in_currency(self, key, by_currency, target):
+        """
+        Итоги месяца key ({валюта: {категория: сумма}}) в валюте target. Если есть другие
+        валюты - пересчет всех трат месяца по курсам на их даты, с кэшем до новых записей.
+        """
+        if set(by_currency) <= {target}:
+            return dict(by_currency.get(target, {}))
+        return converted_totals.get_or_build((self.data_source, key, target), self.data_version(),
+                                             lambda: category_totals(self._month_frame(key), target))
+
+    def _month_frame(self, key):
+        """Траты месяца YYYY-MM (date/category/amount/currency)"""
         df = self._load_data()
-        if df.empty:
-            return {}
-        mask = (df['date'].dt.year == year) & (df['date'].dt.month == month)
-        filtered_df = df[mask]
-        if filtered_df.empty:
-            return {}
-        return filtered_df.groupby("category")["amount"].sum().to_dict()
+        start = datetime(int(key[:4]), int(key[5:7]), 1)
+        end = datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+        return df[(df['date'] >= start) & (df['date'] < end)]
+
+    # --- ИТОГИ ПО МЕСЯЦАМ (src/rollup.py) ---
+    def _data_size(self):
+        try:
+            return os.path.getsize(self.filename)
+        except FileNotFoundError:
+            return 0
+
+    def _data_signature(self):
+        """Отпечаток CSV (mtime_ns, размер), как у StorageCache: ловит и правки той же длины"""
+        return _file_signature(self.filename) or (0, 0)
+
+    def _load_rollup(self):
+        """Итоги по месяцам; если они устарели относительно CSV - пересчитываем"""
+        cached = self.cache.peek(self.rollup_filename) if self.cache is not None else None
+        rollup = cached if cached is not None else MonthlyRollup.load(self.rollup_filename)
+        if rollup is None or rollup.source != self._data_signature():
+            return self.rebuild_rollup()
+        if self.cache is not None and rollup is not cached:
+            self.cache.put(self.rollup_filename, rollup)
+        return rollup
+
+    def _save_rollup(self, rollup):
+        rollup.source = self._data_signature()
+        rollup.save(self.rollup_filename)
+        if self.cache is not None:
+            self.cache.put(self.rollup_filename, rollup)
+
+    def _compute_rollup(self):
+        return MonthlyRollup.from_frame(self._load_data(), self._data_signature())
+
+    @locked
+    def rebuild_rollup(self):
+        """Пересчитывает итоги по CSV целиком и сохраняет их"""
+        rollup = self._compute_rollup()
+        self._save_rollup(rollup)
+        return rollup
+
+    @locked
+    def check_rollup(self):
+        """Сверяет сохраненные итоги с CSV. Возвращает список расхождений"""
+        stored = MonthlyRollup.load(self.rollup_filename) or MonthlyRollup()
+        return stored.diff(self._compute_rollup())
 
     # --- БЮДЖЕТ ---
+    def _load_budgets(self):
+        if self.cache is not None:
+            return self.cache.get(self.budget_filename, self._read_budgets)
+        return self._read_budgets()
+
+    def _read_budgets(self):
+        if os.path.exists(self.budget_filename):
+            return pd.read_csv(self.budget_filename)
+        return pd.DataFrame(columns=["year", "month", "amount"])
+
+    @locked
     def set_budget(self, amount):
         now = datetime.now()
         new_data = pd.DataFrame([{"year": now.year, "month": now.month, "amount": float(amount)}])
         
-        if os.path.exists(self.budget_filename):
-            history = pd.read_csv(self.budget_filename)
+        history = self._load_budgets()
+        if not history.empty:
             history = history[~((history['year'] == now.year) & (history['month'] == now.month))]
             history = pd.concat([history, new_data], ignore_index=True)
-            history.to_csv(self.budget_filename, index=False)
         else:
-            new_data.to_csv(self.budget_filename, index=False)
+            history = new_data
+        atomic_write(self.budget_filename, lambda tmp: history.to_csv(tmp, index=False))
+        if self.cache is not None:
+            self.cache.put(self.budget_filename, history)
 
-    def get_budget_status(self):
-        now = datetime.now()
-        
-        budget_amount = 0.0
-        if os.path.exists(self.budget_filename):
-            budgets = pd.read_csv(self.budget_filename)
-            row = budgets[(budgets['year'] == now.year) & (budgets['month'] == now.month)]
+    @locked
+    def get_budget(self, year, month):
+        """Бюджет на месяц (0 - не задан)"""
+        return self._month_budget(year, month)
+
+    def _month_budget(self, year, month):
+        budgets = self._load_budgets()
+        if not budgets.empty:
+            row = budgets[(budgets['year'] == year) & (budgets['month'] == month)]
             if not row.empty:
-                budget_amount = row.iloc[0]['amount']
+                return float(row.iloc[0]['amount'])
+        return 0.0
 
+    @locked
+    def get_budget_status(self):
+        now = datetime.now()
+        # _month_budget, а не get_budget: без второго слоя замера и блокировки на горячем пути
+        budget_amount = self._month_budget(now.year, now.month)
         stats = self.get_stats_by_month(now.year, now.month)
-        spent_amount = sum(stats.values()) if stats else 0.0
-        remaining = budget_amount - spent_amount
-        
-        days_in_month = calendar.monthrange(now.year, now.month)[1]
-        days_left = days_in_month - now.day
-        if days_left == 0: days_left = 1
-            
-        daily_limit = remaining / days_left
-        
-        return {
-            "budget": budget_amount,
-            "spent": spent_amount,
-            "remaining": remaining,
-            "days_left": days_left,
-            "daily_limit": daily_limit
-        }
+        return budget_summary(budget_amount, stats, now)
+
+    # --- ВЫГРУЗКА ---
+    def data_version(self):
+        """Меняется при любой записи: ключ для кэша выгрузок"""
+        if not os.path.exists(self.filename):
+            return None
+        st = os.stat(self.filename)
+        return (st.st_mtime_ns, st.st_size)
+
+    def iter_frames(self, start=None, end=None, chunksize=50000):
+        """
+        История кусками по chunksize строк (даты в [start, end)), без загрузки файла целиком.
+        Читается снимок файла на момент вызова: дописанное позже в выгрузку не попадет.
+        """
+        with self.lock:
+            size = self._data_size()
+            if size == 0:
+                return
+            f = open(self.filename, "rb")
+            self._skip_preamble(f)
+        record_io(self.backend, "read", size)
+        legacy = self._legacy_currency()
+        try:
+            reader = io.BufferedReader(_LimitedReader(f, size - f.tell()))
+            for chunk in pd.read_csv(reader, parse_dates=['date'], chunksize=chunksize):
+                record_io(self.backend, "read", rows=len(chunk))
+                if 'note' not in chunk.columns:
+                    chunk['note'] = ""
+                chunk['note'] = chunk['note'].fillna("")
+                if 'currency' not in chunk.columns:
+                    chunk['currency'] = legacy
+                if start is not None:
+                    chunk = chunk[chunk['date'] >= start]
+                if end is not None:
+                    chunk = chunk[chunk['date'] < end]
+                if len(chunk):
+                    yield chunk[LEDGER_COLUMNS]
+        finally:
+            f.close()
+
+    @locked
+    def record_hashes(self):
+        """Хэши всех записей - для поиска дублей при импорте выписок"""
+        return set(hash_records(self._load_data()))
+
+
+class _LimitedReader(io.RawIOBase):
+    """Отдает только первые limit байт файла"""
+
+    def __init__(self, f, limit):
+        self._f = f
+        self._remaining = limit
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._remaining <= 0:
+            return 0
+        data = self._f.read(min(len(buffer), self._remaining))
+        buffer[:len(data)] = data
+        self._remaining -= len(data)
+        return len(data)
+
+
+def hash_records(df):
+    """
+    Хэш строки по (дата до секунды, категория, сумма до копеек, заметка).
+    Считается векторно для всего DataFrame, возвращает массив uint64.
+    """
+    if df.empty:
+        return []
+    key = pd.DataFrame({
+        "date": pd.to_datetime(df["date"]).dt.strftime("%Y-%m-%d %H:%M:%S"),
+        "category": df["category"].astype(str),
+        "amount": pd.to_numeric(df["amount"]).round(2).map("{:.2f}".format),
+        "note": df["note"].astype(str),
+    })
+    return pd.util.hash_pandas_object(key, index=False).to_numpy()
+
+
+def has_other_currency(currencies, target):
+    """Есть ли в колонке валюты, кроме target. У категориальной колонки достаточно списка категорий"""
+    if currencies.dtype == "category":
+        return not set(currencies.cat.categories) <= {target}
+    return bool((currencies != target).any())
+
+
+def split_records(data):
+    """Байты CSV -> записи: делит по переводам строки вне кавычек"""
+    if b'"' not in data:
+        return data.split(b"\n")
+    records, start, pos, quoted = [], 0, 0, False
+    for part in data.split(b'"'):
+        if not quoted:
+            i = part.find(b"\n")
+            while i != -1:
+                records.append(data[start:pos + i])
+                start = pos + i + 1
+                i = part.find(b"\n", i + 1)
+        pos += len(part) + 1
+        quoted = not quoted
+    records.append(data[start:])
+    return records
+
+
+def budget_summary(budget_amount, stats, now):
+    """Остаток бюджета и дневной лимит по тратам месяца (общая логика для всех хранилищ)"""
+    spent_amount = sum(stats.values()) if stats else 0.0
+    # Валюты без курса, посчитанные 1:1 (src/currency.py) - бот предупреждает о них
+    unconverted = getattr(stats, "unconverted", ())
+    remaining = budget_amount - spent_amount
+
+    days_in_month = calendar.monthrange(now.year, now.month)[1]
+    days_left = days_in_month - now.day
+    if days_left == 0: days_left = 1
+
+    daily_limit = remaining / days_left
+
+    return {
+        "budget": budget_amount,
+        "spent": spent_amount,
+        "remaining": remaining,
+        "days_left": days_left,
+        "daily_limit": daily_limit,
+        "unconverted": unconverted
+    }
 
@@ -0,0 +1,107 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from src.startup import lazy_import
+from src.currency import rates
+
+pd = lazy_import("pandas")
+
+# Дольше трех лет столбики на графике становятся нечитаемыми
+MAX_MONTHS = 36
+# Остальные категории на графике сводятся в одну
+TOP_CATEGORIES = 8
+OTHER = "Другое"
+
+
+def last_months(count, now=None):
+    """Ключи YYYY-MM последних count месяцев, включая текущий, по возрастанию"""
+    now = now or datetime.now()
+    index = now.year * 12 + now.month - 1
+    return [f"{i // 12:04d}-{i % 12 + 1:02d}" for i in range(index - count + 1, index + 1)]
+
+
+def totals_from_cents(sums):
+    """Копейки по (YYYY-MM, категория) - Series или dict -> {YYYY-MM: {категория: сумма}}"""
+    totals = {}
+    for (month, category), cents in sums.items():
+        if cents:
+            totals.setdefault(str(month), {})[str(category)] = int(cents) / 100
+    return totals
+
+
+def trend_table(totals, months, top=TOP_CATEGORIES):
+    """
+    DataFrame месяцы x категории (0, где трат не было), категории по убыванию суммы.
+    Если категорий больше top, мелкие сводятся в «Другое».
+    """
+    table = pd.DataFrame.from_dict({key: totals.get(key, {}) for key in months}, orient="index", dtype=float)
+    table = table.reindex(months).fillna(0.0)
+    table = table[table.sum().sort_values(ascending=False, kind="stable").index]
+    if len(table.columns) > top + 1:
+        rest = table.columns[top:]
+        table = table.drop(columns=rest).assign(**{OTHER: table[rest].sum(axis=1)})
+    return table
+
+
+class TrendReport:
+    """Итоги /trend: таблица месяцы x категории и подписи для графика; unconverted - валюты без курса"""
+
+    def __init__(self, table, unconverted=()):
+        self.table = table
+        self.unconverted = tuple(unconverted)
+
+    @property
+    def months(self):
+        return list(self.table.index)
+
+    @property
+    def total(self):
+        return round(float(self.table.to_numpy().sum()), 2)
+
+    @property
+    def empty(self):
+        return self.total == 0
+
+    def monthly(self):
+        """[(YYYY-MM, сумма за месяц)]"""
+        return [(key, round(float(total), 2)) for key, total in self.table.sum(axis=1).items()]
+
+    def series(self):
+        """{категория: [сумма по месяцам]} - входные данные для stacked bar"""
+        return {str(category): [round(float(v), 2) for v in values] for category, values in self.table.items()}
+
+
+def build_trend(storage, months=12, now=None):
+    keys = last_months(months, now)
+    totals = storage.get_monthly_totals(keys[0], keys[-1])
+    return TrendReport(trend_table(totals, keys), getattr(totals, "unconverted", ()))
+
+
+class TrendCache:
+    """
+    Последний отчет /trend каждого пользователя. Отдается повторно, пока не изменились
+    данные (storage.data_version()), диапазон месяцев, валюта и файл курсов.
+    """
+
+    def __init__(self, max_users=256):
+        self.max_users = max_users
+        self._entries = OrderedDict()  # user_key -> (ключ, TrendReport)
+        self._lock = threading.Lock()
+
+    def get_or_build(self, user_key, storage, months=12, now=None):
+        keys = last_months(months, now)
+        key = (keys[0], keys[-1], storage.data_version(), storage.get_currency(), rates.version)
+        with self._lock:
+            entry = self._entries.get(user_key)
+            if entry is not None and entry[0] == key:
+                self._entries.move_to_end(user_key)
+                return entry[1]
+
+        report = build_trend(storage, months, now)
+        with self._lock:
+            self._entries[user_key] = (key, report)
+            self._entries.move_to_end(user_key)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+        return report
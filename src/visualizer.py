@@ -3,7 +3,7 @@ import io
 
 plt.switch_backend('Agg')
 
-def create_pie_chart(stats, currency_symbol="$"):
+def create_pie_chart(stats, currency_symbol="$", dpi=100):
     # Сортируем
     sorted_stats = dict(sorted(stats.items(), key=lambda item: item[1], reverse=True))
     
@@ -41,8 +41,38 @@ def create_pie_chart(stats, currency_symbol="$"):
     ax.set_title(f"Структура расходов ({currency_symbol})", fontsize=16, fontweight='bold')
     
     buffer = io.BytesIO()
-    plt.savefig(buffer, format='png', bbox_inches='tight', dpi=100)
+    plt.savefig(buffer, format='png', bbox_inches='tight', dpi=dpi)
     buffer.seek(0)
     plt.close(fig)
     
-    return buffer
\ No newline at end of file
+    return buffer
+
+def create_stacked_bar_chart(months, series, currency_symbol="$", dpi=100):
+    """Столбик на месяц, внутри - доли категорий. series: {категория: [сумма по месяцам]}"""
+    colors = plt.cm.tab20(range(len(series)))
+
+    fig, ax = plt.subplots(figsize=(max(8, len(months) * 0.6), 7))
+
+    bottom = [0.0] * len(months)
+    for (category, values), color in zip(series.items(), colors):
+        ax.bar(months, values, bottom=bottom, label=category, color=color, edgecolor='w', linewidth=0.5)
+        bottom = [b + v for b, v in zip(bottom, values)]
+
+    ax.set_ylabel(currency_symbol)
+    ax.tick_params(axis='x', labelrotation=45)
+    ax.grid(axis='y', alpha=0.3)
+    ax.set_axisbelow(True)
+
+    ax.legend(title="Категории",
+              loc="center left",
+              bbox_to_anchor=(1, 0, 0.5, 1),
+              fontsize=10)
+
+    ax.set_title(f"Расходы по месяцам ({currency_symbol})", fontsize=16, fontweight='bold')
+
+    buffer = io.BytesIO()
+    plt.savefig(buffer, format='png', bbox_inches='tight', dpi=dpi)
+    buffer.seek(0)
+    plt.close(fig)
+
+    return buffer
@@ -0,0 +1,191 @@
+"""
+Локальный Bot API для тестов и нагрузочного прогона (benchmarks/load_test.py):
+отвечает на /bot<token>/<method> как Telegram, записывает вызовы, по заказу возвращает
+ошибки (429 с retry_after и т.п.) и отдает апдейты через getUpdates.
+
+    with FakeBotAPI() as api:
+        monkeypatch.setattr(telebot.apihelper, "API_URL", api.api_url)
+        ...
+        api.texts(chat_id)
+"""
+import json
+import time
+import threading
+from collections import deque
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def parse_params(content_type, body, query=""):
+    """Параметры запроса: строка запроса, form-urlencoded или multipart (файлы - bytes)"""
+    params = {key: values[0] for key, values in parse_qs(query).items()}
+    if content_type.startswith("multipart/form-data"):
+        message = BytesParser(policy=HTTP).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode("latin-1") + body)
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            payload = part.get_payload(decode=True)
+            params[name] = payload if part.get_filename() else payload.decode("utf-8")
+    elif body:
+        params.update({key: values[0] for key, values in parse_qs(body.decode("utf-8")).items()})
+    return params
+
+
+class Call:
+    def __init__(self, method, params, client):
+        self.method = method
+        self.params = params
+        self.client = client  # (host, port) клиента - видно, переиспользуется ли соединение
+        self.time = time.monotonic()
+        self.ok = False
+
+    @property
+    def chat_id(self):
+        return int(self.params["chat_id"]) if "chat_id" in self.params else None
+
+
+class FakeBotAPI:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+        self.errors = deque()  # (метод, чат, код, описание, parameters) - ответы на ближайшие вызовы
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._message_id = 0
+        self._updates = []  # апдейты для getUpdates
+        self._update_id = 0
+        self._replies = {}  # chat_id -> число успешных ответов в чат
+        self._last = {}     # chat_id -> последний успешный вызов
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def api_url(self):
+        """Шаблон для telebot.apihelper.API_URL"""
+        host, port = self.server.server_address
+        return f"http://{host}:{port}/bot{{0}}/{{1}}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def fail_next(self, error_code=429, retry_after=1, description=None, method=None, chat_id=None):
+        """Следующий вызов (метода method, в чат chat_id - если заданы) получит ошибку"""
+        parameters = {"retry_after": retry_after} if error_code == 429 else None
+        description = description or (f"Too Many Requests: retry after {retry_after}" if error_code == 429 else "Error")
+        with self._lock:
+            self.errors.append((method, chat_id, error_code, description, parameters))
+
+    def push_update(self, update):
+        """Ставит апдейт (dict без update_id) в очередь getUpdates; возвращает update_id"""
+        with self._lock:
+            self._update_id += 1
+            self._updates.append(dict(update, update_id=self._update_id))
+            self._changed.notify_all()
+            return self._update_id
+
+    def reply_count(self, chat_id):
+        with self._lock:
+            return self._replies.get(chat_id, 0)
+
+    def last_reply(self, chat_id):
+        with self._lock:
+            return self._last.get(chat_id)
+
+    def wait_replies(self, chat_id, count, timeout):
+        """Ждет, пока в чат уйдет count ответов; False - не дождались"""
+        with self._lock:
+            return self._changed.wait_for(lambda: self._replies.get(chat_id, 0) >= count, timeout)
+
+    def _get_updates(self, params):
+        offset = int(params.get("offset", 0))
+        # Long polling, но не дольше секунды: остановка сервера не ждет клиента
+        timeout = min(float(params.get("timeout", 0)), 1.0)
+        with self._lock:
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+            self._changed.wait_for(lambda: self._updates, timeout)
+            return 200, {"ok": True, "result": list(self._updates[:int(params.get("limit", 100))])}
+
+    def texts(self, chat_id=None):
+        """Тексты успешно отправленных сообщений (по порядку)"""
+        return [call.params.get("text") for call in self.sent(chat_id)]
+
+    def sent(self, chat_id=None, method=None):
+        with self._lock:
+            return [call for call in self.calls if call.ok
+                    and (chat_id is None or call.chat_id == chat_id)
+                    and (method is None or call.method == method)]
+
+    def _respond(self, call):
+        if call.method == "getUpdates":
+            return self._get_updates(call.params)
+        if call.method == "getMe":
+            return 200, {"ok": True, "result": {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}}
+        with self._lock:
+            self.calls.append(call)
+            for i, (method, chat_id, error_code, description, parameters) in enumerate(self.errors):
+                if method in (None, call.method) and chat_id in (None, call.chat_id):
+                    del self.errors[i]
+                    body = {"ok": False, "error_code": error_code, "description": description}
+                    if parameters:
+                        body["parameters"] = parameters
+                    return error_code, body
+            call.ok = True
+            self._message_id += 1
+            message_id = self._message_id
+            if call.chat_id is not None:
+                self._replies[call.chat_id] = self._replies.get(call.chat_id, 0) + 1
+                self._last[call.chat_id] = call
+                self._changed.notify_all()
+        if call.method in ("answerCallbackQuery", "deleteMessage", "setMyCommands", "setWebhook", "deleteWebhook"):
+            return 200, {"ok": True, "result": True}
+        message = {
+            "message_id": int(call.params.get("message_id", message_id)),
+            "date": int(time.time()),
+            "chat": {"id": call.chat_id or 0, "type": "private"},
+        }
+        if "text" in call.params:
+            message["text"] = call.params["text"]
+        return 200, {"ok": True, "result": message}
+
+    def _handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, как у настоящего Bot API
+
+            def _serve(self):
+                url = urlparse(self.path)
+                method = url.path.rsplit("/", 1)[-1]
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                params = parse_params(self.headers.get("Content-Type", ""), body, url.query)
+                if api.delay:
+                    time.sleep(api.delay)
+                status, payload = api._respond(Call(method, params, self.client_address))
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = _serve
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,59 @@
+import os
+import json
+import pytest
+import pandas as pd
+
+os.environ.setdefault("BOT_TOKEN", "123456:TEST")
+
+import telebot
+import src.bot as bot_module
+from src.cache import StorageCache
+from src.storage import FinanceStorage
+from src.outbox import Outbox
+
+def make_message(chat_id, text, message_id=1):
+    return telebot.types.Message.de_json(json.dumps({
+        "message_id": message_id,
+        "from": {"id": chat_id, "is_bot": False, "first_name": "Тест"},
+        "chat": {"id": chat_id, "type": "private"},
+        "date": 1760000000,
+        "text": text
+    }))
+
+@pytest.fixture
+def replies(tmp_path, monkeypatch):
+    """Хранилище во временной папке, ответы бота складываются в список"""
+    sent = []
+    cache = StorageCache()
+    monkeypatch.setattr(bot_module, "get_user_storage",
+                        lambda user_id: FinanceStorage(str(tmp_path / f"{user_id}_finance.csv"), cache=cache))
+    monkeypatch.setattr(bot_module.bot, "reply_to", lambda message, text, **kwargs: sent.append(text))
+    monkeypatch.setattr(bot_module.bot, "send_message", lambda chat_id, text, **kwargs: sent.append(text))
+    # Ответы отправляются сразу, без фоновой очереди
+    monkeypatch.setattr(bot_module, "outbox", Outbox(bot_module.bot, workers=0))
+    return sent
+
+def test_multiline_message_is_one_batch(tmp_path, replies):
+    bot_module.process_expense(make_message(7, "Такси 500\nКофе 4.5 латте\nОбед дорого\n"))
+
+    assert len(replies) == 1
+    assert "Записано: 2" in replies[0]
+    assert "Строка 3" in replies[0]
+    assert list(pd.read_csv(tmp_path / "7_finance.csv")['category']) == ["Такси", "Кофе"]
+
+def test_trend_button_reports_errors(replies, monkeypatch):
+    answered = []
+    monkeypatch.setattr(bot_module.bot, "answer_callback_query", lambda call_id, *args, **kwargs: answered.append(call_id))
+    monkeypatch.setattr(bot_module, "send_trend", lambda user_id, months: 1 / 0)
+    call = telebot.types.CallbackQuery.de_json(json.dumps({
+        "id": "42",
+        "from": {"id": 7, "is_bot": False, "first_name": "Тест"},
+        "chat_instance": "1",
+        "data": "trend_12",
+        "message": {"message_id": 1, "date": 1760000000, "text": "Выберите месяц:", "chat": {"id": 7, "type": "private"}}
+    }))
+
+    bot_module.handle_query(call)
+
+    assert answered == ["42"]
+    assert replies == ["Ошибка построения отчета."]
@@ -0,0 +1,51 @@
+import pandas as pd
+from src.cache import StorageCache
+from src.storage import FinanceStorage
+
+def test_hot_user_does_not_reparse(tmp_path, monkeypatch):
+    cache = StorageCache()
+    storage = FinanceStorage(str(tmp_path / "1_finance.csv"), cache=cache)
+    storage.add_expense("Еда", 100)
+
+    calls = []
+    original = pd.read_csv
+    monkeypatch.setattr(pd, "read_csv", lambda *a, **kw: calls.append(a) or original(*a, **kw))
+
+    storage.get_budget_status()
+    parsed_once = len(calls)
+    storage.add_expense("Такси", 50)
+    status = storage.get_budget_status()
+
+    # Вторая трата и пересчет бюджета идут через кэш, без нового парсинга
+    assert len(calls) == parsed_once
+    assert status['spent'] == 150
+
+def test_external_change_invalidates_by_mtime(tmp_path):
+    cache = StorageCache()
+    path = tmp_path / "2_finance.csv"
+    storage = FinanceStorage(str(path), cache=cache)
+    storage.add_expense("Еда", 100)
+    assert len(storage.get_last_records()) == 1
+
+    # Кто-то дописал файл в обход бота
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("2024-01-01 10:00:00.000001,Кино,300,\n")
+    assert len(storage.get_last_records()) == 2
+
+def test_currency_is_cached_and_written_through(tmp_path):
+    cache = StorageCache()
+    storage = FinanceStorage(str(tmp_path / "3_finance.csv"), cache=cache)
+    assert storage.get_currency() == "$"
+    storage.set_currency("₾")
+    assert FinanceStorage(str(tmp_path / "3_finance.csv"), cache=cache).get_currency() == "₾"
+
+def test_lru_eviction_by_count():
+    cache = StorageCache(max_entries=2)
+    cache.get("/nonexistent/a", lambda: "a")
+    cache.get("/nonexistent/b", lambda: "b")
+    cache.get("/nonexistent/a", lambda: "a2")  # a стал самым свежим
+    cache.get("/nonexistent/c", lambda: "c")
+
+    assert len(cache) == 2
+    assert cache.peek("/nonexistent/b") is None
+    assert cache.peek("/nonexistent/a") == "a"
@@ -0,0 +1,119 @@
+import os
+import json
+import time
+import random
+import threading
+import pandas as pd
+
+os.environ.setdefault("BOT_TOKEN", "123456:TEST")
+
+import telebot
+from src.cache import StorageCache
+from src.dispatcher import ChatDispatcher
+from src.storage import FinanceStorage
+from src.outbox import Outbox
+
+def make_update(update_id, chat_id, text):
+    return telebot.types.Update.de_json(json.dumps({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Тест"},
+            "chat": {"id": chat_id, "type": "private"},
+            "date": 1760000000,
+            "text": text
+        }
+    }))
+
+def test_same_chat_in_order_other_chats_in_parallel():
+    dispatcher = ChatDispatcher(workers=4)
+    seen = {1: [], 2: []}
+    running = set()
+    overlap = []
+
+    def task(chat_id, i):
+        if chat_id in running:
+            overlap.append(chat_id)
+        running.add(chat_id)
+        time.sleep(random.random() / 500)
+        seen[chat_id].append(i)
+        running.discard(chat_id)
+
+    for i in range(100):
+        dispatcher.submit(1, task, 1, i)
+        dispatcher.submit(2, task, 2, i)
+    assert dispatcher.join(timeout=10)
+
+    assert seen[1] == list(range(100))
+    assert seen[2] == list(range(100))
+    assert overlap == []
+
+def test_full_dispatcher_holds_back_new_updates():
+    dispatcher = ChatDispatcher(workers=2, max_pending=2)
+    release = threading.Event()
+    done = []
+    dispatcher.submit(1, release.wait)
+    dispatcher.submit(2, release.wait)
+
+    third = threading.Thread(target=dispatcher.submit, args=(3, done.append, 3))
+    third.start()
+    third.join(timeout=0.2)
+    # Очереди полны - третий апдейт ждет, пока не освободится место
+    assert third.is_alive()
+    assert dispatcher.pending() == 2
+
+    release.set()
+    third.join(timeout=5)
+    assert dispatcher.join(timeout=5)
+    assert done == [3]
+
+def test_concurrent_writes_do_not_lose_records(tmp_path):
+    cache = StorageCache()
+    path = str(tmp_path / "1_finance.csv")
+    deleted = []
+
+    def writer(n):
+        storage = FinanceStorage(path, cache=cache)
+        for i in range(50):
+            storage.add_expense("Еда", 1)
+            if i % 10 == n % 10:
+                deleted.append(storage.delete_last_expense())
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    expected = 8 * 50 - sum(deleted)
+    assert len(pd.read_csv(path)) == expected
+    storage = FinanceStorage(path, cache=cache)
+    now = pd.Timestamp.now()
+    assert storage.get_stats_by_month(now.year, now.month) == {"Еда": float(expected)}
+    assert storage.check_rollup() == []
+
+def test_interleaved_updates_through_bot(tmp_path, monkeypatch):
+    import src.bot as bot_module
+
+    cache = StorageCache()
+    monkeypatch.setattr(bot_module, "get_user_storage",
+                        lambda user_id: FinanceStorage(str(tmp_path / f"{user_id}_finance.csv"), cache=cache))
+    monkeypatch.setattr(bot_module.bot, "reply_to", lambda *args, **kwargs: None)
+    monkeypatch.setattr(bot_module.bot, "send_message", lambda *args, **kwargs: None)
+    monkeypatch.setattr(bot_module, "outbox", Outbox(bot_module.bot, workers=0))
+
+    updates = []
+    for i in range(60):
+        for chat_id in (101, 102, 103):
+            updates.append(make_update(len(updates) + 1, chat_id, f"Еда {i + 1}"))
+            if i % 6 == 5:
+                updates.append(make_update(len(updates) + 1, chat_id, "/undo"))
+    bot_module.bot.process_new_updates(updates)
+    assert bot_module.dispatcher.join(timeout=30)
+
+    # В каждом чате 60 трат и 10 отмен, каждая отмена убирает именно предыдущую трату
+    for chat_id in (101, 102, 103):
+        df = pd.read_csv(tmp_path / f"{chat_id}_finance.csv")
+        assert len(df) == 50
+        assert 6 not in set(df['amount'])
+    assert bot_module.bot.last_update_id == len(updates)
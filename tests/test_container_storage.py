@@ -0,0 +1,79 @@
+import os
+import pandas as pd
+
+from src.cache import StorageCache
+from src.storage import FinanceStorage
+from src.container_storage import ContainerFinanceStorage, open_storage, shard_path, migrate
+
+def test_same_api_as_file_storage(tmp_path):
+    storage = open_storage(str(tmp_path), 42)
+    now = pd.Timestamp.now()
+
+    storage.set_currency("€")
+    storage.set_budget(1000)
+    storage.add_expense("Еда", 200)
+    storage.add_expense("Такси", 50, "аэропорт")
+
+    assert isinstance(storage, ContainerFinanceStorage)
+    assert storage.get_currency() == "€"
+    assert storage.get_stats_by_month(now.year, now.month) == {"Еда": 200.0, "Такси": 50.0}
+    assert storage.get_budget_status()['remaining'] == 750.0
+    assert [r['category'] for r in storage.get_last_records()] == ["Такси", "Еда"]
+    assert storage.search_records("аэро")[0]['note'] == "аэропорт"
+
+    assert storage.delete_last_expense() == True
+    assert storage.get_stats_by_month(now.year, now.month) == {"Еда": 200.0}
+
+    storage.reset_data()
+    assert storage.get_last_records() == []
+    assert storage.get_budget_status()['budget'] == 0.0
+    assert storage.get_currency() == "€"
+
+def test_one_file_per_user_in_shard(tmp_path):
+    storage = open_storage(str(tmp_path), 42)
+    storage.set_currency("₽")
+    storage.add_expense("Еда", 10)
+
+    path = shard_path(str(tmp_path), 42)
+    assert os.path.dirname(os.path.dirname(path)) == str(tmp_path / "users")
+    assert sorted(os.listdir(os.path.dirname(path))) == ["42.fin", "42_rollup.json"]
+    assert not [p for p in os.listdir(tmp_path) if p.endswith((".csv", ".json"))]
+
+def test_settings_rewritten_in_place(tmp_path):
+    cache = StorageCache()
+    storage = open_storage(str(tmp_path), 1, cache=cache)
+    storage.add_expense("Еда", 10)
+    size = os.path.getsize(storage.filename)
+    storage.search("еда")
+    storage.get_currency()
+    misses = cache.misses
+
+    storage.set_budget(500)
+    storage.set_currency("€")
+    assert os.path.getsize(storage.filename) == size
+    # История и индекс не перечитываются из-за смены настроек
+    assert storage.search("еда")["total"] == 10.0
+    assert storage.get_currency() == "€"
+    assert cache.misses == misses
+
+    storage.set_currency("x" * 5000)
+    assert storage.get_currency() == "x" * 5000
+    assert storage.get_last_records()[0]['category'] == "Еда"
+
+def test_legacy_layout_fallback_and_migration(tmp_path):
+    legacy = FinanceStorage(str(tmp_path / "7_finance.csv"))
+    legacy.set_currency("€")
+    legacy.set_budget(300)
+    legacy.add_expense("Кофе", 4.5, "латте")
+
+    assert type(open_storage(str(tmp_path), 7)) is FinanceStorage
+    assert migrate(str(tmp_path)) == 1
+    assert migrate(str(tmp_path)) == 0
+
+    storage = open_storage(str(tmp_path), 7)
+    assert isinstance(storage, ContainerFinanceStorage)
+    assert storage.get_currency() == "€"
+    assert storage.get_budget_status()['remaining'] == 295.5
+    assert storage.get_last_records()[0]['note'] == "латте"
+    storage.add_expense("Еда", 10)
+    assert [r['category'] for r in storage.get_last_records()] == ["Еда", "Кофе"]
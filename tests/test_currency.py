@@ -0,0 +1,140 @@
+import pandas as pd
+import pytest
+from datetime import datetime
+
+from src import currency
+from src.currency import RateTable, ConvertedTotals
+from src.storage import FinanceStorage
+from src.sqlite_storage import SQLiteFinanceStorage
+from src.partitioned_storage import PartitionedFinanceStorage, partitioned_supported
+
+RATES = (
+    "date,currency,rate\n"
+    "2024-01-01,EUR,0.5\n"
+    "2024-02-01,EUR,0.8\n"
+    "2024-01-01,₽,100\n"
+)
+
+
+@pytest.fixture
+def rates(tmp_path, monkeypatch):
+    path = tmp_path / "rates.csv"
+    path.write_text(RATES, encoding="utf-8")
+    monkeypatch.setattr(currency.rates, "path", str(path))
+    return currency.rates
+
+
+def test_rates_by_date_in_one_pass(tmp_path):
+    path = tmp_path / "rates.csv"
+    path.write_text(RATES, encoding="utf-8")
+    table = RateTable(str(path))
+    dates = pd.to_datetime(["2023-12-01", "2024-01-15", "2024-03-01", "2024-01-15", "2024-01-15"])
+
+    cents = table.convert_cents([1000, 1000, 1000, 1000, 500], ["€", "€", "€", "$", "₽"], dates, "$")
+    # Раньше первого курса - самый ранний; дальше - последний курс не позже даты траты
+    assert list(cents) == [2000, 2000, 1250, 1000, 5]
+    assert list(table.convert_cents([1000], ["€"], dates[:1], "€")) == [1000]
+
+    path.write_text(RATES.replace("0.8", "0.4"), encoding="utf-8")
+    assert list(table.convert_cents([1000], ["€"], dates[2:3], "$")) == [2500]
+
+
+def test_switching_currency_keeps_old_records(tmp_path, rates):
+    temp_file = tmp_path / "fx_finance.csv"
+    storage = FinanceStorage(str(temp_file))
+    storage.set_currency("€")
+    storage.add_expense("Еда", 10)
+    header = temp_file.read_text(encoding="utf-8").splitlines()[0]
+
+    storage.set_currency("$")
+    storage.add_expense("Еда", 5)
+    storage.add_expense("Такси", 3)
+    storage.set_budget(100)
+    now = datetime.now()
+
+    assert header == "date,category,amount,note"
+    assert list(pd.read_csv(temp_file)["currency"]) == ["€", "$", "$"]
+    assert storage.get_stats_by_month(now.year, now.month) == {"Еда": 17.5, "Такси": 3.0}
+    assert storage.get_stats_by_month(now.year, now.month, "€") == {"Еда": 14.0, "Такси": 2.4}
+    assert storage.get_budget_status()["spent"] == 20.5
+    assert storage.search("еда")["total"] == 17.5
+    assert [r.currency for r in storage.get_last_records(3)] == ["$", "$", "€"]
+
+
+def test_converted_totals_cached_until_new_data(tmp_path, rates):
+    storage = FinanceStorage(str(tmp_path / "c_finance.csv"))
+    storage.set_currency("€")
+    storage.add_expense("Еда", 10)
+    storage.set_currency("$")
+    storage.add_expense("Еда", 5)
+    now = datetime.now()
+    calls = []
+    month_frame = storage._month_frame
+    storage._month_frame = lambda key: calls.append(key) or month_frame(key)
+
+    first = storage.get_stats_by_month(now.year, now.month)
+    assert storage.get_stats_by_month(now.year, now.month) == first
+    assert len(calls) == 1
+
+    storage.add_expense("Еда", 1)
+    assert storage.get_stats_by_month(now.year, now.month) == {"Еда": first["Еда"] + 1}
+    assert len(calls) == 2
+
+    cache = ConvertedTotals(max_entries=1)
+    cache.get_or_build(("u", "2024-01", "$"), 1, lambda: {"Еда": 1.0})
+    cache.get_or_build(("u", "2024-02", "$"), 1, lambda: {"Еда": 2.0})
+    assert cache.get_or_build(("u", "2024-01", "$"), 1, lambda: {"Еда": 3.0}) == {"Еда": 3.0}
+
+
+def test_sqlite_mixed_currencies(tmp_path, rates):
+    storage = SQLiteFinanceStorage(str(tmp_path / "finance.db"), 1)
+    storage.set_currency("€")
+    storage.add_expense("Еда", 10)
+    storage.set_currency("$")
+    storage.add_expenses([
+        {"category": "Еда", "amount": 5},
+        {"category": "Такси", "amount": 100, "currency": "₽", "note": "аэропорт"},
+    ])
+    now = datetime.now()
+    key = f"{now.year:04d}-{now.month:02d}"
+
+    assert storage.get_stats_by_month(now.year, now.month) == {"Еда": 17.5, "Такси": 1.0}
+    assert storage.get_monthly_totals(key, key) == {key: {"Еда": 17.5, "Такси": 1.0}}
+    assert storage.search("аэро")["total"] == 1.0
+    assert [r.currency for r in storage.get_last_records(3)] == ["₽", "$", "€"]
+
+
+def test_partitioned_mixed_currencies(tmp_path, rates):
+    if not partitioned_supported():
+        pytest.skip("нет pyarrow")
+    storage = PartitionedFinanceStorage(str(tmp_path / "1_finance.csv"))
+    storage.set_currency("€")
+    storage.add_expense("Еда", 10)
+    storage.set_currency("$")
+    storage.add_expense("Еда", 5)
+    now = datetime.now()
+    key = f"{now.year:04d}-{now.month:02d}"
+
+    assert storage.get_stats_by_month(now.year, now.month) == {"Еда": 17.5}
+    assert storage.get_monthly_totals(key, key, "€") == {key: {"Еда": 14.0}}
+
+
+def test_missing_rate_marks_totals(tmp_path, rates):
+    storage = FinanceStorage(str(tmp_path / "m_finance.csv"))
+    storage.set_currency("$")
+    storage.add_expenses([
+        {"category": "Еда", "amount": 5},
+        {"category": "Еда", "amount": 3, "currency": "€"},
+        {"category": "Такси", "amount": 7, "currency": "GEL", "note": "аэропорт"},
+    ])
+    now = datetime.now()
+    key = f"{now.year:04d}-{now.month:02d}"
+
+    # Курса GEL нет - сумма 1:1, но итоги об этом знают
+    stats = storage.get_stats_by_month(now.year, now.month)
+    assert stats["Такси"] == 7.0
+    assert stats.unconverted == ("GEL",)
+    assert storage.get_budget_status()["unconverted"] == ("GEL",)
+    assert storage.get_monthly_totals(key, key).unconverted == ("GEL",)
+    assert storage.search("аэро")["unconverted"] == ("GEL",)
+    assert storage.search("еда")["unconverted"] == ()
@@ -0,0 +1,93 @@
+import gzip
+import io
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from src import export as export_module
+from src.export import ExportCache, build_export, available_formats
+from src.storage import FinanceStorage
+
+NOW = datetime(2024, 3, 15)
+
+@pytest.fixture(autouse=True)
+def export_dir(tmp_path, monkeypatch):
+    path = tmp_path / "exports"
+    monkeypatch.setattr(export_module, "EXPORT_DIR", str(path))
+    return path
+
+@pytest.fixture
+def storage(tmp_path):
+    path = tmp_path / "1_finance.csv"
+    path.write_text(
+        "date,category,amount,note\n"
+        "2024-01-20 10:00:00.000001,Еда,100.0,\n"
+        "2024-02-05 10:00:00.000001,Такси,300.0,домой\n"
+        "2024-02-25 10:00:00.000001,Еда,50.0,\n"
+        "2024-03-01 10:00:00.000001,Кино,700.0,премьера\n",
+        encoding="utf-8"
+    )
+    return FinanceStorage(str(path))
+
+def test_csv_export_for_previous_month(storage):
+    export = build_export(storage, "prev", "csv", now=NOW, chunksize=1)
+    df = pd.read_csv(export.open())
+    assert export.filename == "expenses_prev.csv"
+    assert list(df['category']) == ["Такси", "Еда"]
+    assert export.rows == 2
+
+def test_large_csv_is_gzipped(storage, monkeypatch):
+    monkeypatch.setattr(export_module, "GZIP_THRESHOLD", 10)
+    export = build_export(storage, "all", "csv", now=NOW)
+    assert export.filename.endswith(".csv.gz")
+    df = pd.read_csv(io.BytesIO(gzip.decompress(export.open().read())))
+    assert len(df) == 4
+
+@pytest.mark.parametrize("fmt", ["xlsx", "parquet"])
+def test_optional_formats(storage, fmt):
+    if fmt not in available_formats():
+        pytest.skip(f"нет зависимостей для {fmt}")
+    export = build_export(storage, "year", fmt, now=NOW)
+    reader = pd.read_excel if fmt == "xlsx" else pd.read_parquet
+    df = reader(export.open())
+    assert list(df['amount']) == [100.0, 300.0, 50.0, 700.0]
+
+def test_export_cached_until_new_data(storage):
+    cache = ExportCache()
+    first = cache.get_or_build(1, storage, "all", "csv", now=NOW)
+    assert cache.get_or_build(1, storage, "all", "csv", now=NOW) is first
+
+    storage.add_expense("Кофе", 5)
+    second = cache.get_or_build(1, storage, "all", "csv", now=NOW)
+    assert second is not first
+    assert second.rows == 5
+
+def test_small_export_in_memory_large_on_disk(storage, export_dir, monkeypatch):
+    small = build_export(storage, "all", "csv", now=NOW)
+    assert small.path is None
+    assert list(export_dir.iterdir()) == []
+
+    monkeypatch.setattr(export_module, "SPOOL_MAX_BYTES", 10)
+    large = build_export(storage, "all", "csv", now=NOW)
+    assert [str(p) for p in export_dir.iterdir()] == [large.path]
+    assert len(pd.read_csv(large.open())) == 4
+    large.close()
+    assert list(export_dir.iterdir()) == []
+
+def test_failed_export_leaves_no_files(storage, export_dir, monkeypatch):
+    monkeypatch.setattr(export_module, "SPOOL_MAX_BYTES", 0)
+
+    def broken(frames, out):
+        out.write(b"date,category\n")
+        raise OSError("диск заполнен")
+    monkeypatch.setitem(export_module.WRITERS, "csv", broken)
+    with pytest.raises(OSError):
+        build_export(storage, "all", "csv", now=NOW)
+    assert list(export_dir.iterdir()) == []
+
+def test_leftover_exports_cleared_at_startup(export_dir):
+    export_dir.mkdir()
+    (export_dir / "export_old").write_bytes(b"x")
+    export_module.clear_export_dir()
+    assert list(export_dir.iterdir()) == []
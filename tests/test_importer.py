@@ -0,0 +1,74 @@
+import pytest
+import pandas as pd
+from src.importer import import_statement, map_columns
+from src.storage import FinanceStorage
+
+STATEMENT = (
+    "Дата операции;Категория;Сумма операции;Описание\n"
+    "01.02.2024 12:30:00;Супермаркеты;-1 234,50;Пятерочка\n"
+    "02.02.2024 09:00:00;Зарплата;50000,00;ООО Ромашка\n"
+    "03.02.2024 18:15:00;Такси;-450,00;Яндекс Go\n"
+    "дата;;-1;битая строка\n"
+)
+
+def test_bank_statement_import_and_dedup(tmp_path):
+    statement = tmp_path / "statement.csv"
+    statement.write_bytes(STATEMENT.encode("cp1251"))
+    storage = FinanceStorage(str(tmp_path / "1_finance.csv"))
+
+    progress = []
+    result = import_statement(str(statement), storage, chunksize=2, progress=lambda rows, added: progress.append(rows))
+
+    assert result == {"rows": 4, "added": 2, "duplicates": 0, "skipped": 2}
+    assert progress == [2, 4]
+    assert storage.get_stats_by_month(2024, 2) == {"Супермаркеты": 1234.5, "Такси": 450.0}
+
+    # Повторная загрузка той же выписки ничего не дублирует
+    again = import_statement(str(statement), storage)
+    assert again["added"] == 0
+    assert again["duplicates"] == 2
+    assert len(pd.read_csv(tmp_path / "1_finance.csv")) == 2
+
+def test_positive_amounts_without_category(tmp_path):
+    statement = tmp_path / "export.csv"
+    statement.write_text("date,amount,description\n2024-03-01,100.5,кофе\n", encoding="utf-8")
+    storage = FinanceStorage(str(tmp_path / "2_finance.csv"))
+
+    assert import_statement(str(statement), storage)["added"] == 1
+    assert storage.get_last_records()[0]["category"] == "Импорт"
+    assert storage.get_last_records()[0]["note"] == "кофе"
+
+def test_iso_dates_and_sign_from_whole_file(tmp_path):
+    statement = tmp_path / "iso.csv"
+    statement.write_text(
+        "date,amount,description\n"
+        "2024-03-01,5000,зарплата\n"
+        "2024-03-13,-200,кофе\n"
+        "2024-03-02 10:00,-300.5,такси\n"
+        "15.03.2024,-100,обед\n", encoding="utf-8")
+    storage = FinanceStorage(str(tmp_path / "3_finance.csv"))
+
+    # Первый кусок - только поступление, минусы дальше: знак решается по всему файлу
+    result = import_statement(str(statement), storage, chunksize=1)
+    assert result == {"rows": 4, "added": 3, "duplicates": 0, "skipped": 1}
+    dates = sorted(r["date"].strftime("%Y-%m-%d %H:%M") for r in storage.get_last_records())
+    assert dates == ["2024-03-02 10:00", "2024-03-13 00:00", "2024-03-15 00:00"]
+
+def test_multiline_description_stays_one_row(tmp_path):
+    statement = tmp_path / "multiline.csv"
+    statement.write_text(
+        'date,amount,category,description\n'
+        '2024-03-01,-50,Еда,кофе\n'
+        '2024-03-02,-100,"Кафе\r\nи бары","line1\nline2   \t line3"\n', encoding="utf-8")
+    storage = FinanceStorage(str(tmp_path / "4_finance.csv"))
+
+    assert import_statement(str(statement), storage)["added"] == 2
+    # /records и /undo читают хвост файла построчно - запись должна занимать одну строку
+    last = storage.get_last_records(1)[0]
+    assert (last["category"], last["note"]) == ("Кафе и бары", "line1 line2 line3")
+    assert storage.delete_last_expense()
+    assert [r["note"] for r in storage.get_last_records()] == ["кофе"]
+
+def test_unknown_columns_are_reported():
+    with pytest.raises(ValueError, match="date"):
+        map_columns(["foo", "bar"])
@@ -0,0 +1,127 @@
+import shutil
+import threading
+import pandas as pd
+
+from src.storage import FinanceStorage
+from src.journal import WriteJournal, BufferedFinanceStorage, _encode, _marker
+
+def make_journal(tmp_path, **kwargs):
+    storages = {}
+
+    def open_storage(key):
+        return storages.setdefault(key, FinanceStorage(str(tmp_path / f"{key}_finance.csv")))
+    kwargs.setdefault("flush_interval", 60)
+    return WriteJournal(str(tmp_path / "journal.log"), open_storage, **kwargs), open_storage
+
+def test_reads_see_buffered_writes(tmp_path):
+    journal, open_storage = make_journal(tmp_path)
+    journal.start()
+    storage = BufferedFinanceStorage(open_storage(1), journal, 1)
+    now = pd.Timestamp.now()
+
+    storage.set_budget(1000)
+    storage.add_expense("Еда", 200)
+    storage.add_expenses([{"category": "Такси", "amount": 50, "note": "аэропорт"}])
+
+    # В CSV еще ничего нет, но бот уже видит траты
+    assert not (tmp_path / "1_finance.csv").exists()
+    assert [r['category'] for r in storage.get_last_records()] == ["Такси", "Еда"]
+    assert storage.get_stats_by_month(now.year, now.month) == {"Еда": 200.0, "Такси": 50.0}
+    assert storage.get_budget_status()['remaining'] == 750.0
+
+    # Поиск сначала переносит буфер в хранилище
+    assert storage.search_records("аэро")[0]['note'] == "аэропорт"
+    assert journal.buffered(1) == []
+    assert list(pd.read_csv(tmp_path / "1_finance.csv")['category']) == ["Еда", "Такси"]
+    journal.close()
+
+def test_flush_by_size_in_background(tmp_path):
+    journal, open_storage = make_journal(tmp_path, flush_rows=3)
+    journal.start()
+    storage = BufferedFinanceStorage(open_storage(1), journal, 1)
+    for i in range(3):
+        storage.add_expense("Кофе", i + 1)
+
+    for _ in range(100):
+        if journal.pending_rows() == 0 and not journal.buffered(1):
+            break
+        threading.Event().wait(0.05)
+    assert len(open_storage(1).get_last_records()) == 3
+    journal.close()
+
+def test_replay_after_crash(tmp_path):
+    journal, open_storage = make_journal(tmp_path)
+    journal.start()
+    BufferedFinanceStorage(open_storage(7), journal, 7).add_expense("Такси", 500, "домой")
+    # Процесс "упал": буфер потерян, на диске остался только журнал
+    crashed = tmp_path / "crashed"
+    crashed.mkdir()
+    shutil.copy(journal.path, crashed / "journal.log")
+    journal.close()
+
+    restarted, reopen = make_journal(crashed)
+    assert restarted.replay() == 1
+    assert reopen(7).get_last_records()[0]['note'] == "домой"
+    assert not (crashed / "journal.log").exists()
+
+def test_flushing_batch_is_not_applied_twice(tmp_path):
+    journal, open_storage = make_journal(tmp_path)
+    row = {"date": pd.Timestamp.now().to_pydatetime(), "category": "Еда", "amount": 10.0, "note": ""}
+    # Сбой после записи пачки в хранилище, но до удаления .flushing
+    open_storage(1).add_expenses([row])
+    with open(journal.flushing_path, "wb") as f:
+        f.write(_encode(1, row))
+
+    assert journal.replay() == 0
+    assert len(open_storage(1).get_last_records()) == 1
+
+def test_search_flushes_only_own_buffer(tmp_path):
+    journal, open_storage = make_journal(tmp_path)
+    journal.start()
+    BufferedFinanceStorage(open_storage(1), journal, 1).add_expense("Такси", 300, "аэропорт")
+    BufferedFinanceStorage(open_storage(2), journal, 2).add_expense("Еда", 50)
+
+    assert BufferedFinanceStorage(open_storage(1), journal, 1).search("аэро")["total"] == 300
+    assert journal.buffered(1) == []
+    assert len(journal.buffered(2)) == 1
+    assert not (tmp_path / "2_finance.csv").exists()
+
+    # Сбой после переноса пользователя 1: при проигрывании журнала его трата не дублируется
+    crashed = tmp_path / "crashed"
+    crashed.mkdir()
+    shutil.copy(journal.path, crashed / "journal.log")
+    shutil.copy(tmp_path / "1_finance.csv", crashed / "1_finance.csv")
+    journal.close()
+    restarted, reopen = make_journal(crashed)
+    assert restarted.replay() == 1
+    assert len(reopen(1).get_last_records()) == 1
+    assert reopen(2).get_last_records()[0]["category"] == "Еда"
+
+def test_interrupted_user_flush_is_checked_against_storage(tmp_path):
+    journal, open_storage = make_journal(tmp_path)
+    row = {"date": pd.Timestamp.now().to_pydatetime(), "category": "Еда", "amount": 10.0, "note": ""}
+    # Отметка переноса есть, а в хранилище трата так и не попала
+    with open(journal.path, "wb") as f:
+        f.write(_encode(1, row) + _marker(1, "f", 1))
+
+    assert journal.replay() == 1
+    assert len(open_storage(1).get_last_records()) == 1
+
+def test_concurrent_writers_lose_nothing(tmp_path):
+    journal, open_storage = make_journal(tmp_path)
+    journal.start()
+
+    def writer(user_id):
+        storage = BufferedFinanceStorage(open_storage(user_id), journal, user_id)
+        for i in range(20):
+            storage.add_expense("Кофе", i + 1)
+
+    threads = [threading.Thread(target=writer, args=(user_id,)) for user_id in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    journal.flush()
+    assert all(len(open_storage(user_id).get_last_records(100)) == 20 for user_id in range(8))
+    journal.close()
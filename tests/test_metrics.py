@@ -0,0 +1,63 @@
+import time
+import telebot
+
+from keep_alive import app
+from src.metrics import Registry, SamplingProfiler, STORAGE_SECONDS, STORAGE_ROWS, HANDLER_SECONDS, instrument_bot
+from src.storage import FinanceStorage
+
+def test_prometheus_text_format():
+    registry = Registry()
+    latency = registry.histogram("handler_seconds", "Время", ["handler"], buckets=(0.1, 1.0))
+    errors = registry.counter("errors_total", "Ошибки", ["handler"])
+    registry.gauge("queue_size", "Очередь", lambda: 3)
+    latency.observe(0.05, handler='stats')
+    latency.observe(0.5, handler='stats')
+    errors.inc(handler='say "hi"')
+
+    text = registry.render()
+    assert "# TYPE handler_seconds histogram" in text
+    assert 'handler_seconds_bucket{handler="stats",le="0.1"} 1' in text
+    assert 'handler_seconds_bucket{handler="stats",le="+Inf"} 2' in text
+    assert 'handler_seconds_count{handler="stats"} 2' in text
+    assert 'errors_total{handler="say \\"hi\\""} 1' in text
+    assert "queue_size 3" in text
+
+def test_storage_calls_counted_once(tmp_path):
+    storage = FinanceStorage(str(tmp_path / "1_finance.csv"))
+    calls = STORAGE_SECONDS.count(backend="csv", method="get_budget_status")
+    nested = STORAGE_SECONDS.count(backend="csv", method="get_stats_by_month")
+    written = STORAGE_ROWS.value(backend="csv", direction="write")
+
+    storage.add_expenses([{"category": "Еда", "amount": 10}, {"category": "Кино", "amount": 5}])
+    storage.get_budget_status()
+
+    assert STORAGE_SECONDS.count(backend="csv", method="get_budget_status") == calls + 1
+    assert STORAGE_SECONDS.count(backend="csv", method="get_stats_by_month") == nested
+    assert STORAGE_ROWS.value(backend="csv", direction="write") == written + 2
+
+def test_handlers_are_timed_and_slow_ones_profiled():
+    bot = telebot.TeleBot("123456:TEST", threaded=False)
+    profiler = SamplingProfiler(threshold_ms=20, interval=0.002).start()
+
+    @bot.message_handler(commands=['slow'])
+    def slow_command(message):
+        time.sleep(0.05)
+
+    instrument_bot(bot, profiler)
+    update = telebot.types.Update.de_json({
+        "update_id": 1,
+        "message": {"message_id": 1, "date": 0, "text": "/slow",
+                    "chat": {"id": 1, "type": "private"},
+                    "entities": [{"type": "bot_command", "offset": 0, "length": 5}]}
+    })
+    bot.process_new_updates([update])
+
+    assert HANDLER_SECONDS.count(handler="slow_command") == 1
+    # В отчете стек с самим обработчиком: "slow_command (test_metrics.py:NN)"
+    assert "slow_command (test_metrics.py" in profiler.dump()
+
+def test_metrics_route():
+    response = app.test_client().get("/metrics")
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    assert "# TYPE storage_call_seconds histogram" in response.get_data(as_text=True)
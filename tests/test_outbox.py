@@ -0,0 +1,139 @@
+import time
+import pytest
+import telebot
+from telebot import apihelper
+
+from src.outbox import Outbox, TokenBucket, pooled_session
+from tests.fake_bot_api import FakeBotAPI
+
+@pytest.fixture
+def api(monkeypatch):
+    with FakeBotAPI() as fake:
+        monkeypatch.setattr(apihelper, "API_URL", fake.api_url)
+        monkeypatch.setattr(apihelper, "session", None)
+        yield fake
+
+@pytest.fixture
+def bot():
+    return telebot.TeleBot("123456:TEST", threaded=False)
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=2, capacity=2, now=0.0)
+    bucket.take(0.0)
+    bucket.take(0.0)
+    assert bucket.delay(0.0) == 0.5
+    assert bucket.delay(0.5) == 0.0
+    assert not bucket.full(0.5)
+    assert bucket.full(1.0)
+
+def test_handler_does_not_wait_for_retry_after(api, bot):
+    outbox = Outbox(bot, workers=2)
+    api.fail_next(429, retry_after=1, chat_id=1)
+
+    start = time.monotonic()
+    first = outbox.send_message(1, "раз")
+    outbox.send_message(1, "два")
+    outbox.send_message(2, "другой чат")
+    assert time.monotonic() - start < 0.5
+
+    assert outbox.join(timeout=10)
+    assert first.result().text == "раз"
+    assert api.texts(1) == ["раз", "два"]
+    # Повтор не раньше retry_after; другой чат 429 не задерживает
+    attempts = [call.time for call in api.calls if call.params.get("text") == "раз"]
+    assert attempts[1] - attempts[0] >= 0.9
+    assert api.sent(2)[0].time < attempts[1]
+    outbox.close()
+
+def test_per_chat_rate_and_order(api, bot, monkeypatch):
+    outbox = Outbox(bot, workers=4, chat_rate=10, chat_burst=1)
+    started = {1: [], 2: []}
+    send_message = bot.send_message
+    monkeypatch.setattr(bot, "send_message", lambda chat_id, text: started[chat_id].append(time.monotonic())
+                        or send_message(chat_id, text))
+    for i in range(5):
+        for chat_id in (1, 2):
+            outbox.send_message(chat_id, f"{chat_id}-{i}")
+    assert outbox.join(timeout=10)
+
+    for chat_id in (1, 2):
+        assert api.texts(chat_id) == [f"{chat_id}-{i}" for i in range(5)]
+        times = started[chat_id]
+        assert min(b - a for a, b in zip(times, times[1:])) >= 0.095
+    outbox.close()
+
+def test_permanent_error_is_not_retried(api, bot):
+    outbox = Outbox(bot, workers=1)
+    api.fail_next(403, description="Forbidden: bot was blocked by the user", chat_id=1)
+
+    blocked = outbox.send_message(1, "не дойдет")
+    delivered = outbox.reply_to(telebot.types.Message.de_json(
+        {"message_id": 5, "date": 0, "chat": {"id": 1, "type": "private"}, "text": "Кофе 100"}), "✅ Кофе")
+    assert outbox.join(timeout=10)
+
+    with pytest.raises(apihelper.ApiTelegramException):
+        blocked.result()
+    assert delivered.result().text == "✅ Кофе"
+    assert len(api.calls) == 2
+    outbox.close()
+
+def test_files_and_pooled_connections(api, bot, tmp_path):
+    pooled_session(pool_size=2)
+    outbox = Outbox(bot, workers=2, chat_rate=1000, chat_burst=1000, global_rate=1000)
+    path = tmp_path / "expenses.csv"
+    path.write_bytes(b"date,category,amount,note\n")
+    with open(path, "rb") as f:
+        document = outbox.send_document(1, f, visible_file_name="expenses.csv")
+    outbox.send_photo(1, b"\x89PNG", caption="график")
+    for i in range(20):
+        outbox.send_message(i, "ok")
+    assert outbox.join(timeout=10)
+
+    assert document.done()
+    assert api.sent(method="sendDocument")[0].params["document"] == b"date,category,amount,note\n"
+    assert api.sent(method="sendPhoto")[0].params["caption"] == "график"
+    # Соединения переиспользуются: не больше, чем размер пула
+    assert len({call.client for call in api.calls}) <= 2
+    outbox.close()
+
+def test_edit_waits_for_send_to_same_chat(api, bot):
+    outbox = Outbox(bot, workers=4, chat_rate=1000, chat_burst=1000, global_rate=1000)
+    api.fail_next(429, retry_after=0.3, method="sendMessage", chat_id=1)
+
+    outbox.send_message(1, "⏳ Обработано строк: 100")
+    # edit_message_text(text, chat_id, message_id): чат - второй аргумент, а не текст
+    outbox.edit_message_text("✅ Импорт завершен", 1, 1)
+    assert outbox.join(timeout=10)
+
+    assert [call.method for call in api.sent(1)] == ["sendMessage", "editMessageText"]
+    outbox.close()
+
+def test_file_is_read_again_on_retry(api, bot, tmp_path):
+    outbox = Outbox(bot, workers=1, chat_rate=1000, chat_burst=1000, global_rate=1000)
+    api.fail_next(429, retry_after=0, method="sendDocument")
+    path = tmp_path / "expenses.csv"
+    path.write_bytes(b"date,category,amount,note\n")
+
+    with open(path, "rb") as f:
+        outbox.send_document(1, f, visible_file_name="expenses.csv")
+    assert outbox.join(timeout=10)
+
+    assert len([call for call in api.calls if call.method == "sendDocument"]) == 2
+    assert api.sent(method="sendDocument")[0].params["document"] == b"date,category,amount,note\n"
+    outbox.close()
+
+
+def test_queued_file_is_closed_after_send(api, bot, tmp_path):
+    outbox = Outbox(bot, workers=1, chat_rate=1000, chat_burst=1000, global_rate=1000)
+    api.fail_next(429, retry_after=0, method="sendDocument")
+    path = tmp_path / "expenses.csv"
+    path.write_bytes(b"date,category,amount,note\n")
+
+    # Как /history: обработчик отдает очереди свежий дескриптор и больше его не трогает
+    f = open(path, "rb")
+    outbox.send_document(1, f, visible_file_name="expenses.csv")
+    assert outbox.join(timeout=10)
+
+    assert f.closed
+    assert len(api.sent(method="sendDocument")) == 1
+    outbox.close()
@@ -1,5 +1,5 @@
 import pytest
-from src.parser import parse_input
+from src.parser import parse_input, parse_batch
 
 def test_parse_correct_int():
     # Тест: целые доллары
@@ -23,4 +23,10 @@ def test_parse_with_currency_sign():
 def test_parse_invalid_amount():
     text = "Такси много"
     with pytest.raises(ValueError):
-        parse_input(text)
\ No newline at end of file
+        parse_input(text)
+def test_parse_batch_keeps_valid_lines():
+    text = "Такси 500 в аэропорт\n\nКофе 4,50\nОбед дорого\nХлеб"
+    entries, errors = parse_batch(text)
+    assert [e["category"] for e in entries] == ["Такси", "Кофе"]
+    assert entries[1]["amount"] == 4.5
+    assert [line_no for line_no, _, _ in errors] == [4, 5]
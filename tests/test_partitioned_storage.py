@@ -0,0 +1,77 @@
+import os
+import pytest
+import pandas as pd
+
+pytest.importorskip("pyarrow")
+
+from src.cache import StorageCache
+from src.storage import FinanceStorage
+from src.partitioned_storage import PartitionedFinanceStorage, convert
+
+
+def test_same_api_as_file_storage(tmp_path):
+    storage = PartitionedFinanceStorage(str(tmp_path / "42_finance.csv"))
+    now = pd.Timestamp.now()
+
+    storage.set_currency("€")
+    storage.set_budget(1000)
+    storage.add_expense("Еда", 200.1)
+    storage.add_expense("Такси", 50, "аэропорт")
+
+    assert storage.get_currency() == "€"
+    assert storage.get_stats_by_month(now.year, now.month) == {"Еда": 200.1, "Такси": 50.0}
+    assert storage.get_budget_status()['remaining'] == pytest.approx(749.9)
+    assert [r['category'] for r in storage.get_last_records()] == ["Такси", "Еда"]
+    assert storage.search_records("аэро")[0]['note'] == "аэропорт"
+    assert storage.get_available_months() == [(now.year, now.month)]
+
+    assert storage.delete_last_expense() == True
+    assert storage.get_stats_by_month(now.year, now.month) == {"Еда": 200.1}
+
+    storage.reset_data()
+    assert storage.get_last_records() == []
+    assert storage.delete_last_expense() == False
+    assert storage.get_currency() == "€"
+
+def test_one_file_per_month(tmp_path):
+    storage = PartitionedFinanceStorage(str(tmp_path / "1_finance.csv"))
+    storage.add_expenses([
+        {"category": "Еда", "amount": 10, "date": pd.Timestamp("2024-01-05 10:00")},
+        {"category": "Кино", "amount": 20, "date": pd.Timestamp("2024-02-01 12:00")},
+        {"category": "Еда", "amount": 5, "date": pd.Timestamp("2024-01-20 09:00")},
+    ])
+
+    assert sorted(os.listdir(storage.parts_dir)) == ["2024-01.feather", "2024-02.feather", "manifest.json"]
+    assert storage.get_stats_by_month(2024, 1) == {"Еда": 15.0}
+    assert storage.get_available_months() == [(2024, 1), (2024, 2)]
+    # Порядок - по добавлению, а не по месяцу
+    assert [r['amount'] for r in storage.get_last_records(2)] == [5.0, 20.0]
+
+def test_cached_reads_follow_writes(tmp_path):
+    cache = StorageCache()
+    storage = PartitionedFinanceStorage(str(tmp_path / "1_finance.csv"), cache=cache)
+    storage.add_expense("Еда", 10)
+    assert storage.search("еда")["count"] == 1
+    storage.add_expense("Еда", 15)
+    assert storage.search("еда")["total"] == 25.0
+    storage.delete_last_expense()
+    assert len(storage._load_data()) == 1
+    assert storage.search("еда")["total"] == 10.0
+    assert storage.get_last_records()[0]['amount'] == 10.0
+
+def test_convert_from_csv(tmp_path):
+    csv_storage = FinanceStorage(str(tmp_path / "7_finance.csv"))
+    csv_storage.add_expense("Еда", 100, "обед")
+    csv_storage.add_expense("Такси", 30)
+    csv_storage.set_budget(500)
+
+    assert convert(str(tmp_path)) == 1
+
+    storage = PartitionedFinanceStorage(str(tmp_path / "7_finance.csv"))
+    pd.testing.assert_frame_equal(
+        storage._load_data().astype({"category": str}),
+        csv_storage._load_data().astype({"category": str}),
+        check_dtype=False,
+    )
+    assert storage.get_budget_status()['spent'] == 130.0
+    assert sum(len(frame) for frame in storage.iter_frames()) == 2
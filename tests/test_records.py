@@ -0,0 +1,62 @@
+import pandas as pd
+from datetime import datetime
+
+from src.records import Record, records_from_frame, records_at, compact_frame, append_compact, CachedHistory
+
+def test_record_is_compact_and_dict_like():
+    record = Record.from_row({"date": datetime(2024, 3, 1, 12, 30, 0, 123456), "category": "Кофе", "amount": 4.5, "note": "латте"})
+
+    assert not hasattr(record, "__dict__")
+    assert record.cents == 450
+    assert record['amount'] == 4.5
+    assert record['date'] == datetime(2024, 3, 1, 12, 30, 0, 123456)
+    assert record['date'].strftime("%d.%m") == "01.03"
+    assert record.as_dict()['note'] == "латте"
+
+def test_categories_survive_append():
+    df = compact_frame(pd.DataFrame({
+        "date": pd.to_datetime(["2024-01-01", "2024-01-02"]),
+        "category": ["Еда", "Кофе"],
+        "amount": [10.0, 0.1],
+        "note": ["", ""],
+    }))
+    new_rows = pd.DataFrame([{"date": datetime(2024, 1, 3), "category": "Такси", "amount": 0.2, "note": "домой"}])
+    combined = append_compact(df, new_rows)
+
+    assert combined['category'].dtype == "category"
+    assert combined['note'].dtype == "category"
+    assert list(combined['category']) == ["Еда", "Кофе", "Такси"]
+    assert [r.cents for r in records_from_frame(combined)] == [1000, 10, 20]
+
+def test_cached_history_appends_to_tail():
+    history = CachedHistory(compact_frame(pd.DataFrame({
+        "date": pd.to_datetime(["2024-01-01"]),
+        "category": ["Еда"],
+        "amount": [10.0],
+        "note": [""],
+    })))
+    frame = history.frame()
+    history.append([{"date": datetime(2024, 1, 2), "category": "Такси", "amount": 0.2, "note": "домой"},
+                    {"date": datetime(2024, 1, 3), "category": "Кофе", "amount": 4.5, "note": ""}])
+    history.drop_last()
+
+    # Запись не пересобирает DataFrame - хвост вливается при чтении всей истории
+    assert history._frame is frame
+    assert [r.category for r in history.last_records(5)] == ["Такси", "Еда"]
+    assert len(history) == 2
+    combined = history.frame()
+    assert combined['category'].dtype == "category"
+    assert list(combined['note']) == ["", "домой"]
+
+def test_records_at_matches_iloc():
+    df = pd.DataFrame({
+        "date": pd.to_datetime(["2024-01-01 10:00:00", "2024-01-02 00:00:00", "2024-01-03 23:59:59.5"], format="ISO8601"),
+        "category": ["Еда", "Кофе", "Еда"],
+        "amount": [10.0, 0.1, 0.29],
+        "note": ["", None, "обед"],
+        "currency": ["$", "€", "$"],
+    })
+    positions = [2, 0, 1]
+    for frame in (df, compact_frame(df)):
+        assert records_at(frame, positions) == records_from_frame(frame.iloc[positions])
+    assert records_at(df, []) == []
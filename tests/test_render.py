@@ -0,0 +1,35 @@
+from src.render import ChartRenderer
+
+def test_same_input_is_rendered_once(monkeypatch):
+    calls = []
+    renderer = ChartRenderer(workers=0)
+    monkeypatch.setattr("src.render._render_pie", lambda *args: calls.append(args) or b"png")
+
+    assert renderer.render_pie({"Еда": 100, "Такси": 50}, "$") == b"png"
+    assert renderer.render_pie({"Такси": 50, "Еда": 100}, "$") == b"png"
+    assert len(calls) == 1
+
+    renderer.render_pie({"Еда": 100, "Такси": 50}, "€")
+    assert len(calls) == 2
+
+def test_cache_is_bounded(monkeypatch):
+    renderer = ChartRenderer(workers=0, cache_size=2)
+    monkeypatch.setattr("src.render._render_pie", lambda stats, cur, dpi: cur.encode())
+
+    for cur in ["$", "€", "₽"]:
+        renderer.render_pie({"Еда": 1}, cur)
+    assert len(renderer._cache) == 2
+
+def test_process_pool_returns_png():
+    renderer = ChartRenderer(workers=1, dpi=20)
+    try:
+        png = renderer.render_pie({"Еда": 100, "Такси": 50}, "₾")
+    finally:
+        renderer.shutdown()
+    assert png.startswith(b"\x89PNG")
+
+def test_trend_chart():
+    renderer = ChartRenderer(workers=0, dpi=20)
+    png = renderer.render_trend(["2024-01", "2024-02"], {"Еда": [100, 0], "Такси": [50, 20]}, "€")
+    assert png.startswith(b"\x89PNG")
+    assert renderer.render_trend(["2024-01", "2024-02"], {"Еда": [100.0, 0.0], "Такси": [50.0, 20.0]}, "€") is png
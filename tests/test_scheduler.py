@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+
+from src.storage import FinanceStorage
+from src.render import ChartRenderer
+from src.reports import ReportStore, previous_month
+from src.scheduler import ReportScheduler, DigestLog, ACTIVE_DAYS
+
+NOW = datetime(2024, 3, 2, 12, 0)
+ROWS = [
+    {"date": datetime(2024, 2, 10), "category": "Еда", "amount": 100.0},
+    {"date": datetime(2024, 2, 20), "category": "Такси", "amount": 50.0},
+    {"date": datetime(2024, 3, 1), "category": "Еда", "amount": 10.0},
+]
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def make_scheduler(tmp_path, **kwargs):
+    storages = {}
+
+    def open_storage(user_id):
+        return storages.setdefault(user_id, FinanceStorage(str(tmp_path / f"{user_id}_finance.csv")))
+
+    store = ReportStore(ChartRenderer(workers=0, dpi=20))
+    clock = Clock(NOW)
+    return ReportScheduler(store, open_storage, workers=0, clock=clock, **kwargs), open_storage, clock
+
+
+def test_previous_month_cross_year():
+    assert previous_month(datetime(2024, 1, 5)) == (2023, 12)
+    assert previous_month(NOW) == (2024, 2)
+
+
+def test_reports_built_in_background_and_reused(tmp_path):
+    scheduler, open_storage, clock = make_scheduler(tmp_path)
+    open_storage(1).add_expenses(ROWS)
+    scheduler.touch(1)
+
+    assert scheduler.run_once() == 1
+    assert scheduler.store.misses == 1
+    # Уже построен и пользователь с тех пор не писал - не трогаем
+    assert scheduler.run_once() == 0
+
+    report = scheduler.store.get_or_build(1, open_storage(1), 2024, 2)
+    assert report.stats == {"Еда": 100.0, "Такси": 50.0}
+    assert report.spent == 150.0
+    assert report.png.startswith(b"\x89PNG")
+    assert scheduler.store.hits == 1
+
+    # Трата в текущем месяце отчет за прошлый не сбрасывает
+    clock.now += timedelta(minutes=1)
+    open_storage(1).add_expenses([{"date": datetime(2024, 3, 2, 12, 0), "category": "Кофе", "amount": 5.0}])
+    scheduler.touch(1)
+    assert scheduler.run_once() == 1
+    assert scheduler.store.misses == 1
+
+    # Трата задним числом в прошлом месяце - отчет строится заново
+    clock.now += timedelta(minutes=1)
+    open_storage(1).add_expenses([{"date": datetime(2024, 2, 28), "category": "Кофе", "amount": 5.0}])
+    scheduler.touch(1)
+    assert scheduler.run_once() == 1
+    assert scheduler.store.misses == 2
+    assert scheduler.store.get_or_build(1, open_storage(1), 2024, 2).spent == 155.0
+
+    # Давно не писал - больше не активен
+    clock.now += timedelta(days=ACTIVE_DAYS + 1)
+    assert scheduler.due() == []
+
+
+def test_busy_bot_postpones_reports(tmp_path, monkeypatch):
+    busy = [True, True, False]
+    monkeypatch.setattr("src.scheduler.IDLE_POLL", 0.01)
+    scheduler, open_storage, _ = make_scheduler(tmp_path, busy=lambda: busy.pop(0) if busy else False)
+    scheduler.touch(1)
+
+    scheduler.run_once()
+    assert busy == []
+    assert scheduler.store.misses == 1
+
+
+def test_digest_sent_once_per_month(tmp_path):
+    sent = []
+    log_path = tmp_path / "digests.json"
+    scheduler, open_storage, clock = make_scheduler(
+        tmp_path, digest=lambda user_id, report: sent.append((user_id, report.spent)),
+        digest_log=DigestLog(str(log_path)))
+    open_storage(1).add_expenses(ROWS)
+    scheduler.touch(1)
+    scheduler.touch(2)  # нет трат за прошлый месяц - итоги не нужны
+
+    scheduler.run_once()
+    clock.now += timedelta(minutes=1)
+    scheduler.touch(1)
+    scheduler.run_once()
+    assert sent == [(1, 150.0)]
+    # После перезапуска тоже помним, кому отправлено
+    assert not DigestLog(str(log_path)).claim(1, "2024-02")
+    assert DigestLog(str(log_path)).claim(1, "2024-03")
+
+
+def test_active_users_survive_restart(tmp_path):
+    active_path = str(tmp_path / "active_users.json")
+    scheduler, open_storage, clock = make_scheduler(tmp_path, active_path=active_path)
+    open_storage(1).add_expenses(ROWS)
+    clock.now -= timedelta(days=ACTIVE_DAYS + 1)
+    scheduler.touch(2)  # давно не писал - после перезапуска не нужен
+    clock.now = NOW
+    scheduler.touch(1)
+    scheduler.save_active()
+
+    restarted, _, _ = make_scheduler(tmp_path, active_path=active_path)
+    assert restarted.due() == [1]
+    assert restarted.run_once() == 1
+    assert restarted.store.misses == 1
@@ -0,0 +1,101 @@
+import pandas as pd
+from src.storage import FinanceStorage
+from src.sqlite_storage import SQLiteFinanceStorage, migrate
+
+def test_same_api_as_file_storage(tmp_path):
+    storage = SQLiteFinanceStorage(str(tmp_path / "finance.db"), 42)
+    now = pd.Timestamp.now()
+
+    assert storage.get_currency() == "$"
+    storage.set_currency("€")
+    storage.set_budget(1000)
+    storage.add_expense("Еда", 200)
+    storage.add_expense("Такси", 50, "аэропорт")
+
+    assert storage.get_currency() == "€"
+    assert storage.get_stats_by_month(now.year, now.month) == {"Еда": 200.0, "Такси": 50.0}
+    assert storage.get_budget_status()['remaining'] == 750.0
+    assert [r['category'] for r in storage.get_last_records()] == ["Такси", "Еда"]
+    assert storage.search_records("аэро")[0]['note'] == "аэропорт"
+
+    assert storage.delete_last_expense() == True
+    assert storage.get_stats_by_month(now.year, now.month) == {"Еда": 200.0}
+
+    storage.reset_data()
+    assert storage.get_last_records() == []
+    assert storage.delete_last_expense() == False
+    assert storage.get_currency() == "€"
+
+def test_users_are_isolated(tmp_path):
+    db = str(tmp_path / "finance.db")
+    SQLiteFinanceStorage(db, 1).add_expense("Еда", 10)
+    SQLiteFinanceStorage(db, 2).add_expense("Кино", 20)
+
+    assert [r['category'] for r in SQLiteFinanceStorage(db, 1).get_last_records()] == ["Еда"]
+
+def test_search_prefix_and_special_chars(tmp_path):
+    storage = SQLiteFinanceStorage(str(tmp_path / "finance.db"), 1)
+    storage.add_expense("Еда", 10, "скидка (50%)")
+    storage.add_expense("Кафе", 15, "500 руб")
+    SQLiteFinanceStorage(str(tmp_path / "finance.db"), 2).add_expense("Еда", 99, "скидка")
+
+    result = storage.search("скид (")
+    assert result["count"] == 1
+    assert result["total"] == 10
+    assert storage.search("кафе руб")["records"][0]["amount"] == 15
+
+def test_search_in_group_chat(tmp_path):
+    # У групповых чатов id отрицательные: owner "u-1001234" - не должен разбираться как выражение FTS5
+    group = SQLiteFinanceStorage(str(tmp_path / "finance.db"), -1001234)
+    group.add_expense("Такси", 300, "аэропорт")
+    SQLiteFinanceStorage(str(tmp_path / "finance.db"), 1001234).add_expense("Такси", 99, "аэропорт")
+
+    result = group.search("аэро")
+    assert result["count"] == 1
+    assert result["total"] == 300
+    assert SQLiteFinanceStorage(str(tmp_path / "finance.db"), 1001234).search("такси")["total"] == 99
+
+def test_migrate_csv_files(tmp_path):
+    source = FinanceStorage(str(tmp_path / "77_finance.csv"))
+    source.add_expense("Еда", 100)
+    source.add_expense("Кино", 300, "премьера")
+    source.set_budget(5000)
+    source.set_currency("₽")
+    db = str(tmp_path / "finance.db")
+
+    assert migrate(str(tmp_path), db) == 1
+    assert migrate(str(tmp_path), db) == 1  # повторный запуск не дублирует записи
+
+    storage = SQLiteFinanceStorage(db, 77)
+    assert [r['category'] for r in storage.get_last_records()] == ["Кино", "Еда"]
+    assert storage.get_currency() == "₽"
+    assert storage.get_budget_status()['budget'] == 5000.0
+
+def test_search_is_case_insensitive_for_cyrillic(tmp_path):
+    storage = SQLiteFinanceStorage(str(tmp_path / "finance.db"), 1)
+    storage.add_expense("Такси", 500)
+
+    assert len(storage.search_records("такси")) == 1
+
+def test_iter_frames_by_date_range(tmp_path):
+    from datetime import datetime
+    storage = SQLiteFinanceStorage(str(tmp_path / "finance.db"), 1)
+    storage.add_expenses([
+        {"category": "Еда", "amount": 10, "date": datetime(2024, 1, 31, 23, 59)},
+        {"category": "Кино", "amount": 20, "date": datetime(2024, 2, 1)},
+        {"category": "Такси", "amount": 30, "date": datetime(2024, 2, 29, 12)},
+    ])
+    version = storage.data_version()
+
+    frames = list(storage.iter_frames(datetime(2024, 2, 1), datetime(2024, 3, 1), chunksize=1))
+    assert [f.iloc[0]['category'] for f in frames] == ["Кино", "Такси"]
+
+    storage.delete_last_expense()
+    assert storage.data_version() != version
+
+def test_search_total_has_no_float_drift(tmp_path):
+    storage = SQLiteFinanceStorage(str(tmp_path / "finance.db"), 1)
+    storage.add_expense("Кофе", 0.1)
+    storage.add_expense("Кофе", 0.2)
+
+    assert str(storage.search("кофе")["total"]) == "0.3"
@@ -0,0 +1,22 @@
+import sys
+from src.startup import lazy_import, report
+
+def test_lazy_module_imported_on_first_use(tmp_path, monkeypatch):
+    (tmp_path / "heavy_dep_for_test.py").write_text("VALUE = 42\n", encoding="utf-8")
+    monkeypatch.syspath_prepend(str(tmp_path))
+
+    module = lazy_import("heavy_dep_for_test")
+    assert "heavy_dep_for_test" not in sys.modules
+
+    assert module.VALUE == 42
+    assert "heavy_dep_for_test" in sys.modules
+    assert any(name == "lazy import heavy_dep_for_test" for name, _ in report.events)
+
+def test_storage_import_does_not_load_pandas():
+    import os
+    import subprocess
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = "import sys, src.bot; print('pandas' in sys.modules, 'matplotlib' in sys.modules)"
+    env = {"BOT_TOKEN": "123456:TEST", "PATH": ""}
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env, cwd=root)
+    assert result.stdout.strip() == "False False", result.stderr
@@ -39,4 +39,176 @@ def test_undo_empty(tmp_path):
     temp_file = tmp_path / "empty.csv"
     storage = FinanceStorage(str(temp_file))
     res = storage.delete_last_expense()
-    assert res == False
\ No newline at end of file
+    assert res == False
+def test_add_expense_appends_without_rewrite(tmp_path):
+    temp_file = tmp_path / "append_finance.csv"
+    storage = FinanceStorage(str(temp_file))
+
+    storage.add_expense("Такси", 500.0, "в аэропорт")
+    first = temp_file.read_bytes()
+    storage.add_expense("Кофе", 4.5)
+
+    # Первая запись осталась байт-в-байт, вторая дописана в конец
+    assert temp_file.read_bytes().startswith(first)
+    df = pd.read_csv(temp_file, parse_dates=['date'])
+    assert list(df.columns) == ["date", "category", "amount", "note"]
+    assert list(df['category']) == ["Такси", "Кофе"]
+    assert df['amount'].sum() == 504.5
+
+def test_add_expense_upgrades_old_format(tmp_path):
+    temp_file = tmp_path / "old_finance.csv"
+    temp_file.write_text("date,category,amount\n2024-01-05 10:00:00.000001,Еда,100.0\n", encoding="utf-8")
+    storage = FinanceStorage(str(temp_file))
+
+    storage.add_expense("Такси", 50.0)
+
+    df = pd.read_csv(temp_file)
+    assert list(df.columns) == ["date", "category", "amount", "note"]
+    assert list(df['category']) == ["Еда", "Такси"]
+
+def test_delete_last_expense_truncates_tail(tmp_path):
+    temp_file = tmp_path / "tail_finance.csv"
+    storage = FinanceStorage(str(temp_file))
+    storage.add_expense("А", 10)
+    after_first = temp_file.read_bytes()
+    storage.add_expense("Б", 20, "заметка")
+
+    assert storage.delete_last_expense() == True
+    assert temp_file.read_bytes() == after_first
+    assert storage.delete_last_expense() == True
+    assert storage.delete_last_expense() == False
+
+def test_rollup_tracks_add_delete_reset(tmp_path):
+    temp_file = tmp_path / "7_finance.csv"
+    storage = FinanceStorage(str(temp_file))
+    now = pd.Timestamp.now()
+
+    storage.add_expense("Еда", 100)
+    storage.add_expense("Еда", 50.5)
+    storage.add_expense("Такси", 300)
+    assert storage.get_stats_by_month(now.year, now.month) == {"Еда": 150.5, "Такси": 300.0}
+
+    storage.delete_last_expense()
+    assert storage.get_stats_by_month(now.year, now.month) == {"Еда": 150.5}
+    assert storage.check_rollup() == []
+
+    storage.reset_data()
+    assert storage.get_stats_by_month(now.year, now.month) == {}
+
+def test_rollup_rebuilt_for_existing_users(tmp_path):
+    temp_file = tmp_path / "8_finance.csv"
+    temp_file.write_text(
+        "date,category,amount,note\n"
+        "2024-01-05 10:00:00.000001,Еда,100.0,\n"
+        "2024-02-07 12:00:00.000001,Еда,40.0,\n"
+        "2024-02-09 12:00:00.000001,Кино,10.0,\n",
+        encoding="utf-8"
+    )
+    storage = FinanceStorage(str(temp_file))
+
+    # Файла итогов еще нет - он строится из CSV при первом обращении
+    assert storage.get_stats_by_month(2024, 2) == {"Еда": 40.0, "Кино": 10.0}
+    assert storage.get_available_months() == [(2024, 1), (2024, 2)]
+    assert (tmp_path / "8_rollup.json").exists()
+
+def test_rollup_rebuilt_after_same_size_edit(tmp_path):
+    temp_file = tmp_path / "9_finance.csv"
+    temp_file.write_text(
+        "date,category,amount,note\n"
+        "2024-01-05 10:00:00.000001,Еда,100.0,\n",
+        encoding="utf-8"
+    )
+    storage = FinanceStorage(str(temp_file))
+    assert storage.get_stats_by_month(2024, 1) == {"Еда": 100.0}
+
+    # Правка в обход бота той же длины: размер файла не меняется
+    stat = os.stat(temp_file)
+    temp_file.write_text(temp_file.read_text(encoding="utf-8").replace("100.0", "900.0"), encoding="utf-8")
+    os.utime(temp_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert os.path.getsize(temp_file) == stat.st_size
+
+    assert storage.get_stats_by_month(2024, 1) == {"Еда": 900.0}
+
+def test_search_index_follows_writes(tmp_path):
+    from src.cache import StorageCache
+    storage = FinanceStorage(str(tmp_path / "9_finance.csv"), cache=StorageCache())
+    storage.add_expense("Такси", 500.0, "в аэропорт (ночью)")
+    storage.add_expense("Еда", 200.0, "такос")
+    assert storage.search("так")["count"] == 2  # префикс по категории и по заметке
+
+    storage.add_expense("Такси", 300.0, "домой")
+    result = storage.search("такси")
+    assert [r["amount"] for r in result["records"]] == [300.0, 500.0]
+    assert result["total"] == 800.0
+    assert storage.search("такси аэро")["count"] == 1  # несколько слов - через И
+    assert storage.search("(ночью")["count"] == 1      # спецсимволы не ломают поиск
+
+    storage.delete_last_expense()
+    assert storage.search("домой")["count"] == 0
+    assert storage.search_records("такси")[0]["note"] == "в аэропорт (ночью)"
+
+def test_add_expenses_single_write(tmp_path):
+    temp_file = tmp_path / "10_finance.csv"
+    storage = FinanceStorage(str(temp_file))
+    storage.add_expense("Еда", 100)
+
+    assert storage.add_expenses([
+        {"category": "Такси", "amount": 300.0, "note": "домой"},
+        {"category": "Еда", "amount": 50.0, "note": ""},
+    ]) == 2
+
+    df = pd.read_csv(temp_file)
+    assert list(df['category']) == ["Еда", "Такси", "Еда"]
+    now = pd.Timestamp.now()
+    assert storage.get_stats_by_month(now.year, now.month) == {"Еда": 150.0, "Такси": 300.0}
+
+def test_last_records_read_from_tail(tmp_path, monkeypatch):
+    temp_file = tmp_path / "tail_finance.csv"
+    storage = FinanceStorage(str(temp_file))
+    storage.add_expenses([{"category": f"К{i}", "amount": i, "note": "x" * 50} for i in range(500)])
+    expected = pd.read_csv(temp_file, parse_dates=['date']).tail(10).iloc[::-1].to_dict('records')
+
+    # История целиком не читается
+    monkeypatch.setattr(storage, "_load_data", lambda: pytest.fail("full read"))
+    assert [r.as_dict() for r in storage.get_last_records(10)] == expected
+    assert len(storage.get_last_records(1000)) == 500
+
+    with open(temp_file, "a", encoding="utf-8") as f:
+        f.write("\n\n")
+    assert storage.get_last_records(1)[0]['category'] == "К499"
+
+def test_tail_keeps_quoted_newlines(tmp_path):
+    temp_file = tmp_path / "multiline_finance.csv"
+    storage = FinanceStorage(str(temp_file))
+    storage.add_expense("А", 10, "одна строка")
+    # Заметка длиннее блока чтения: хвост начинается внутри кавычек
+    storage.add_expense("Б", 20, "первая\n" + "x\n" * 3000 + "последняя")
+    storage.add_expense("В", 30, "две\r\nстроки")
+
+    fresh = FinanceStorage(str(temp_file))
+    assert [(r.category, r.note) for r in fresh.get_last_records(2)] == [("В", "две\r\nстроки"), ("Б", "первая\n" + "x\n" * 3000 + "последняя")]
+    assert fresh.delete_last_expense() == True
+    assert fresh.delete_last_expense() == True
+    assert list(pd.read_csv(temp_file)["note"]) == ["одна строка"]
+
+def test_unreadable_last_row_is_not_truncated(tmp_path, monkeypatch):
+    temp_file = tmp_path / "broken_finance.csv"
+    storage = FinanceStorage(str(temp_file))
+    storage.add_expense("А", 10)
+    storage.add_expense("Б", 20)
+    before = temp_file.read_bytes()
+
+    def broken(line, header=None):
+        raise ValueError(f"не разобрана строка {line!r}")
+    monkeypatch.setattr(storage, "_parse_row", broken)
+    with pytest.raises(ValueError):
+        storage.delete_last_expense()
+    assert temp_file.read_bytes() == before
+
+def test_search_total_has_no_float_drift(tmp_path):
+    storage = FinanceStorage(str(tmp_path / "1_finance.csv"))
+    storage.add_expense("Кофе", 0.1)
+    storage.add_expense("Кофе", 0.2)
+
+    assert str(storage.search("кофе")["total"]) == "0.3"
+    assert storage.search("кофе")["records"][0]['amount'] == 0.2
@@ -0,0 +1,84 @@
+import importlib.util
+from datetime import datetime
+
+import pytest
+
+from src import currency
+from src.storage import FinanceStorage
+from src.sqlite_storage import SQLiteFinanceStorage
+from src.trend import TrendCache, build_trend, last_months, trend_table, OTHER
+
+NOW = datetime(2024, 3, 15)
+ROWS = [
+    {"date": datetime(2023, 12, 31, 23, 59), "category": "Еда", "amount": 100.0},
+    {"date": datetime(2024, 1, 10), "category": "Еда", "amount": 0.1},
+    {"date": datetime(2024, 1, 11), "category": "Еда", "amount": 0.2},
+    {"date": datetime(2024, 3, 1), "category": "Такси", "amount": 300.0, "note": "домой"},
+    {"date": datetime(2024, 3, 2), "category": "Еда", "amount": 50.0},
+]
+
+def open_storages(tmp_path):
+    storages = [FinanceStorage(str(tmp_path / "1_finance.csv")), SQLiteFinanceStorage(str(tmp_path / "finance.db"), 1)]
+    if importlib.util.find_spec("pyarrow") is not None:
+        from src.partitioned_storage import PartitionedFinanceStorage
+        storages.append(PartitionedFinanceStorage(str(tmp_path / "2_finance.csv")))
+    return storages
+
+def test_last_months_cross_year():
+    assert last_months(4, NOW) == ["2023-12", "2024-01", "2024-02", "2024-03"]
+
+@pytest.mark.parametrize("index", [0, 1, 2])
+def test_monthly_totals_match_per_month_stats(tmp_path, index):
+    storages = open_storages(tmp_path)
+    if index >= len(storages):
+        pytest.skip("нет pyarrow")
+    storage = storages[index]
+    storage.add_expenses(ROWS)
+
+    totals = storage.get_monthly_totals("2024-01", "2024-03")
+    assert totals == {"2024-01": {"Еда": 0.3}, "2024-03": {"Такси": 300.0, "Еда": 50.0}}
+    for key, stats in totals.items():
+        assert stats == pytest.approx(storage.get_stats_by_month(int(key[:4]), int(key[5:])))
+
+def test_trend_table_fills_gaps_and_groups_small_categories():
+    totals = {"2024-01": {f"к{i}": float(i + 1) for i in range(10)}, "2024-03": {"к9": 5.0}}
+    table = trend_table(totals, ["2024-01", "2024-02", "2024-03"], top=3)
+
+    assert list(table.index) == ["2024-01", "2024-02", "2024-03"]
+    assert list(table.columns) == ["к9", "к8", "к7", OTHER]
+    assert list(table["к9"]) == [10.0, 0.0, 5.0]
+    assert table.loc["2024-01", OTHER] == sum(range(1, 8))
+
+def test_report_is_cached_until_new_data(tmp_path, monkeypatch):
+    storage = FinanceStorage(str(tmp_path / "1_finance.csv"))
+    storage.add_expenses(ROWS)
+    cache = TrendCache()
+    calls = []
+    monkeypatch.setattr("src.trend.build_trend", lambda *args: calls.append(args) or build_trend(*args))
+
+    report = cache.get_or_build(1, storage, 4, NOW)
+    assert cache.get_or_build(1, storage, 4, NOW) is report
+    assert len(calls) == 1
+    assert report.monthly() == [("2023-12", 100.0), ("2024-01", 0.3), ("2024-02", 0.0), ("2024-03", 350.0)]
+    assert report.series()["Такси"] == [0.0, 0.0, 0.0, 300.0]
+
+    storage.add_expenses([{"date": datetime(2024, 2, 1), "category": "Кино", "amount": 7.0}])
+    assert cache.get_or_build(1, storage, 4, NOW).monthly()[2] == ("2024-02", 7.0)
+    assert len(calls) == 2
+
+
+def test_report_follows_currency_and_rates(tmp_path, monkeypatch):
+    rates_path = tmp_path / "rates.csv"
+    rates_path.write_text("date,currency,rate\n2023-01-01,EUR,0.5\n", encoding="utf-8")
+    monkeypatch.setattr(currency.rates, "path", str(rates_path))
+    storage = FinanceStorage(str(tmp_path / "1_finance.csv"))
+    storage.set_currency("$")
+    storage.add_expenses([{"date": datetime(2024, 3, 1), "category": "Еда", "amount": 100.0}])
+    cache = TrendCache()
+
+    assert cache.get_or_build(1, storage, 1, NOW).total == 100.0
+    # /currency пишет только настройки - data_version() не меняется
+    storage.set_currency("€")
+    assert cache.get_or_build(1, storage, 1, NOW).total == 50.0
+    rates_path.write_text("date,currency,rate\n2023-01-01,EUR,0.25\n", encoding="utf-8")
+    assert cache.get_or_build(1, storage, 1, NOW).total == 25.0
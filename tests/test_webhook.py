@@ -0,0 +1,52 @@
+import os
+from flask import Flask
+from keep_alive import enable_webhook
+
+UPDATE_FILE = os.path.join(os.path.dirname(__file__), "data", "update_text.json")
+
+class FakeBot:
+    def __init__(self):
+        self.updates = []
+
+    def process_new_updates(self, updates):
+        self.updates.extend(updates)
+
+def read_update():
+    with open(UPDATE_FILE, "rb") as f:
+        return f.read()
+
+def test_recorded_update_reaches_dispatcher():
+    app, bot = Flask("test"), FakeBot()
+    queue = enable_webhook(bot, secret="s3cret", flask_app=app)
+    client = app.test_client()
+
+    response = client.post("/webhook", data=read_update(), content_type="application/json",
+                           headers={"X-Telegram-Bot-Api-Secret-Token": "s3cret"})
+    assert response.status_code == 200
+
+    queue.join()
+    assert bot.updates[0].message.text == "Такси 500 в аэропорт"
+    assert bot.updates[0].message.chat.id == 555000111
+
+def test_wrong_secret_is_rejected():
+    app, bot = Flask("test"), FakeBot()
+    enable_webhook(bot, secret="s3cret", flask_app=app)
+
+    response = app.test_client().post("/webhook", data=read_update(), content_type="application/json")
+    assert response.status_code == 403
+
+def test_full_queue_asks_telegram_to_retry():
+    app, bot = Flask("test"), FakeBot()
+    enable_webhook(bot, queue_size=1, workers=0, flask_app=app)
+    client = app.test_client()
+
+    assert client.post("/webhook", data=read_update(), content_type="application/json").status_code == 200
+    assert client.post("/webhook", data=read_update(), content_type="application/json").status_code == 503
+
+def test_malformed_update_is_rejected():
+    app, bot = Flask("test"), FakeBot()
+    enable_webhook(bot, workers=0, flask_app=app)
+    client = app.test_client()
+
+    for body in [b"{bad", b"[]", b'{"x": 1}', b"", b'{"update_id": 1, "message": {"message_id": 1}}']:
+        assert client.post("/webhook", data=body, content_type="application/json").status_code == 400